@@ -1,7 +1,11 @@
+import os
 from abc import ABC, abstractmethod
-import vapory as vpr
+from tempfile import mkstemp
 import numpy as np
 
+import instrumentation
+from boundingVolumeHierarchy import BoundingVolumeHierarchy
+
 def rotation_matrix(axis, theta):
 	'''Return the rotation matrix associated with counterclockwise rotation about
 	   the given axis by theta radians.
@@ -17,6 +21,72 @@ def rotation_matrix(axis, theta):
 	                 [2 * (bc - ad), aa + cc - bb - dd, 2 * (cd + ab)],
 	                 [2 * (bd + ac), 2 * (cd - ab), aa + dd - bb - cc]])
 
+def rotation_matrices(axes, thetas):
+	'''Batched version of rotation_matrix(). Takes an (N,3) array of axes (or a single axis)
+	   and an array of N angles, returns an (N,3,3) stack of rotation matrices.
+	'''
+	thetas = np.asarray(thetas, dtype=float)
+	axes = np.broadcast_to(np.asarray(axes, dtype=float), thetas.shape + (3,))
+	axes = axes / np.linalg.norm(axes, axis=-1, keepdims=True)
+	a = np.cos(thetas / 2.0)
+	b, c, d = np.moveaxis(-axes * np.sin(thetas / 2.0)[..., np.newaxis], -1, 0)
+	aa, bb, cc, dd = a * a, b * b, c * c, d * d
+	bc, ad, ac, ab, bd, cd = b * c, a * d, a * c, a * b, b * d, c * d
+	return np.stack([np.stack([aa + bb - cc - dd, 2 * (bc + ad), 2 * (bd - ac)], axis=-1),
+	                 np.stack([2 * (bc - ad), aa + cc - bb - dd, 2 * (cd + ab)], axis=-1),
+	                 np.stack([2 * (bd + ac), 2 * (cd - ab), aa + dd - bb - cc], axis=-1)], axis=-2)
+
+def spherical_to_cartesian(r, theta, phi):
+	'''Converts spherical (ISO) coordinates into Cartesian ones. Works elementwise on arrays.'''
+	return (r*np.sin(theta)*np.cos(phi),
+	        r*np.sin(theta)*np.sin(phi),
+	        r*np.cos(theta))
+
+def scene_rotation_matrices(axes, thetas):
+	'''Returns the rotations that getScene() applies to the shape for the given rotationAxis and rotationAngle,
+	   expressed in the (right-handed) frame of the shape. getScene() rotates the vertices after flipping their
+	   Z axis for POV-Ray, so the rotation is conjugated with the flip. Batched like rotation_matrices().
+	'''
+	flip = np.diag([1., 1., -1.])
+	return flip @ rotation_matrices(axes, thetas) @ flip
+
+def _camera_basis(cameraLocation, cameraTarget, sky=(0., 0., 1.)):
+	'''Returns unit direction, right and up vectors of the camera of getScene() in the frame of the shape.
+	   Works on stacks of cameras along the first axis.
+	'''
+	direction = np.asarray(cameraTarget, dtype=float) - np.asarray(cameraLocation, dtype=float)
+	direction = direction/np.linalg.norm(direction, axis=-1, keepdims=True)
+	right = np.cross(direction, sky)
+	right = right/np.linalg.norm(right, axis=-1, keepdims=True)
+	return direction, right, np.cross(right, direction)
+
+def _image_plane_size(fieldOfView=None):
+	'''Returns the lengths of the right and up vectors of the camera of getScene() for a unit direction vector'''
+	fieldOfView = povrayDefaultFieldOfView if fieldOfView is None else fieldOfView
+	rightLength = 2.*np.tan(fieldOfView/2.)
+	return rightLength, rightLength/1.33 # POV-Ray keeps the up vector of unit length against the right vector of length 1.33
+
+povrayDefaultFieldOfView = 2.*np.arctan(1.33/2.) # horizontal, for POV-Ray's default right vector <1.33,0,0> and direction <0,0,1>
+
+def writeFormattedRows(outfile, rowFormat, array, chunkSize=65536):
+	'''Writes each row of a two-dimensional array to a text file, formatted with the %-style rowFormat.
+	   Rows are formatted in chunks with a single %-operation per chunk, which is much faster than
+	   formatting them one by one, while keeping the memory overhead bounded.
+	'''
+	for start in range(0, len(array), chunkSize):
+		chunk = array[start:start+chunkSize]
+		outfile.write((rowFormat*len(chunk)) % tuple(chunk.ravel().tolist()))
+
+def flattenMassProperties(massProperties):
+	'''Packs the dict returned by AbstractShape.getMassProperties() into a flat array ordered as massPropertiesVars'''
+	return np.concatenate([ [massProperties['volume'], massProperties['area']], massProperties['centroid'],
+	                        np.ravel(massProperties['inertia']), massProperties['principalMoments'], np.ravel(massProperties['principalAxes']) ])
+
+massPropertiesVars = ( ['volume', 'area'] + [ f'centroid_{c}' for c in 'xyz' ] +
+                       [ f'I_{r}{c}' for r in 'xyz' for c in 'xyz' ] +
+                       [ f'principalMoment_{k}' for k in range(3) ] +
+                       [ f'principalAxis{k}_{c}' for k in range(3) for c in 'xyz' ] )
+
 class AbstractShape(ABC):
 	'''Abstract base class for handling shapes'''
 	@abstractmethod
@@ -44,6 +114,22 @@ class AbstractShape(ABC):
 		'''Returns triangles of the shape in form of triples of indices of vertices in the list returned by getUniqueVertices().'''
 		pass
 
+	def getTriangleIndexArray(self):
+		'''Returns the triangles of getTriangleIndices() as an integer array of shape (numTriangles, 3).
+		   Shapes may override this with a faster implementation.
+		'''
+		return np.array(self.getTriangleIndices(), dtype=np.int64).reshape(-1, 3)
+
+	def getUniqueVertexArray(self):
+		'''Returns the vertices of getUniqueVertices() as an array of shape (numVertices, 3). Shapes may override this with a faster implementation.'''
+		return np.array(self.getUniqueVertices(), dtype=float).reshape(-1, 3)
+
+	def getTriangleIndexArrayForUniqueVertices(self):
+		'''Returns the triangles of getTriangleIndicesForUniqueVertices() as an integer array of shape (numTriangles, 3).
+		   Shapes may override this with a faster implementation.
+		'''
+		return np.array(self.getTriangleIndicesForUniqueVertices(), dtype=np.int64).reshape(-1, 3)
+
 	@abstractmethod
 	def getMinAngularFeatureSize(self):
 		pass
@@ -52,49 +138,223 @@ class AbstractShape(ABC):
 	def upscale(self):
 		pass
 
-	def getScene(self, *, cameraLocation=[100,100,50], cameraTarget=[0,0,0], lightLocation=[100,100,100],
-		                    lightColor=[1,1,1], backgroundColor=[0,0,0], objectColor=[0.5,0.5,0.5],
-		                    rotationAxis=None, rotationAngle=None):
-		# POVRay uses a left-handed coordinate system, so we have to flip the Z axis on all geometric vectors
-		cameraLocation[2] = -cameraLocation[2]
-		cameraTarget[2] = -cameraTarget[2]
-		lightLocation[2] = -lightLocation[2]
+	def getMassProperties(self, density=1.):
+		'''Computes global properties of the solid bounded by the (closed, outward oriented) mesh in a single
+		   vectorised pass over the triangles. Every triangle forms a tetrahedron with the origin; volume
+		   integrals are sums of the signed integrals over these tetrahedra. Returns a dict with
+		     volume, area - floats
+		     centroid - centre of mass, shape (3,)
+		     inertia - inertia tensor about the centroid for the given density, shape (3, 3)
+		     principalMoments - eigenvalues of the inertia tensor in ascending order, shape (3,)
+		     principalAxes - corresponding unit eigenvectors as rows, shape (3, 3)
+		   Computations are in float64 regardless of the storage type of the vertices.
+		'''
+		corners = self.getUniqueVertexArray().astype(np.float64)[self.getTriangleIndexArrayForUniqueVertices()]
+		a, b, c = corners[:,0], corners[:,1], corners[:,2]
+		crosses = np.cross(b-a, c-a)
+		area = np.linalg.norm(crosses, axis=-1).sum()/2.
 
-		vertices = self.getUniqueVertices()
-		if rotationAxis and rotationAngle:
-			rotationMatrix = rotation_matrix(rotationAxis, rotationAngle)
-			# Z axis must be flipped in vertex coords as well, before the transform
-			vertexArgs = [ len(vertices) ] + [ list(np.dot(rotationMatrix, np.array([x,y,-z]))) for x,y,z in vertices ]
-		else:
-			vertexArgs = [ len(vertices) ] + [ [x,y,-z] for x,y,z in vertices ] # even if there is no rotation we must flip Z axis
+		tetVolumes = np.einsum('ij,ij->i', a, np.cross(b, c))/6.
+		volume = tetVolumes.sum()
+		sums = a + b + c # the fourth vertex of each tetrahedron is the origin
+		centroid = (tetVolumes[:,np.newaxis]*sums).sum(axis=0)/(4.*volume)
+
+		# second moments: integral of x x^T over a tetrahedron (0,a,b,c) is V/20*(a a^T + b b^T + c c^T + s s^T), s=a+b+c
+		secondMoments = np.einsum('i,ikj,ikl->jl', tetVolumes, corners, corners) + np.einsum('i,ij,il->jl', tetVolumes, sums, sums)
+		secondMoments = secondMoments/20. - volume*np.outer(centroid, centroid)
+		inertia = density*(np.trace(secondMoments)*np.eye(3) - secondMoments)
+
+		principalMoments, principalAxes = np.linalg.eigh(inertia)
+		return { 'volume': float(volume), 'area': float(area), 'centroid': centroid, 'inertia': inertia,
+		         'principalMoments': principalMoments, 'principalAxes': principalAxes.T }
 
-		triangleIndices = self.getTriangleIndicesForUniqueVertices()
-		faceArgs = [ len(triangleIndices) ] + list(map(list, triangleIndices))
+	def saveMassProperties(self, filePath, density=1., massProperties=None):
+		'''Saves the output of getMassProperties() as a single row of the columns listed in massPropertiesVars.
+		   Pass massProperties if they have already been computed.
+		'''
+		if massProperties is None:
+			massProperties = self.getMassProperties(density=density)
+		with open(filePath, 'w') as outFile:
+			outFile.write(f'# Mass properties of the shape for density {density}\n')
+			outFile.write('# ' + ' '.join(massPropertiesVars) + '\n')
+			outFile.write(' '.join(map(repr, flattenMassProperties(massProperties).tolist())) + '\n')
 
+	###### Sensor simulation: ray casting without a renderer #####
+	# Poses follow the conventions of getScene() and getSceneSpherical(): the shape is rotated by rotationAngle
+	# around rotationAxis, the camera at cameraLocation looks at cameraTarget with Z up and the horizontal field
+	# of view of POV-Ray's default camera, so range images line up pixel by pixel with the renders.
+
+	def getBoundingVolumeHierarchy(self):
+		'''Returns a BoundingVolumeHierarchy over the triangles of getTriangleIndices(). Shapes may cache it.'''
+		return BoundingVolumeHierarchy(self)
+
+	def castRays(self, origins, directions, maxDistance=np.inf):
+		'''Casts rays given in the frame of the shape. Returns
+		     ranges - distances from the origins to the first hits, inf for misses
+		     incidenceAngles - angles between the reversed rays and the normals of the hit facets, nan for misses
+		     facetIDs - indices of the hit facets in getTriangleIndices(), -1 for misses
+		'''
+		bvh = self.getBoundingVolumeHierarchy()
+		directions = np.asarray(directions, dtype=np.float64)
+		directions = directions/np.linalg.norm(directions, axis=-1, keepdims=True)
+		ranges, facetIDs, _ = bvh.intersectRays(origins, directions, maxDistance=maxDistance)
+		directions = np.broadcast_to(directions, (len(ranges), 3))
+		incidenceAngles = np.full(len(ranges), np.nan)
+		hits = facetIDs >= 0
+		cosines = -np.einsum('ij,ij->i', directions[hits], bvh.triangleNormals[facetIDs[hits]])
+		incidenceAngles[hits] = np.arccos(np.clip(cosines, -1., 1.))
+		return ranges, incidenceAngles, facetIDs
+
+	def getRangeImage(self, *, cameraLocation=(100,100,50), cameraTarget=(0,0,0), rotationAxis=None, rotationAngle=None,
+	                           width=1024, height=720, fieldOfView=None):
+		'''Simulates a range camera. Returns arrays of shape (height, width) of ranges, incidence angles and facet IDs,
+		   as in castRays(). Row 0 is the top of the image.
+		'''
+		direction, right, up = _camera_basis(cameraLocation, cameraTarget)
+		rightLength, upLength = _image_plane_size(fieldOfView)
+		xs = ((np.arange(width) + 0.5)/width - 0.5)*rightLength
+		ys = (0.5 - (np.arange(height) + 0.5)/height)*upLength
+		directions = direction + xs[np.newaxis,:,np.newaxis]*right + ys[:,np.newaxis,np.newaxis]*up
+		directions = directions.reshape(-1, 3)
+		origin = np.asarray(cameraLocation, dtype=np.float64)
+		if rotationAxis is not None and rotationAngle:
+			# rays are transformed into the frame of the shape instead of rotating the shape
+			rotation = scene_rotation_matrices(rotationAxis, rotationAngle)
+			directions, origin = directions @ rotation, origin @ rotation
+		ranges, incidenceAngles, facetIDs = self.castRays(np.broadcast_to(origin, directions.shape), directions)
+		return ranges.reshape(height, width), incidenceAngles.reshape(height, width), facetIDs.reshape(height, width)
+
+	def getRangeImageSpherical(self, *, cameraR=100., cameraTheta=0., cameraPhi=0., **kwargs):
+		'''getRangeImage() with the camera location in spherical coordinates, as in getSceneSpherical()'''
+		return self.getRangeImage(cameraLocation=list(spherical_to_cartesian(cameraR, cameraTheta, cameraPhi)), **kwargs)
+
+	def getAltimeterTrack(self, cameraLocations, rotationAxes=None, rotationAngles=None, cameraTargets=(0,0,0)):
+		'''Simulates a laser altimeter pointed at cameraTargets for a sequence of N poses, e.g. the fields 'cameraLocation',
+		   'axis' and 'phase' of SpatialStatesIterator.toArray(). Returns arrays of N ranges, incidence angles and facet IDs.
+		'''
+		origins = np.asarray(cameraLocations, dtype=np.float64).reshape(-1, 3)
+		directions = np.broadcast_to(np.asarray(cameraTargets, dtype=np.float64), origins.shape) - origins
+		if rotationAxes is not None and rotationAngles is not None:
+			rotations = scene_rotation_matrices(rotationAxes, np.broadcast_to(rotationAngles, len(origins)))
+			origins = np.einsum('ni,nij->nj', origins, rotations)
+			directions = np.einsum('ni,nij->nj', directions, rotations)
+		return self.castRays(origins, directions)
+
+	def projectVertices(self, states, width, height, cameraTargets=(0,0,0), fieldOfView=None, visibility=False):
+		'''Projects the unique vertices of the shape into the images of the camera of getScene() for an array of S spatial
+		   states (SpatialStatesIterator.toArray(), or the iterator itself), all at once. Returns
+		     pixels - (S, V, 2) array of column and row coordinates; pixel (i, j) spans [i, i+1) x [j, j+1), row 0 at the top
+		     depths - (S, V) distances of the vertices along the view direction, negative behind the camera
+		     visible - (S, V) boolean array telling which vertices are in the image, in front of the camera and not occluded,
+		               tested by casting rays towards them; None unless visibility is set
+		'''
+		if not isinstance(states, np.ndarray):
+			states = states.toArray()
+		# cameras are moved into the frame of the shape instead of rotating the shape
+		rotations = scene_rotation_matrices(states['axis'], states['phase'])
+		toShapeFrame = lambda vs: np.einsum('si,sij->sj', np.broadcast_to(np.asarray(vs, dtype=np.float64), (len(states), 3)), rotations)
+		cameraLocations = toShapeFrame(states['cameraLocation'])
+		direction, right, up = _camera_basis(cameraLocations, toShapeFrame(cameraTargets), sky=toShapeFrame([0., 0., 1.]))
+		rightLength, upLength = _image_plane_size(fieldOfView)
+
+		offsets = self.getUniqueVertexArray().astype(np.float64)[np.newaxis] - cameraLocations[:,np.newaxis]
+		depths = np.einsum('svi,si->sv', offsets, direction)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			columns = (np.einsum('svi,si->sv', offsets, right)/(depths*rightLength) + 0.5)*width
+			rows = (0.5 - np.einsum('svi,si->sv', offsets, up)/(depths*upLength))*height
+		pixels = np.stack([ columns, rows ], axis=-1)
+		if not visibility:
+			return pixels, depths, None
+
+		visible = (depths > 0.) & (columns >= 0.) & (columns < width) & (rows >= 0.) & (rows < height)
+		stateIDs, vertexIDs = np.nonzero(visible)
+		rays = offsets[stateIDs, vertexIDs]
+		ranges, _, _ = self.castRays(cameraLocations[stateIDs], rays)
+		visible[stateIDs, vertexIDs] = ranges >= (1. - 1e-6)*np.linalg.norm(rays, axis=-1) # the ray to a visible vertex first hits the vertex itself
+		return pixels, depths, visible
+
+	def getImageLabels(self, states, width, height, masks=False, cameraTargets=(0,0,0), fieldOfView=None):
+		'''Returns 2D ground truth for the images of an array of S spatial states (see projectVertices()) as a dict of
+		     keypoints - (S, V, 2) pixel coordinates of the unique vertices
+		     visible - (S, V) visibility flags of the vertices
+		     boundingBoxes - (S, 4) column and row ranges (minColumn, minRow, maxColumn, maxRow) of the projected shape,
+		                     clipped to the image; the projection of a mesh is bounded by the projections of its vertices
+		     masks - (S, height, width) silhouettes, by casting one ray per pixel (only if masks is set)
+		   All states must have the shape in front of the camera.
+		'''
+		if not isinstance(states, np.ndarray):
+			states = states.toArray()
+		pixels, _, visible = self.projectVertices(states, width, height, cameraTargets=cameraTargets, fieldOfView=fieldOfView, visibility=True)
+		boundingBoxes = np.concatenate([ pixels.min(axis=1), pixels.max(axis=1) ], axis=-1)
+		labels = { 'keypoints': pixels,
+		           'visible': visible,
+		           'boundingBoxes': np.clip(boundingBoxes, 0., [ width, height, width, height ]) }
+		if masks:
+			targets = np.broadcast_to(np.asarray(cameraTargets, dtype=np.float64), (len(states), 3))
+			labels['masks'] = np.stack([ self.getRangeImage(cameraLocation=state['cameraLocation'], cameraTarget=target,
+			                                                rotationAxis=state['axis'], rotationAngle=state['phase'],
+			                                                width=width, height=height, fieldOfView=fieldOfView)[2] >= 0
+			                             for state, target in zip(states, targets) ])
+		return labels
+
+	def getPixelsPerUnitLength(self, depth, width, fieldOfView=None):
+		'''Returns the number of pixels onto which a unit length segment perpendicular to the view direction at the given
+		   depth is projected by a perspective camera with horizontal fieldOfView (default: the one of getScene()) and
+		   an image width pixels wide.
+		'''
+		if depth <= 0:
+			return np.inf
+		fieldOfView = povrayDefaultFieldOfView if fieldOfView is None else fieldOfView
+		return width/(2.*depth*np.tan(fieldOfView/2.))
+
+	def getLevelOfDetailFor(self, cameraDistance, width, maxEdgePixels=1., fieldOfView=None):
+		'''Returns a version of the shape with as few vertices as possible, such that mesh edges of the shape viewed from
+		   cameraDistance (measured from the origin) are projected onto at most maxEdgePixels pixels. Shapes that
+		   support levels of detail override this; the default implementation returns the shape itself.
+		'''
+		return self
+
+	def getSceneMesh(self):
+		'''Returns the arrays from which getScene() builds the mesh: unique vertices (float64, shape (N, 3)), unit vertex
+		   normals (N, 3) and triangles on unique vertices (M, 3). Each normal is the sum of the unit normals of the
+		   triangles at the vertex, weighted by half the dot product of their two edges leaving the first corner.
+		   Shapes may cache the arrays, so they must not be modified.
+		'''
+		vertices = self.getUniqueVertexArray().astype(np.float64)
+		triangles = self.getTriangleIndexArrayForUniqueVertices()
+		edges1 = vertices[triangles[:,1]] - vertices[triangles[:,0]]
+		edges2 = vertices[triangles[:,2]] - vertices[triangles[:,0]]
+		triangleNormales = np.cross(edges1, edges2)
+		triangleNormales /= np.linalg.norm(triangleNormales, axis=-1, keepdims=True)
+		weightedNormales = triangleNormales*(np.einsum('ij,ij->i', edges1, edges2)/2)[:,np.newaxis]
 		normales = np.zeros((len(vertices), 3))
-		npvertices = np.array(vertices)
-		for v0, v1, v2 in triangleIndices:
-			triangleNormale = np.cross(npvertices[v1,:]-npvertices[v0,:], npvertices[v2,:]-npvertices[v0,:])
-			triangleNormale /= np.linalg.norm(triangleNormale)
-			triangleArea = np.dot(npvertices[v1,:]-npvertices[v0,:], npvertices[v2,:]-npvertices[v0,:])/2
-			normales[v0,:] += triangleNormale*triangleArea
-			normales[v1,:] += triangleNormale*triangleArea
-			normales[v2,:] += triangleNormale*triangleArea
+		for k in range(3):
+			np.add.at(normales, triangles[:,k], weightedNormales)
 		normales /= np.linalg.norm(normales, axis=1, keepdims=True)
+		return vertices, normales, triangles
 
-#		for i in range(len(vertices)):
-#			print(f'Vertex {vertices[i]} has normale {normales[i]} (product {np.dot(vertices[i], normales[i])})')
-#			print(f'{np.dot(vertices[i], normales[i])}')
+	def getScene(self, *, cameraLocation=(100,100,50), cameraTarget=(0,0,0), lightLocation=(100,100,100),
+		                    lightColor=(1,1,1), backgroundColor=(0,0,0), objectColor=(0.5,0.5,0.5),
+		                    rotationAxis=None, rotationAngle=None):
+		'''Builds the POV-Ray scene of the shape. The arguments are not modified and every call builds a scene of its own,
+		   so scenes of the same shape can be made from several threads at once.
+		'''
+		import vapory as vpr # imported here so that the rest of the shape handling code works without the renderer
 
-		if rotationAxis and rotationAngle:
-			rotationMatrix = rotation_matrix(rotationAxis, rotationAngle)
-			# Z axis must be flipped in vertex coords as well, before the transform
-			normaleArgs = [ len(vertices) ] + [ list(np.dot(rotationMatrix, np.array([x,y,-z]))) for x,y,z in [ normales[i,:] for i in range(len(vertices)) ] ]
-		else:
-			# even if there is no rotation we must flip Z axis
-			normaleArgs = [ len(vertices) ] + [ [x,y,-z] for x,y,z in [ normales[i,:] for i in range(len(vertices)) ] ]
+		# POVRay uses a left-handed coordinate system, so we have to flip the Z axis on all geometric vectors
+		flipZ = np.array([1., 1., -1.])
+		cameraLocation, cameraTarget, lightLocation = ( (np.asarray(vector, dtype=float)*flipZ).tolist()
+		                                                for vector in (cameraLocation, cameraTarget, lightLocation) )
 
-#		print('Rendering with camera at {} and light at {}'.format(str(cameraLocation), str(lightLocation)))
+		vertices, normales, triangleIndices = self.getSceneMesh()
+		# Z axis must be flipped in vertex coords as well, before the transform
+		vertices, normales = vertices*flipZ, normales*flipZ
+		if rotationAxis is not None and rotationAngle:
+			rotationMatrix = rotation_matrix(rotationAxis, rotationAngle)
+			vertices, normales = vertices @ rotationMatrix.T, normales @ rotationMatrix.T
+		vertexArgs = [ len(vertices) ] + vertices.tolist()
+		normaleArgs = [ len(normales) ] + normales.tolist()
+		faceArgs = [ len(triangleIndices) ] + triangleIndices.tolist()
 
 		asteroid = vpr.Mesh2(vpr.VertexVectors(*vertexArgs),
 		                     vpr.NormalVectors(*normaleArgs),
@@ -108,8 +368,8 @@ class AbstractShape(ABC):
 #		                     vpr.Texture(vpr.Pigment('color', objectColor)))
 
 		return vpr.Scene( vpr.Camera('location', cameraLocation, 'look_at', cameraTarget, 'sky', [0,0,-1]),
-		                  objects = [ vpr.LightSource(lightLocation, 'color', lightColor),
-		                              vpr.Background('color', backgroundColor),
+		                  objects = [ vpr.LightSource(lightLocation, 'color', list(lightColor)),
+		                              vpr.Background('color', list(backgroundColor)),
 		                              asteroid
 		                  ],
 		                  included = ["colors.inc", "textures.inc"]
@@ -122,19 +382,30 @@ class AbstractShape(ABC):
 	                               lightColor=(1,1,1), backgroundColor=(0,0,0), objectColor=(0.5,0.5,0.5),
 	                               rotationAxis=None, rotationAngle=None):
 		'''Assumptions: R\in[0,\infty), Theta\in[0,\pi), Phi\in[0,2\pi)'''
-		def sphericalToCartesian(r, t, p):
-			return (r*np.sin(t)*np.cos(p),
-			        r*np.sin(t)*np.sin(p),
-			        r*np.cos(t))
 #		print('From scene generating func: got the camera coords {}'.format((cameraR, cameraTheta, cameraPhi)))
-		cameraLocation = sphericalToCartesian(cameraR, cameraTheta, cameraPhi)
+		cameraLocation = spherical_to_cartesian(cameraR, cameraTheta, cameraPhi)
 #		print('From scene generating func: converted to cartesian, got {}'.format(cameraLocation))
-		lightLocation = sphericalToCartesian(lightR, lightTheta, lightPhi)
+		lightLocation = spherical_to_cartesian(lightR, lightTheta, lightPhi)
 		return self.getScene(cameraLocation=list(cameraLocation), lightLocation=list(lightLocation),
 		                      lightColor=list(lightColor), backgroundColor=list(backgroundColor), objectColor=list(objectColor),
 		                      rotationAxis=rotationAxis, rotationAngle=rotationAngle)
 
-	def renderScene(self, scene, outfile, output_format, width, height, antialiasing, tempfile):
+	def renderScene(self, scene, outfile, output_format, width, height, antialiasing, tempfile=None):
+		'''Renders a scene of getScene() with POV-Ray. The scene is written to tempfile, by default to a new temporary
+		   file for every call, so that concurrent renders do not overwrite each other's scene files.
+		'''
+		with instrumentation.stage('shape.renderScene', width=width, height=height, format=output_format):
+			if tempfile is not None:
+				return self._renderScene(scene, outfile, output_format, width, height, antialiasing, tempfile)
+			fd, tempfile = mkstemp(prefix='__temp__', suffix='.pov')
+			os.close(fd)
+			try:
+				return self._renderScene(scene, outfile, output_format, width, height, antialiasing, tempfile)
+			finally:
+				if os.path.exists(tempfile):
+					os.remove(tempfile)
+
+	def _renderScene(self, scene, outfile, output_format, width, height, antialiasing, tempfile):
 		remove_temp = True
 		if output_format == 'png':
 			scene.render(outfile, width=width, height=height, antialiasing=antialiasing, tempfile=tempfile, remove_temp=remove_temp, output_ppm=False)
@@ -147,18 +418,71 @@ class AbstractShape(ABC):
 		else:
 			raise ValueError(f'Unrecognized format {output_format}')
 
-	def renderSceneSpherical(self, outfile, width=1024, height=720, antialiasing=0.01, output_format='png', tempfile='__temp__.pov', **kwargs):
-		scene = self.getSceneSpherical(**kwargs)
-		self.renderScene(scene, outfile, output_format, width, height, antialiasing, tempfile)
+	def renderSceneSpherical(self, outfile, width=1024, height=720, antialiasing=0.01, output_format='png', tempfile=None, maxEdgePixels=1., **kwargs):
+		'''Renders the scene of getSceneSpherical(). Unless maxEdgePixels is None, the coarsest level of detail
+		   with mesh edges no longer than maxEdgePixels pixels is rendered (see getLevelOfDetailFor()).
+		'''
+		shape = self if maxEdgePixels is None else self.getLevelOfDetailFor(kwargs.get('cameraR', 100.), width, maxEdgePixels=maxEdgePixels)
+		with instrumentation.stage('shape.getScene', shape=shape):
+			scene = shape.getSceneSpherical(**kwargs)
+		return self.renderScene(scene, outfile, output_format, width, height, antialiasing, tempfile)
 
-	def renderSceneCartesian(self, outfile, width=1024, height=720, antialiasing=0.01, output_format='png', tempfile='__temp__.pov', **kwargs):
-		scene = self.getScene(**kwargs)
-		self.renderScene(scene, outfile, output_format, width, height, antialiasing, tempfile)
+	def renderSceneCartesian(self, outfile, width=1024, height=720, antialiasing=0.01, output_format='png', tempfile=None, maxEdgePixels=1., **kwargs):
+		'''Renders the scene of getScene(). Level of detail is chosen as in renderSceneSpherical().'''
+		cameraDistance = np.linalg.norm(np.asarray(kwargs.get('cameraLocation', (100,100,50)), dtype=float))
+		shape = self if maxEdgePixels is None else self.getLevelOfDetailFor(cameraDistance, width, maxEdgePixels=maxEdgePixels)
+		with instrumentation.stage('shape.getScene', shape=shape):
+			scene = shape.getScene(**kwargs)
+		return self.renderScene(scene, outfile, output_format, width, height, antialiasing, tempfile)
 
 	def writeOBJ(self, objFileName):
 		'''Exports the shape in Wavefront .OBJ format'''
+		vertices = self.getUniqueVertexArray()
+		triangles = self.getTriangleIndexArrayForUniqueVertices()
+		# %r formats Python floats exactly like str.format() does
 		with open(objFileName, 'w') as oof:
-			for x,y,z in self.getUniqueVertices():
-				oof.write('v {} {} {}\n'.format(x,y,z))
-			for v1,v2,v3 in self.getTriangleIndicesForUniqueVertices():
-				oof.write('f {} {} {}\n'.format(v1+1,v2+1,v3+1))
+			writeFormattedRows(oof, 'v %r %r %r\n', vertices)
+			writeFormattedRows(oof, 'f %d %d %d\n', triangles+1)
+
+	def writePLY(self, plyFileName, dtype=np.float32):
+		'''Exports the shape in binary little endian .PLY format. Vertex coordinates are stored with the given dtype
+		   (float32 or float64), vertex indices as int32.
+		'''
+		vertices = np.ascontiguousarray(self.getUniqueVertexArray(), dtype=np.dtype(dtype).newbyteorder('<'))
+		triangles = self.getTriangleIndexArrayForUniqueVertices()
+		plyType = { 4: 'float', 8: 'double' }[vertices.dtype.itemsize]
+
+		faceRecords = np.empty(len(triangles), dtype=[('count', 'u1'), ('indices', '<i4', (3,))])
+		faceRecords['count'] = 3
+		faceRecords['indices'] = triangles
+
+		header = ('ply\n'
+		          'format binary_little_endian 1.0\n'
+		          f'element vertex {len(vertices)}\n'
+		          f'property {plyType} x\n'
+		          f'property {plyType} y\n'
+		          f'property {plyType} z\n'
+		          f'element face {len(triangles)}\n'
+		          'property list uchar int vertex_indices\n'
+		          'end_header\n')
+		with open(plyFileName, 'wb') as pof:
+			pof.write(header.encode('ascii'))
+			pof.write(vertices.tobytes())
+			pof.write(faceRecords.tobytes())
+
+	def writeSTL(self, stlFileName):
+		'''Exports the shape in binary .STL format'''
+		vertices = self.getUniqueVertexArray()
+		triangleVertices = vertices[self.getTriangleIndexArrayForUniqueVertices()]
+		normals = np.cross(triangleVertices[:,1,:]-triangleVertices[:,0,:], triangleVertices[:,2,:]-triangleVertices[:,0,:])
+		norms = np.linalg.norm(normals, axis=1, keepdims=True)
+		normals = np.divide(normals, norms, out=np.zeros_like(normals), where=norms>0)
+
+		facetRecords = np.zeros(len(triangleVertices), dtype=[('normal', '<f4', (3,)), ('vertices', '<f4', (3,3)), ('attributes', '<u2')])
+		facetRecords['normal'] = normals
+		facetRecords['vertices'] = triangleVertices
+
+		with open(stlFileName, 'wb') as sof:
+			sof.write(b'Binary STL written by icqhandler'.ljust(80, b' '))
+			sof.write(np.array([len(facetRecords)], dtype='<u4').tobytes())
+			sof.write(facetRecords.tobytes())
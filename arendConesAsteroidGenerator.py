@@ -1,7 +1,6 @@
-from pathlib import Path
 import numpy as np
 
-import icq, sculptor
+import icq, sculptor, instrumentation
 
 class ArendConesAsteroidGenerator:
 	''' A class for sampling synthetic asteroid shapes using Arend's
@@ -30,28 +29,33 @@ class ArendConesAsteroidGenerator:
 	             numCones = 200,
 	             radiusRange = [0.4, 1], # assuming a unit sphere. WARNING: avoid zero radii
 	             magnitudesRange = [-0.33, 0.33],
-	             magnitudesDecay = None): # the default is linear decay to 1/numCones if numCones>0 else 0
+	             magnitudesDecay = None, # the default is linear decay to 1/numCones if numCones>0 else 0
+	             dtype = np.float64): # floating point type used to store the vertices of the shapes
 		self.baseRadius = baseRadius
 		self.baseResolution = baseResolution
 		self.numCones = numCones
 		self.radiusRange = radiusRange
 		self.magnitudesRange = magnitudesRange
 		self.magnitudesDecay = magnitudesDecay if magnitudesDecay else (0 if numCones==0 else 1/numCones) # leaves 1/numCones for the last cone
+		self.dtype = dtype
 		self.shapeDescriptionTitle = 'Overall asteroid shape produced by sequentially applying Arend cones with fillets'
 
 	def sampleAnAsteroid(self):
-		cubeicqpath = Path.home() / 'icqhandler' / 'shapes' / 'cube1.icq'
-		ish = icq.ICQShape()
-		ish.readICQ(cubeicqpath)
+		with instrumentation.stage('arendCones.baseShape') as st:
+			cubeicqpath = icq.shapesDir / 'cube1.icq'
+			ish = icq.ICQShape(dtype=self.dtype)
+			ish.readICQ(cubeicqpath)
 
-		scu = sculptor.Sculptor(ish)
-		for _ in range(self.baseResolution):
-			scu.upscaleShape()
+			scu = sculptor.Sculptor(ish)
+			for _ in range(self.baseResolution):
+				scu.upscaleShape()
+			st.set(shape=ish)
 
-		thetas, phis = self.sampleDirections(size=self.numCones)
-		radii = self.radiusRange[0] + (self.radiusRange[1]-self.radiusRange[0])*np.random.random(size=self.numCones)
-		magnitudes = self.magnitudesRange[0] + (self.magnitudesRange[1]-self.magnitudesRange[0])*np.random.random(size=self.numCones)
-		magnitudes *= np.linspace(1., 1.-self.magnitudesDecay*(self.numCones-1), num=self.numCones)
+		with instrumentation.stage('arendCones.sampleCones', cones=self.numCones):
+			thetas, phis = self.sampleDirections(size=self.numCones)
+			radii = self.radiusRange[0] + (self.radiusRange[1]-self.radiusRange[0])*np.random.random(size=self.numCones)
+			magnitudes = self.magnitudesRange[0] + (self.magnitudesRange[1]-self.magnitudesRange[0])*np.random.random(size=self.numCones)
+			magnitudes *= np.linspace(1., 1.-self.magnitudesDecay*(self.numCones-1), num=self.numCones)
 
 		scu.shapeWithArendCones(thetas, phis, radii, magnitudes, baseRadius=self.baseRadius, coneType='linearWithFillet')
 
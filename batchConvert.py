@@ -0,0 +1,129 @@
+''' A module for converting and validating whole libraries of shapes in ICQ
+    format.
+
+    Input files are given as files, directories (searched recursively for
+    *.icq files) or glob patterns. Each file is read, validated and
+    optionally converted into one of the output formats:
+
+      obj - Wavefront OBJ (AbstractShape.writeOBJ)
+      ply - binary little endian PLY (AbstractShape.writePLY)
+      stl - binary STL (AbstractShape.writeSTL)
+      icqb - binary ICQ, a .npy vertex array (ICQShape.writeICQBinary)
+      none - validation only
+
+    Files are processed by a pool of worker processes, so the cost of
+    importing NumPy and the shape modules is paid once per worker rather than
+    once per file. A summary table with one line per file (Q, number of unique
+    vertices, validity, maximum deviation between records of redundant
+    vertices and processing status, with the message of the exception if a
+    file failed) is returned and can be saved as a whitespace separated file.
+    Fields containing whitespace or quotes, such as paths with spaces, are
+    written in double quotes with JSON escapes.
+'''
+
+import os
+import json
+import glob
+from pathlib import Path
+from multiprocessing import Pool
+
+import icq
+
+outputExtensions = { 'obj': '.obj', 'ply': '.ply', 'stl': '.stl', 'icqb': '.icqb.npy', 'none': None }
+
+summaryColumns = [ 'file', 'q', 'numVertices', 'valid', 'maxDeviation', 'status' ]
+
+def findICQFiles(patterns):
+	'''Expands a list of files, directories and glob patterns into a sorted list of unique ICQ file paths'''
+	files = set()
+	for pattern in patterns:
+		if os.path.isdir(pattern):
+			files.update(glob.glob(os.path.join(pattern, '**', '*.icq'), recursive=True))
+		elif glob.has_magic(pattern):
+			files.update(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+		elif os.path.isfile(pattern):
+			files.add(pattern)
+		else:
+			raise FileNotFoundError(f'No such file, directory or matching pattern: {pattern}')
+	return sorted(files)
+
+def getOutputPath(icqFileName, outputFormat, outputDir=None, inputRoot=None):
+	'''Returns the path of the converted file: next to the input by default, or at the same
+	   path relative to outputDir as the input has relative to inputRoot
+	'''
+	extension = outputExtensions[outputFormat]
+	if extension is None:
+		return None
+	icqPath = Path(icqFileName)
+	outPath = icqPath.with_name(icqPath.stem + extension)
+	if outputDir is not None:
+		relPath = outPath.relative_to(inputRoot) if inputRoot is not None else Path(outPath.name)
+		outPath = Path(outputDir) / relPath
+	return outPath
+
+def convertFile(icqFileName, outputFormat='obj', outputPath=None):
+	'''Reads, validates and converts a single file. Returns its row of the summary table as a dict.'''
+	row = { 'file': str(icqFileName), 'q': None, 'numVertices': None, 'valid': None, 'maxDeviation': None, 'status': 'ok' }
+	try:
+		ish = icq.ICQShape()
+		ish.readICQ(icqFileName)
+		row['q'] = ish.q
+		row['numVertices'] = len(ish.getUniqueIndexArrays()[0])
+		row['valid'] = ish.validate(exceptionIfInvalid=False)
+		row['maxDeviation'] = ish.getMaxRedundantVertexDeviation()
+
+		if outputPath is not None:
+			Path(outputPath).parent.mkdir(parents=True, exist_ok=True)
+			if outputFormat == 'obj':
+				ish.writeOBJ(outputPath)
+			elif outputFormat == 'ply':
+				ish.writePLY(outputPath)
+			elif outputFormat == 'stl':
+				ish.writeSTL(outputPath)
+			elif outputFormat == 'icqb':
+				ish.writeICQBinary(outputPath)
+			else:
+				raise ValueError(f'Unrecognized output format {outputFormat}')
+	except Exception as e:
+		row['status'] = f'error:{type(e).__name__}: {e}'
+	return row
+
+def _convertFileStar(args):
+	return convertFile(*args)
+
+def batchConvert(patterns, outputFormat='obj', outputDir=None, processes=None, chunksize=None):
+	'''Converts and validates all ICQ files matching the patterns. Returns the summary table as a list of dicts,
+	   in the order of findICQFiles().
+	'''
+	if outputFormat not in outputExtensions:
+		raise ValueError(f'Unrecognized output format {outputFormat}')
+	files = findICQFiles(patterns)
+	if not files:
+		return []
+	inputRoot = os.path.commonpath([ os.path.dirname(os.path.abspath(f)) for f in files ]) if outputDir is not None else None
+	tasks = [ (f, outputFormat, getOutputPath(os.path.abspath(f) if outputDir is not None else f, outputFormat, outputDir=outputDir, inputRoot=inputRoot))
+	          for f in files ]
+	processes = min(os.cpu_count() if processes is None else processes, len(tasks))
+	if processes <= 1:
+		return list(map(_convertFileStar, tasks))
+	with Pool(processes) as pool:
+		return pool.map(_convertFileStar, tasks, chunksize=chunksize)
+
+def formatField(value):
+	'''Formats a value as one field of a whitespace separated table, quoting strings that contain whitespace or quotes'''
+	if value is None:
+		return '-'
+	if isinstance(value, float):
+		return f'{value:.6g}'
+	value = str(value)
+	if not value or '"' in value or any(c.isspace() for c in value):
+		return json.dumps(value)
+	return value
+
+def formatSummary(rows):
+	'''Returns the summary table as a list of lines, header first'''
+	return [ '# ' + ' '.join(summaryColumns) ] + [ ' '.join(formatField(row[col]) for col in summaryColumns) for row in rows ]
+
+def saveSummary(rows, filename):
+	with open(filename, 'w') as outfile:
+		outfile.write('\n'.join(formatSummary(rows)) + '\n')
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+''' Times the hot paths of the ICQ, sculpting and rendering code and
+    compares runs with each other.
+
+    Benchmarks (see `benchmarks` below) run over a grid of resolutions Q
+    and, for the sculpting ones, of cone counts and spherical harmonic
+    degrees. Each case runs in a fresh process, so that module level caches
+    of one case do not affect the others: the first repetition is reported
+    separately as the cold time, the minimum and the median over all
+    repetitions as the warm times. Peak memory of one extra, untimed
+    repetition is measured with tracemalloc, which accounts for NumPy
+    arrays. Shapes are made as in ArendConesAsteroidGenerator, from the unit
+    cube densified to Q and rolled into a ball, outside of the timed region.
+    getScene needs vapory and is reported as skipped without it; any other
+    failure of a case, including a missing module, is reported as an error
+    and makes the run exit with status 1.
+
+    Results are saved as JSON together with the versions of Python and
+    NumPy and the git commit of the tree. Comparison mode matches the cases
+    of two result files and flags the ones whose minimum time or peak memory
+    grew by more than the threshold, as well as the ones that were measured
+    in the old run but are missing or failed in the new one; it exits with
+    status 1 if there are any.
+
+    Usage: hotPathsBenchmark.py run [-o results.json] [-q Q ...] [--repeats N] [--only NAME ...]
+           hotPathsBenchmark.py compare old.json new.json [--threshold 0.1]
+'''
+
+qs = [32, 64, 128]
+coneCounts = [10, 50]
+harmonicDegrees = [4, 16]
+repeats = 5
+randomSeed = 42
+
+import os
+import sys
+import json
+import argparse
+import platform
+import subprocess
+
+packageDir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, packageDir) # also for the processes running single cases
+
+def makeBall(q):
+	import icq, sculptor
+	ish = icq.ICQShape()
+	ish.readICQ(icq.shapesDir / 'cube1.icq')
+	scu = sculptor.Sculptor(ish)
+	while ish.q < q:
+		scu.upscaleShape()
+	scu.rollIntoABall(radius=15.)
+	return ish, scu
+
+# Every benchmark maps (q, param, tmpdir) to a function taking no arguments that is timed. The setup done before
+# returning it is not timed; the function must do the same work on every call.
+
+def _readICQ(q, param, tmpdir):
+	import icq
+	ish, _ = makeBall(q)
+	icqFileName = os.path.join(tmpdir, 'shape.icq')
+	ish.writeICQ(icqFileName)
+	return lambda: icq.ICQShape().readICQ(icqFileName)
+
+def _writeICQ(q, param, tmpdir):
+	ish, _ = makeBall(q)
+	return lambda: ish.writeICQ(os.path.join(tmpdir, 'shape.icq'))
+
+def _densifyTwofold(q, param, tmpdir):
+	ish, _ = makeBall(q)
+	vertices = ish.getVertexArray().copy()
+	def run():
+		ish.setVertexArray(vertices)
+		ish.densifyTwofold()
+	return run
+
+def _validate(q, param, tmpdir):
+	ish, _ = makeBall(q)
+	return lambda: ish.validate()
+
+def _getMinAngularFeatureSize(q, param, tmpdir):
+	ish, _ = makeBall(q)
+	def run():
+		ish.invalidateCaches()
+		ish.getMinAngularFeatureSize()
+	return run
+
+def _shapeWithArendCones(q, numCones, tmpdir):
+	import numpy as np
+	ish, scu = makeBall(q)
+	vertices = ish.getVertexArray().copy()
+	np.random.seed(randomSeed)
+	thetas = np.arccos(2.*np.random.random(size=numCones)-1.)
+	phis = 2.*np.pi*np.random.random(size=numCones)
+	radii = 0.4 + 0.6*np.random.random(size=numCones)
+	magnitudes = -0.33 + 0.66*np.random.random(size=numCones)
+	def run():
+		ish.setVertexArray(vertices)
+		scu.shapeWithArendCones(thetas, phis, radii, magnitudes, baseRadius=15., coneType='linearWithFillet')
+	return run
+
+def _perturbWithSphericalHarmonic(q, degree, tmpdir):
+	ish, scu = makeBall(q)
+	vertices = ish.getVertexArray().copy()
+	def run():
+		ish.setVertexArray(vertices)
+		scu.perturbWithSphericalHarmonic(3., degree//2, degree, adaptiveUpscale=False)
+	return run
+
+class SkipBenchmark(Exception):
+	'''Raised by the setup of a benchmark whose optional dependencies are not available'''
+
+def _getScene(q, param, tmpdir):
+	try:
+		import vapory # the scene cannot be built without it
+	except ImportError as e:
+		raise SkipBenchmark(str(e))
+	if not hasattr(vapory, 'Scene'): # an empty checkout of the submodule imports as a namespace package
+		raise SkipBenchmark('vapory is not installed')
+	ish, _ = makeBall(q)
+	return lambda: ish.getScene(cameraLocation=[100,100,50], cameraTarget=[0,0,0], lightLocation=[100,100,100], rotationAxis=(0.,0.,1.), rotationAngle=0.5)
+
+def _writeOBJ(q, param, tmpdir):
+	ish, _ = makeBall(q)
+	return lambda: ish.writeOBJ(os.path.join(tmpdir, 'shape.obj'))
+
+benchmarks = { 'readICQ': (_readICQ, None),
+               'writeICQ': (_writeICQ, None),
+               'densifyTwofold': (_densifyTwofold, None),
+               'validate': (_validate, None),
+               'getMinAngularFeatureSize': (_getMinAngularFeatureSize, None),
+               'shapeWithArendCones': (_shapeWithArendCones, coneCounts),
+               'perturbWithSphericalHarmonic': (_perturbWithSphericalHarmonic, harmonicDegrees),
+               'getScene': (_getScene, None),
+               'writeOBJ': (_writeOBJ, None) }
+
+def runOne(name, q, param, numRepeats):
+	import time
+	import tempfile
+	import tracemalloc
+	result = { 'benchmark': name, 'q': q, 'param': param, 'status': 'ok' }
+	with tempfile.TemporaryDirectory() as tmpdir:
+		try:
+			run = benchmarks[name][0](q, param, tmpdir)
+		except SkipBenchmark as e:
+			result['status'] = f'skipped: {e}'
+			return result
+		times = []
+		for _ in range(numRepeats):
+			start = time.perf_counter()
+			run()
+			times.append(time.perf_counter() - start)
+		tracemalloc.start()
+		run()
+		_, peakMemory = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+	result.update({ 'coldTime': times[0], 'minTime': min(times), 'medianTime': sorted(times)[len(times)//2], 'times': times, 'peakMemoryBytes': peakMemory })
+	return result
+
+def getMetadata():
+	import time
+	import numpy as np
+	try:
+		commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=packageDir, capture_output=True, text=True, check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		commit = None
+	return { 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+	         'platform': platform.platform(), 'cpus': os.cpu_count() }
+
+def runAll(names, qs, numRepeats):
+	results = []
+	print('# benchmark q param coldSeconds minSeconds medianSeconds peakMB')
+	for name in names:
+		for q in qs:
+			for param in (benchmarks[name][1] or [None]):
+				proc = subprocess.run([sys.executable, __file__, '--single', name, str(q), json.dumps(param), str(numRepeats)],
+				                      capture_output=True, text=True)
+				if proc.returncode == 0:
+					res = json.loads(proc.stdout.splitlines()[-1])
+				else:
+					error = (proc.stderr.strip().splitlines() or ['no output'])[-1]
+					res = { 'benchmark': name, 'q': q, 'param': param, 'status': f'error: {error}' }
+				results.append(res)
+				if res['status'] == 'ok':
+					print(f'{name} {q} {param} {res["coldTime"]:.4f} {res["minTime"]:.4f} {res["medianTime"]:.4f} {res["peakMemoryBytes"]/2**20:.1f}', flush=True)
+				else:
+					print(f'{name} {q} {param} {res["status"]}', flush=True)
+	return results
+
+def compare(oldResults, newResults, threshold):
+	'''Prints the ratios new/old of the minimum times and peak memory of the cases measured in both runs, and the cases
+	   measured in the old run that are missing or not ok in the new one. Returns the number of regressions, counting
+	   the latter.
+	'''
+	key = lambda res: (res['benchmark'], res['q'], res['param'])
+	old = { key(res): res for res in oldResults if res['status'] == 'ok' }
+	new = { key(res): res for res in newResults }
+	numRegressions = 0
+	print('# benchmark q param oldMinSeconds newMinSeconds timeRatio memoryRatio flag')
+	for res in newResults:
+		if res['status'] != 'ok' or key(res) not in old:
+			continue
+		timeRatio = res['minTime']/old[key(res)]['minTime']
+		memoryRatio = res['peakMemoryBytes']/max(old[key(res)]['peakMemoryBytes'], 1)
+		if timeRatio > 1. + threshold or memoryRatio > 1. + threshold:
+			flag = 'REGRESSION'
+			numRegressions += 1
+		elif timeRatio < 1. - threshold:
+			flag = 'improved'
+		else:
+			flag = ''
+		print(f'{res["benchmark"]} {res["q"]} {res["param"]} {old[key(res)]["minTime"]:.4f} {res["minTime"]:.4f} {timeRatio:.3f} {memoryRatio:.3f} {flag}'.rstrip())
+	for caseKey, res in old.items():
+		status = new[caseKey]['status'] if caseKey in new else 'missing'
+		if status != 'ok':
+			print(f'{res["benchmark"]} {res["q"]} {res["param"]} {res["minTime"]:.4f} - - - REGRESSION ({status})')
+			numRegressions += 1
+	return numRegressions
+
+if __name__=='__main__':
+	if len(sys.argv) > 1 and sys.argv[1] == '--single':
+		print(json.dumps(runOne(sys.argv[2], int(sys.argv[3]), json.loads(sys.argv[4]), int(sys.argv[5]))))
+		sys.exit(0)
+
+	parser = argparse.ArgumentParser(description='Benchmarks of the ICQ, sculpting and rendering hot paths')
+	subparsers = parser.add_subparsers(dest='command', required=True)
+	runParser = subparsers.add_parser('run', help='run the benchmarks and save the results as JSON')
+	runParser.add_argument('-o', '--output', type=str, default='benchmark_results.json')
+	runParser.add_argument('-q', nargs='+', type=int, default=qs, help=f'resolutions (default: {" ".join(map(str, qs))})')
+	runParser.add_argument('--repeats', type=int, default=repeats)
+	runParser.add_argument('--only', nargs='+', choices=list(benchmarks), default=list(benchmarks), help='benchmarks to run (default: all)')
+	compareParser = subparsers.add_parser('compare', help='compare two result files and flag regressions')
+	compareParser.add_argument('old', type=str)
+	compareParser.add_argument('new', type=str)
+	compareParser.add_argument('--threshold', type=float, default=0.1, help='relative growth of time or memory flagged as a regression (default: 0.1)')
+	cliArgs = parser.parse_args()
+
+	if cliArgs.command == 'run':
+		results = runAll(cliArgs.only, cliArgs.q, cliArgs.repeats)
+		with open(cliArgs.output, 'w') as outFile:
+			json.dump({ 'metadata': getMetadata(), 'results': results }, outFile, indent=1)
+		numErrors = sum(res['status'].startswith('error') for res in results)
+		if numErrors:
+			print(f'{numErrors} cases failed')
+			sys.exit(1)
+	else:
+		with open(cliArgs.old, 'r') as oldFile, open(cliArgs.new, 'r') as newFile:
+			numRegressions = compare(json.load(oldFile)['results'], json.load(newFile)['results'], cliArgs.threshold)
+		print(f'{numRegressions} regressions')
+		sys.exit(1 if numRegressions else 0)
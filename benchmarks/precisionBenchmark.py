@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+''' Measures peak memory and run time of the shape pipeline for float64 and
+    float32 vertex storage at several resolutions.
+
+    For each combination of Q and dtype a shape is produced the way
+    ArendConesAsteroidGenerator does it (read the unit cube, densify to Q,
+    apply numCones Arend cones with fillets), its feature size is computed
+    and it is exported to ICQ and PLY. Each combination runs in a fresh
+    process, so that caches of one run do not affect the others. Peak memory
+    is measured with tracemalloc, which accounts for NumPy arrays.
+
+    Usage: precisionBenchmark.py [Q ...]
+'''
+
+qs = [64, 128, 256, 512]
+dtypes = ['float64', 'float32']
+numCones = 50
+randomSeed = 42
+
+import os
+import sys
+import json
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+def runOne(q, dtype):
+	import time
+	import tempfile
+	import tracemalloc
+	import numpy as np
+	import icq, sculptor
+
+	np.random.seed(randomSeed)
+	tracemalloc.start()
+	startTime = time.perf_counter()
+
+	ish = icq.ICQShape(dtype=dtype)
+	ish.readICQ(icq.shapesDir / 'cube1.icq')
+	scu = sculptor.Sculptor(ish)
+	while ish.q < q:
+		scu.upscaleShape()
+	thetas = np.arccos(2.*np.random.random(size=numCones)-1.)
+	phis = 2.*np.pi*np.random.random(size=numCones)
+	radii = 0.4 + 0.6*np.random.random(size=numCones)
+	magnitudes = -0.33 + 0.66*np.random.random(size=numCones)
+	scu.shapeWithArendCones(thetas, phis, radii, magnitudes, baseRadius=15., coneType='linearWithFillet')
+	shapingTime = time.perf_counter()
+	_, shapingPeakMemory = tracemalloc.get_traced_memory()
+
+	ish.getMinAngularFeatureSize()
+	with tempfile.TemporaryDirectory() as tmpdir:
+		ish.writeICQ(os.path.join(tmpdir, 'shape.icq'))
+		ish.writePLY(os.path.join(tmpdir, 'shape.ply'), dtype=dtype)
+	endTime = time.perf_counter()
+
+	_, peakMemory = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return { 'q': q, 'dtype': dtype, 'vertexBytes': ish.vertices.nbytes, 'shapingPeakMemoryBytes': shapingPeakMemory, 'peakMemoryBytes': peakMemory,
+	         'shapingTime': shapingTime-startTime, 'exportTime': endTime-shapingTime, 'totalTime': endTime-startTime }
+
+if __name__=='__main__':
+	if len(sys.argv) > 2 and sys.argv[1] == '--single':
+		print(json.dumps(runOne(int(sys.argv[2]), sys.argv[3])))
+		sys.exit(0)
+
+	if len(sys.argv) > 1:
+		qs = [ int(arg) for arg in sys.argv[1:] ]
+
+	print('# q dtype vertexMB shapingPeakMB peakMB shapingSeconds exportSeconds totalSeconds')
+	for q in qs:
+		for dtype in dtypes:
+			output = subprocess.run([sys.executable, __file__, '--single', str(q), dtype], capture_output=True, text=True, check=True).stdout
+			res = json.loads(output.splitlines()[-1])
+			print(f'{res["q"]} {res["dtype"]} {res["vertexBytes"]/2**20:.1f} {res["shapingPeakMemoryBytes"]/2**20:.1f} {res["peakMemoryBytes"]/2**20:.1f} '
+			      f'{res["shapingTime"]:.3f} {res["exportTime"]:.3f} {res["totalTime"]:.3f}', flush=True)
@@ -23,20 +23,32 @@
     grey asteroid surfaces are supported at the moment. Resulting images are in
     grayscale. Rendering is multithreaded, with number of threads governed by
     the cpus variable.
+
+    Completed asteroids are recorded in manifest.jsonl. If the script is
+    interrupted, rerunning it in the same directory removes partially written
+    asteroid directories and continues from the last completed asteroid with
+    the same random draws as an uninterrupted run (see datasetGenerator.py).
 '''
 
 from pathlib import Path
 import numpy as np
-from multiprocessing.dummy import Pool as ThreadPool
 
 from arendConesAsteroidGenerator import ArendConesAsteroidGenerator
-import spatialState
+from datasetGenerator import DatasetGenerator
+from framePostProcessing import FramePostProcessor
+import instrumentation
 
 #####     CONFIGURATION    #####
 
 # System
 cpus = 1
 randomSeed = 42
+outputMode = 'directories' # 'container' packs the whole dataset into dataset.pack, see datasetGenerator.py
+saveMassProperties = False # also save volume, area, centroid and inertia tensor of each shape to mass_properties.ssv
+shDegree = None # if set, also save spherical harmonic coefficients of each shape up to this degree to sh_coefficients.ssv
+saveLabels = False # also save projected vertices, their visibility, bounding boxes and silhouette masks of the renders to labels.npz
+instrumentationFile = None # if set, e.g. 'stages.jsonl', per-stage timings are appended to this file as JSON lines, see instrumentation.py
+summaryInterval = 60 # seconds between throughput summaries (asteroids/s, frames/s) if instrumentationFile is set
 
 # Asteroid generator
 numAsteroids = 1000
@@ -54,41 +66,21 @@ lightSourceBrightness = 2
 renderWidth = 600
 renderHeight = 600
 antialiasing = 0.01
+postProcessor = None # e.g. FramePostProcessor(channels='gray', crop='bbox', cropMargin=4, outputSize=(128, 128)) to save small grayscale frames
 
 ##### END OF CONFIGURATION #####
 
 if __name__=='__main__':
-	np.random.seed(randomSeed)
-
-	workdir = Path.cwd()
+	if instrumentationFile:
+		instrumentation.enable(instrumentationFile, summaryInterval=summaryInterval)
 	astGen = ArendConesAsteroidGenerator(baseResolution=6)
-
-	threadPool = ThreadPool(cpus)
-
-	for id in range(numAsteroids):
-		print(f'ast id {id}')
-
-		astSh, shDesc = astGen.sampleAnAsteroid()
-		astDir = workdir / f'asteroid{id:05}'
-		astDir.mkdir(parents=True, exist_ok=True)
-		astSh.writeICQ(astDir / 'shape.icq')
-#		astSh.writeOBJ(astDir / 'shape.obj')
-		astGen.saveShapeDescription(shDesc, astDir / 'shape_description.ssv')
-
-		conditions = spatialState.sampleConditions(1, approachAngleRange=approachAnglesRange)
-		spatialState.saveConditions(conditions, astDir / 'conditions.ssv')
-
-		spatialStates = spatialState.SpatialStatesIterator(conditions, distances=distances, numPhases=numPhases)
-
-		def renderPhase(ssDesc):
-			condID, astRotAxis, apprAngle, dist, phid, ph = ssDesc
-			outfile = astDir / f'condition{condID}_distance{dist}_phase{phid:04}.png'
-			objColor = (0.5,0.5,0.5)
-			lsColor = (lightSourceBrightness, lightSourceBrightness, lightSourceBrightness)
-#			print(f'Calling renderer with cam at {(dist,0,apprAngle)}, light source at {(lightSourceDistance,0,0)}, phase {ph}')
-			astSh.renderSceneSpherical(outfile, cameraR=dist, cameraTheta=np.pi/2., cameraPhi=apprAngle,
-			                                    rotationAxis=astRotAxis, rotationAngle=ph,
-			                                    lightR=lightSourceDistance, lightTheta=np.pi/2, lightPhi=0,
-			                                    lightColor=lsColor, backgroundColor=(0,0,0), objectColor=objColor,
-			                                    width=renderWidth, height=renderHeight, antialiasing=antialiasing)
-		threadPool.map(renderPhase, spatialStates)
+	datasetGen = DatasetGenerator(astGen, workdir=Path.cwd(), randomSeed=randomSeed,
+	                              numConditions=1, approachAnglesRange=approachAnglesRange,
+	                              distances=distances, numPhases=numPhases,
+	                              lightSourceDistance=lightSourceDistance, lightSourceBrightness=lightSourceBrightness,
+	                              renderWidth=renderWidth, renderHeight=renderHeight, antialiasing=antialiasing,
+	                              threads=cpus, outputMode=outputMode, saveMassProperties=saveMassProperties,
+	                              shDegree=shDegree, saveLabels=saveLabels,
+	                              postProcessor=postProcessor)
+	datasetGen.run(numAsteroids, onAsteroid=lambda record: print(f'ast id {record["id"]}'))
+	instrumentation.disable()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+''' Creates a dataset of rendered synthetic asteroid shapes using the spherical
+    harmonics perturbation.
+
+    The script generates numAsteroids asteroid shapes using the sampling
+    procedure described in sphericalHarmonicsAsteroidGenerator.py. Shapes are
+    sampled, saved and rendered one at a time, so memory use does not depend
+    on numAsteroids. For each shape, a folder asteroid<id> is made in the
+    current directory. The directory is then populated with the following
+    files:
+
+      shape.icq - asteroid shape in ICQ format
+      shape.obj - asteroid shape in Wavefront OBJ format
+      shape_description.ssv - degrees, orders and magnitudes of the applied
+        spherical harmonic perturbations
+      mass_properties.ssv - volume, area, centroid and inertia tensor of the
+        shape (if saveMassProperties is set)
+      sh_coefficients.ssv - spherical harmonic coefficients of the radius of
+        the shape (if shDegree is set)
+      conditions.ssv - asteroid rotation axis + spacecraft approach angle
+        combinations, numRotationsPerAsteroid per asteroid
+      condition<cid>_distance<dist>_phase<phid>.png - asteroid renders,
+        one for each combination of conditions, distance and phase
+      labels.npz - projected vertices, bounding boxes and silhouette masks of
+        the renders (if saveLabels is set)
+
+    The dataset builder uses a reference frame attached to the asteroid, with
+    the origin is at the center of the original sphere from which the asteroid
+    was sculpted. That point plus the light source position and the camera
+    position define the XY plane. X axis is the direction towards the light
+    source, that is located at exactly (lightSourceDistance, 0, 0).
+    Conditions generation and iteration over combinations are described in
+    spatialState.py.
+
+    Distance from camera to asteroid is variable and takes values from the list
+    "distances". Distance to and brightness of the light source are constants
+    (lightSourceDistance, lightSourceBrightness).
+
+    Only white light and uniform grey asteroid surfaces are supported at the
+    moment. Resulting images are in grayscale. Rendering is multithreaded, max
+    thread number is ruled by "cpus" variable.
+
+    Completed asteroids are recorded in manifest.jsonl, so an interrupted run
+    can be continued by rerunning the script in the same directory (see
+    datasetGenerator.py).
+'''
+
+from pathlib import Path
+import numpy as np
+
+from sphericalHarmonicsAsteroidGenerator import SphericalHarmonicsAsteroidGenerator
+from datasetGenerator import DatasetGenerator
+from framePostProcessing import FramePostProcessor
+import instrumentation
+
+#####     CONFIGURATION    #####
+
+# System
+cpus = 8
+randomSeed = 42
+saveMassProperties = False # also save volume, area, centroid and inertia tensor of each shape to mass_properties.ssv
+shDegree = None # if set, also save spherical harmonic coefficients of each shape up to this degree to sh_coefficients.ssv
+saveLabels = False # also save projected vertices, their visibility, bounding boxes and silhouette masks of the renders to labels.npz
+instrumentationFile = None # if set, e.g. 'stages.jsonl', per-stage timings are appended to this file as JSON lines, see instrumentation.py
+summaryInterval = 60 # seconds between throughput summaries (asteroids/s, frames/s) if instrumentationFile is set
+
+# Asteroid generator
+numAsteroids = 2
+baseRadius = 15.
+baseResolution = 4 # for ICQShape, Q will be 2**5 unless a spherical harmonic
+                   # with finer features is applied
+resolutionMargin = 4 # model resolution must be such that the smallest spherical
+                     # harmonic feature must be at least resolutionMargin times
+                     # larger than the smallest triangle
+numPerturbationApplications = 15
+degreeDecay = 0.15
+magnitudeDecay = 0.35
+
+# Geometry generator
+distances = [ 125, 62 ]
+numRotationsPerAsteroid = 1
+numPhases = 25
+approachAnglesRange = [0, 2.*np.pi]
+lightSourceDistance = 1000
+lightSourceBrightness = 3
+
+# Rendering
+renderWidth = 300
+renderHeight = 300
+antialiasing = 0.01
+postProcessor = None # e.g. FramePostProcessor(channels='gray', crop='bbox', cropMargin=4, outputSize=(128, 128)) to save small grayscale frames
+
+##### END OF CONFIGURATION #####
+
+if __name__=='__main__':
+	if instrumentationFile:
+		instrumentation.enable(instrumentationFile, summaryInterval=summaryInterval)
+	astGen = SphericalHarmonicsAsteroidGenerator(baseRadius=baseRadius, baseResolution=baseResolution,
+	                                             resolutionMargin=resolutionMargin,
+	                                             numPerturbationApplications=numPerturbationApplications,
+	                                             degreeDecay=degreeDecay, magnitudeDecay=magnitudeDecay)
+	datasetGen = DatasetGenerator(astGen, workdir=Path.cwd(), randomSeed=randomSeed,
+	                              numConditions=numRotationsPerAsteroid, approachAnglesRange=approachAnglesRange,
+	                              distances=distances, numPhases=numPhases,
+	                              lightSourceDistance=lightSourceDistance, lightSourceBrightness=lightSourceBrightness,
+	                              renderWidth=renderWidth, renderHeight=renderHeight, antialiasing=antialiasing,
+	                              threads=min(cpus, numPhases), saveOBJ=True, saveMassProperties=saveMassProperties,
+	                              shDegree=shDegree, saveLabels=saveLabels,
+	                              postProcessor=postProcessor)
+	datasetGen.run(numAsteroids, onAsteroid=lambda record: print(f'ast id {record["id"]}'))
+	instrumentation.disable()
@@ -2,7 +2,7 @@
 
 import argparse
 
-parser = argparse.ArgumentParser(description='Convert a 3d shape in .ICQ format into Wavefront .OBJ format')
+parser = argparse.ArgumentParser(description='Convert a 3d shape in .ICQ format into Wavefront .OBJ format (or into binary .PLY/.STL if the output file has the corresponding extension)')
 parser.add_argument('icqFileName', metavar='icqFileName', type=str)
 parser.add_argument('objFileName', metavar='objFileName', type=str, nargs='?')
 
@@ -16,4 +16,9 @@ ish = icq.ICQShape()
 ish.readICQ(icqFileName)
 if not ish.validate(exceptionIfInvalid=False):
 	print('WARNING: input ICQ file {} is invalid!'.format(icqFileName))
-ish.writeOBJ(objFileName)
+if objFileName.lower().endswith('.ply'):
+	ish.writePLY(objFileName)
+elif objFileName.lower().endswith('.stl'):
+	ish.writeSTL(objFileName)
+else:
+	ish.writeOBJ(objFileName)
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+
+import argparse
+
+parser = argparse.ArgumentParser(description='Validate and convert many 3d shapes in .ICQ format in parallel. Inputs may be files, directories (searched recursively for *.icq) or glob patterns.')
+parser.add_argument('inputs', metavar='input', type=str, nargs='+')
+parser.add_argument('-f', '--format', dest='outputFormat', choices=['obj', 'ply', 'stl', 'icqb', 'none'], default='obj',
+                    help='output format; icqb is a binary ICQ (.npy vertex array), none only validates (default: obj)')
+parser.add_argument('-o', '--outdir', dest='outputDir', type=str, default=None,
+                    help='directory for converted files, mirroring the input directory structure (default: next to the inputs)')
+parser.add_argument('-j', '--processes', dest='processes', type=int, default=None,
+                    help='number of worker processes (default: number of CPUs)')
+parser.add_argument('-s', '--summary', dest='summaryFileName', type=str, default='conversion_summary.ssv',
+                    help='file for the summary table (default: conversion_summary.ssv)')
+
+cliArgs = parser.parse_args()
+
+import batchConvert
+
+rows = batchConvert.batchConvert(cliArgs.inputs, outputFormat=cliArgs.outputFormat, outputDir=cliArgs.outputDir, processes=cliArgs.processes)
+batchConvert.saveSummary(rows, cliArgs.summaryFileName)
+
+numInvalid = sum(1 for row in rows if row['valid'] is False)
+numFailed = sum(1 for row in rows if row['status'] != 'ok')
+print(f'Processed {len(rows)} files: {numInvalid} invalid, {numFailed} failed. Summary saved to {cliArgs.summaryFileName}')
@@ -29,7 +29,7 @@ antialiasing = 0.01
 ##### END OF CONFIGURATION #####
 
 import numpy as np
-from os.path import expanduser, join
+from os.path import join
 from os import getcwd, makedirs
 from multiprocessing.dummy import Pool as ThreadPool
 
@@ -46,7 +46,7 @@ def getFaceNormals(icqshape):
 
 def sampleAnAsteroid():
 	global spikableFaces
-	cubeicq = join(expanduser('~'), 'icqhandler', 'shapes', 'cube2.icq')
+	cubeicq = icq.shapesDir / 'cube2.icq'
 	ish = icq.ICQShape()
 	ish.readICQ(cubeicq)
 	ish.densifyTwofold(passes=resolutionPower-1)
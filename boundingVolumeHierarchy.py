@@ -0,0 +1,248 @@
+''' An array-backed bounding volume hierarchy (BVH) over the triangles of a
+    shape, for batched ray casting and closest point queries.
+
+    Triangles are sorted along a Morton (Z-order) curve through their
+    centroids and split into 2**depth leaves of contiguous triangles, at most
+    leafSize each. The leaves are the bottom level of a complete binary tree
+    stored in heap order: node i has children 2i+1 and 2i+2, so the whole
+    hierarchy is two arrays of box corners plus the leaf ranges, and no
+    per-node Python objects are made. Building takes a sort and a few
+    reductions, cheap enough to rebuild the hierarchy for every sampled shape.
+
+    Since all leaves are at the same depth, batched queries traverse the tree
+    one level at a time, carrying arrays of (query, node) pairs and dropping
+    the pairs whose boxes cannot contribute. Triangle IDs are indices into
+    the output of getTriangleIndices() of the shape.
+'''
+
+import numpy as np
+
+def _spreadBits(ints):
+	'''Inserts two zero bits after each of the 10 lowest bits of the integers'''
+	ints = ints.astype(np.uint32) & 0x3ff
+	ints = (ints | (ints << 16)) & 0x030000ff
+	ints = (ints | (ints << 8)) & 0x0300f00f
+	ints = (ints | (ints << 4)) & 0x030c30c3
+	ints = (ints | (ints << 2)) & 0x09249249
+	return ints
+
+def mortonCodes(points):
+	'''Returns 30 bit Morton codes of an array of points of shape (N, 3), quantized within their bounding box'''
+	lower, upper = points.min(axis=0), points.max(axis=0)
+	cells = np.clip((points - lower)/np.maximum(upper - lower, np.finfo(np.float64).tiny)*1024., 0, 1023)
+	return (_spreadBits(cells[:,0]) << 2) | (_spreadBits(cells[:,1]) << 1) | _spreadBits(cells[:,2])
+
+def _expandRanges(owners, starts, ends):
+	'''For pairs (owner, [start, end)) returns the flat arrays of owners and of all the indices within the ranges'''
+	counts = ends - starts
+	offsets = np.cumsum(counts) - counts
+	indices = np.arange(counts.sum()) - np.repeat(offsets - starts, counts)
+	return np.repeat(owners, counts), indices
+
+def closestPointsOnTriangles(points, a, b, c):
+	'''Returns the barycentric coordinates (shape (N, 3)) of the points of triangles (a, b, c) closest to the points,
+	   following the Voronoi region tests of Ericson, "Real-Time Collision Detection", 5.1.5. All arguments have shape (N, 3).
+	'''
+	dot = lambda u, v: np.einsum('ij,ij->i', u, v)
+	ab, ac = b - a, c - a
+	d1, d2 = dot(ab, points - a), dot(ac, points - a)
+	d3, d4 = dot(ab, points - b), dot(ac, points - b)
+	d5, d6 = dot(ab, points - c), dot(ac, points - c)
+	va, vb, vc = d3*d6 - d5*d4, d5*d2 - d1*d6, d1*d4 - d3*d2
+
+	bary = np.empty((len(points), 3))
+	with np.errstate(divide='ignore', invalid='ignore'):
+		# regions are assigned in reverse order of precedence, later ones override earlier ones
+		denom = va + vb + vc
+		bary[:,1], bary[:,2] = vb/denom, vc/denom
+		bary[:,0] = 1. - bary[:,1] - bary[:,2]
+		def assign(mask, weights):
+			bary[mask] = np.stack(weights, axis=-1)[mask] if any(np.ndim(w) for w in weights) else weights
+		w = (d4 - d3)/((d4 - d3) + (d5 - d6))
+		assign((va <= 0) & (d4 >= d3) & (d5 >= d6), (np.zeros_like(w), 1. - w, w)) # edge bc
+		w = d2/(d2 - d6)
+		assign((vb <= 0) & (d2 >= 0) & (d6 <= 0), (1. - w, np.zeros_like(w), w)) # edge ac
+		assign((d6 >= 0) & (d5 <= d6), (0., 0., 1.)) # vertex c
+		v = d1/(d1 - d3)
+		assign((vc <= 0) & (d1 >= 0) & (d3 <= 0), (1. - v, v, np.zeros_like(v))) # edge ab
+		assign((d3 >= 0) & (d4 <= d3), (0., 1., 0.)) # vertex b
+		assign((d1 <= 0) & (d2 <= 0), (1., 0., 0.)) # vertex a
+	return bary
+
+class BoundingVolumeHierarchy:
+	'''Bounding volume hierarchy over the triangles of a shape (any AbstractShape). The shape is read once on
+	   construction; build a new hierarchy after the shape changes, or refit() it after local changes.
+	'''
+	def __init__(self, shape, leafSize=8, blockSize=4096):
+		self._build(np.asarray(shape.getVertices(), dtype=np.float64), shape.getTriangleIndexArray(), leafSize, blockSize)
+
+	@classmethod
+	def fromArrays(cls, vertices, triangles, leafSize=8, blockSize=4096):
+		'''Builds the hierarchy over a triangle mesh given as arrays of vertices (N, 3) and of vertex indices (M, 3)'''
+		bvh = cls.__new__(cls)
+		bvh._build(np.asarray(vertices, dtype=np.float64), np.asarray(triangles, dtype=np.int64), leafSize, blockSize)
+		return bvh
+
+	def _build(self, vertices, triangles, leafSize, blockSize):
+		self.leafSize = leafSize
+		self.blockSize = blockSize # number of queries traversing the tree together
+		self.triangles = triangles
+		corners = vertices[triangles]
+		self.triangleNormals = self._unitNormals(corners) # indexed by triangle ID
+		self.triangleIDs = np.argsort(mortonCodes(corners.mean(axis=1)), kind='stable')
+		self.leafPositions = None # inverse permutation of triangleIDs, see refit()
+		self.corners = np.ascontiguousarray(corners[self.triangleIDs]) # shape (numTriangles, 3, 3), in leaf order
+
+		numTriangles = len(self.triangleIDs)
+		self.depth = int(np.ceil(np.log2(max(1., np.ceil(numTriangles/leafSize)))))
+		numLeaves = 2**self.depth
+		self.leafStarts = np.arange(numLeaves)*numTriangles//numLeaves
+		self.leafEnds = np.arange(1, numLeaves+1)*numTriangles//numLeaves
+
+		self.nodeMin = np.full((2*numLeaves-1, 3), np.inf)
+		self.nodeMax = np.full((2*numLeaves-1, 3), -np.inf)
+		nonEmpty = self.leafEnds > self.leafStarts
+		leafNodes = numLeaves - 1 + np.flatnonzero(nonEmpty)
+		self.nodeMin[leafNodes] = np.minimum.reduceat(self.corners.min(axis=1), self.leafStarts[nonEmpty])
+		self.nodeMax[leafNodes] = np.maximum.reduceat(self.corners.max(axis=1), self.leafStarts[nonEmpty])
+		# boxes are padded, so that rounding errors cannot cull rays that pass exactly through vertices or edges
+		self.padding = 1e-9*np.abs(self.corners).max() if numTriangles else 0.
+		self.nodeMin[leafNodes] -= self.padding
+		self.nodeMax[leafNodes] += self.padding
+		for level in range(self.depth-1, -1, -1):
+			nodes = np.arange(2**level - 1, 2**(level+1) - 1)
+			self.nodeMin[nodes] = np.minimum(self.nodeMin[2*nodes+1], self.nodeMin[2*nodes+2])
+			self.nodeMax[nodes] = np.maximum(self.nodeMax[2*nodes+1], self.nodeMax[2*nodes+2])
+
+	@staticmethod
+	def _unitNormals(corners):
+		normals = np.cross(corners[:,1]-corners[:,0], corners[:,2]-corners[:,0])
+		with np.errstate(divide='ignore', invalid='ignore'):
+			return normals/np.linalg.norm(normals, axis=-1, keepdims=True)
+
+	def refit(self, vertices, triangleIDs):
+		'''Updates the hierarchy after the vertices of the given triangles have moved, keeping the order of the triangles
+		   in the leaves. Only the boxes of the leaves holding the triangles and of their ancestors are recomputed, which
+		   is much cheaper than a rebuild after local changes; the boxes may overlap more than those of a rebuild.
+		'''
+		triangleIDs = np.unique(np.asarray(triangleIDs, dtype=np.int64))
+		if not len(triangleIDs):
+			return
+		if self.leafPositions is None:
+			self.leafPositions = np.argsort(self.triangleIDs)
+		corners = np.asarray(vertices, dtype=np.float64)[self.triangles[triangleIDs]]
+		self.triangleNormals[triangleIDs] = self._unitNormals(corners)
+		positions = self.leafPositions[triangleIDs]
+		self.corners[positions] = corners
+		self.padding = max(self.padding, 1e-9*np.abs(corners).max())
+
+		leaves = np.unique(np.searchsorted(self.leafEnds, positions, side='right'))
+		owners, indices = _expandRanges(leaves, self.leafStarts[leaves], self.leafEnds[leaves])
+		offsets = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+		nodes = 2**self.depth - 1 + leaves
+		self.nodeMin[nodes] = np.minimum.reduceat(self.corners[indices].min(axis=1), offsets) - self.padding
+		self.nodeMax[nodes] = np.maximum.reduceat(self.corners[indices].max(axis=1), offsets) + self.padding
+		while nodes[0] > 0:
+			nodes = np.unique((nodes-1)//2)
+			self.nodeMin[nodes] = np.minimum(self.nodeMin[2*nodes+1], self.nodeMin[2*nodes+2])
+			self.nodeMax[nodes] = np.maximum(self.nodeMax[2*nodes+1], self.nodeMax[2*nodes+2])
+
+	def _children(self, queries, nodes):
+		return np.repeat(queries, 2), np.stack([ 2*nodes+1, 2*nodes+2 ], axis=-1).ravel()
+
+	def _leafTriangles(self, queries, nodes):
+		leaves = nodes - (2**self.depth - 1)
+		return _expandRanges(queries, self.leafStarts[leaves], self.leafEnds[leaves])
+
+	def _inBlocks(self, func, *arrays):
+		results = [ func(*( arr[start:start+self.blockSize] for arr in arrays )) for start in range(0, len(arrays[0]), self.blockSize) ]
+		return tuple(np.concatenate(parts) for parts in zip(*results))
+
+	def intersectRays(self, origins, directions, maxDistance=np.inf):
+		'''Finds the nearest intersections of rays with the mesh. Returns
+		     distances - ray parameters t of the hits (in units of the direction length), inf for misses
+		     triangleIDs - indices of the hit triangles in getTriangleIndices(), -1 for misses
+		     barycentrics - barycentric coordinates of the hits within the triangles, shape (N, 3), nan for misses
+		   Only hits with 0 <= t <= maxDistance are reported.
+		'''
+		origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+		directions = np.broadcast_to(np.asarray(directions, dtype=np.float64), origins.shape)
+		return self._inBlocks(lambda o, d: self._intersectRaysBlock(o, d, maxDistance), origins, directions)
+
+	def _intersectRaysBlock(self, origins, directions, maxDistance):
+		with np.errstate(divide='ignore', invalid='ignore'):
+			inverseDirections = 1./directions
+		rays, nodes = np.arange(len(origins)), np.zeros(len(origins), dtype=np.int64)
+		for level in range(self.depth+1):
+			with np.errstate(invalid='ignore'): # 0*inf for rays starting on a slab plane, ignored by fmin/fmax
+				t1 = (self.nodeMin[nodes] - origins[rays])*inverseDirections[rays]
+				t2 = (self.nodeMax[nodes] - origins[rays])*inverseDirections[rays]
+			tNear = np.fmax(np.fmin(t1, t2).max(axis=1), 0.)
+			tFar = np.fmin(np.fmax(t1, t2).min(axis=1), maxDistance)
+			hit = tNear <= tFar
+			rays, nodes = rays[hit], nodes[hit]
+			if level < self.depth:
+				rays, nodes = self._children(rays, nodes)
+		rays, triangles = self._leafTriangles(rays, nodes)
+
+		# Moller-Trumbore
+		corners = self.corners[triangles]
+		edge1, edge2 = corners[:,1] - corners[:,0], corners[:,2] - corners[:,0]
+		pvec = np.cross(directions[rays], edge2)
+		det = np.einsum('ij,ij->i', edge1, pvec)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			invDet = 1./det
+			tvec = origins[rays] - corners[:,0]
+			u = np.einsum('ij,ij->i', tvec, pvec)*invDet
+			qvec = np.cross(tvec, edge1)
+			v = np.einsum('ij,ij->i', directions[rays], qvec)*invDet
+			t = np.einsum('ij,ij->i', edge2, qvec)*invDet
+		# slightly tolerant, so that rays through shared edges and vertices do not slip between the triangles
+		tolerance = 1e-12
+		valid = (det != 0) & (u >= -tolerance) & (v >= -tolerance) & (u + v <= 1 + tolerance) & (t >= 0) & (t <= maxDistance)
+		rays, triangles, u, v, t = rays[valid], triangles[valid], u[valid], v[valid], t[valid]
+
+		order = np.lexsort((t, rays))
+		first = order[np.r_[True, rays[order][1:] != rays[order][:-1]]] if len(order) else order
+		distances = np.full(len(origins), np.inf)
+		triangleIDs = np.full(len(origins), -1, dtype=np.int64)
+		barycentrics = np.full((len(origins), 3), np.nan)
+		distances[rays[first]] = t[first]
+		triangleIDs[rays[first]] = self.triangleIDs[triangles[first]]
+		barycentrics[rays[first]] = np.stack([ 1. - u[first] - v[first], u[first], v[first] ], axis=-1)
+		return distances, triangleIDs, barycentrics
+
+	def closestPoints(self, points):
+		'''Finds the points of the mesh closest to the query points. Returns
+		     distances - distances to the closest points
+		     triangleIDs - indices of the triangles of the closest points in getTriangleIndices()
+		     closestPoints - closest points, shape (N, 3)
+		     barycentrics - barycentric coordinates of the closest points within the triangles, shape (N, 3)
+		'''
+		points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+		return self._inBlocks(self._closestPointsBlock, points)
+
+	def _closestPointsBlock(self, points):
+		queries, nodes = np.arange(len(points)), np.zeros(len(points), dtype=np.int64)
+		for level in range(self.depth+1):
+			lower, upper = self.nodeMin[nodes], self.nodeMax[nodes]
+			offsets = points[queries]
+			minDistances = np.linalg.norm(np.maximum(np.maximum(lower - offsets, offsets - upper), 0.), axis=-1)
+			# every nonempty box holds a triangle within the distance of its farthest corner
+			maxDistances = np.linalg.norm(np.maximum(np.abs(offsets - lower), np.abs(offsets - upper)), axis=-1)
+			bounds = np.full(len(points), np.inf)
+			np.minimum.at(bounds, queries, maxDistances)
+			keep = minDistances <= bounds[queries]
+			queries, nodes = queries[keep], nodes[keep]
+			if level < self.depth:
+				queries, nodes = self._children(queries, nodes)
+		queries, triangles = self._leafTriangles(queries, nodes)
+
+		corners = self.corners[triangles]
+		bary = closestPointsOnTriangles(points[queries], corners[:,0], corners[:,1], corners[:,2])
+		candidates = np.einsum('ij,ijk->ik', bary, corners)
+		distances = np.linalg.norm(candidates - points[queries], axis=-1)
+
+		order = np.lexsort((distances, queries))
+		first = order[np.r_[True, queries[order][1:] != queries[order][:-1]]]
+		return distances[first], self.triangleIDs[triangles[first]], candidates[first], bary[first]
@@ -0,0 +1,130 @@
+''' A module for packing a whole dataset into a single container.
+
+    A container is a directory holding a JSON index (index.json) and one raw
+    binary file per field. Every record of a field has the same dtype and
+    shape, fixed by the first record appended; records are stored back to
+    back, so the file of a field is a C-ordered array of shape
+    (count,) + recordShape. The index keeps the number of committed records,
+    the dtype and record shape of every field and free-form attributes.
+
+    Records are appended to all field files first and committed by
+    atomically replacing the index, so a crash leaves at most some trailing
+    bytes after the committed records. These are truncated when the
+    container is reopened for appending.
+
+    Reading memory maps the field files, so random batches of records can be
+    loaded without reading (or opening) anything per sample.
+'''
+
+import os
+import json
+from pathlib import Path
+import numpy as np
+
+class DatasetContainer:
+	'''A container of fixed-shape records stored as raw memory-mappable arrays.
+	   mode is 'r' for read only access or 'a' for appending (the container is
+	   created if it does not exist).
+	'''
+	indexName = 'index.json'
+
+	def __init__(self, path, mode='r'):
+		if mode not in ('r', 'a'):
+			raise ValueError(f'Unrecognized container mode {mode}')
+		self.path = Path(path)
+		self.mode = mode
+		self._memmaps = {}
+		if (self.path / self.indexName).exists():
+			with open(self.path / self.indexName, 'r') as indexFile:
+				self.index = json.load(indexFile)
+		elif mode == 'a':
+			self.path.mkdir(parents=True, exist_ok=True)
+			self.index = { 'version': 1, 'count': 0, 'attrs': {}, 'fields': {} }
+			self._commitIndex()
+		else:
+			raise FileNotFoundError(f'No dataset container at {self.path}')
+		if mode == 'a':
+			self.truncate(len(self))
+
+	def __len__(self):
+		return self.index['count']
+
+	@property
+	def attrs(self):
+		'''Free-form JSON-serializable attributes of the dataset, saved on the next commit'''
+		return self.index['attrs']
+
+	def fields(self):
+		return list(self.index['fields'].keys())
+
+	def _recordSize(self, field):
+		desc = self.index['fields'][field]
+		return int(np.dtype(desc['dtype']).itemsize*np.prod(desc['shape'], dtype=np.int64))
+
+	def _commitIndex(self):
+		tmpPath = self.path / (self.indexName + '.tmp')
+		with open(tmpPath, 'w') as indexFile:
+			json.dump(self.index, indexFile)
+			indexFile.flush()
+			os.fsync(indexFile.fileno())
+		os.replace(tmpPath, self.path / self.indexName)
+
+	def append(self, record):
+		'''Appends a record, given as a dict from field names to arrays. All fields must be present.'''
+		if self.mode != 'a':
+			raise RuntimeError('Container is opened read only')
+		if not self.index['fields']:
+			for field, value in record.items():
+				value = np.asarray(value)
+				self.index['fields'][field] = { 'file': field + '.bin', 'dtype': value.dtype.str, 'shape': list(value.shape) }
+		if set(record.keys()) != set(self.index['fields'].keys()):
+			raise ValueError(f'Record fields {sorted(record.keys())} do not match container fields {sorted(self.fields())}')
+
+		for field, desc in self.index['fields'].items():
+			value = np.ascontiguousarray(record[field], dtype=np.dtype(desc['dtype']))
+			if list(value.shape) != desc['shape']:
+				raise ValueError(f'Field {field} has shape {value.shape}, container expects {tuple(desc["shape"])}')
+			with open(self.path / desc['file'], 'ab') as fieldFile:
+				fieldFile.write(value.tobytes())
+				fieldFile.flush()
+				os.fsync(fieldFile.fileno())
+
+		self.index['count'] += 1
+		self._commitIndex()
+		self._memmaps = {}
+
+	def truncate(self, count):
+		'''Drops all records after the first count ones'''
+		if self.mode != 'a':
+			raise RuntimeError('Container is opened read only')
+		if count > len(self):
+			raise ValueError(f'Cannot truncate container with {len(self)} records to {count} records')
+		for field, desc in self.index['fields'].items():
+			fieldPath = self.path / desc['file']
+			if fieldPath.exists():
+				with open(fieldPath, 'r+b') as fieldFile:
+					fieldFile.truncate(count*self._recordSize(field))
+		if count != self.index['count']:
+			self.index['count'] = count
+			self._commitIndex()
+		self._memmaps = {}
+
+	def commitAttrs(self):
+		'''Saves changes made to attrs'''
+		self._commitIndex()
+
+	def __getitem__(self, field):
+		'''Returns a read only memory map of the field, with shape (count,) + recordShape'''
+		if field not in self._memmaps:
+			desc = self.index['fields'][field]
+			shape = (len(self),) + tuple(desc['shape'])
+			if len(self) == 0:
+				self._memmaps[field] = np.empty(shape, dtype=np.dtype(desc['dtype']))
+			else:
+				self._memmaps[field] = np.memmap(self.path / desc['file'], dtype=np.dtype(desc['dtype']), mode='r', shape=shape)
+		return self._memmaps[field]
+
+	def getBatch(self, indices, fields=None):
+		'''Returns a dict from field names to in-memory arrays holding the records at the indices'''
+		indices = np.asarray(indices)
+		return { field: np.asarray(self[field][indices]) for field in (self.fields() if fields is None else fields) }
@@ -0,0 +1,407 @@
+''' A module for generating datasets of rendered synthetic asteroids.
+
+    DatasetGenerator drives any asteroid generator that provides the
+    sampleAnAsteroid()/saveShapeDescription() interface of
+    ArendConesAsteroidGenerator. For each asteroid a directory
+    asteroid<id> is made in the working directory and populated with
+
+      shape.icq - asteroid shape in ICQ format
+      shape.obj - asteroid shape in Wavefront OBJ format (if saveOBJ is set)
+      shape_description.ssv - parameters of the perturbations
+      mass_properties.ssv - volume, area, centroid and inertia tensor of
+        the shape (if saveMassProperties is set, see
+        AbstractShape.getMassProperties())
+      sh_coefficients.ssv - spherical harmonic coefficients of the radius
+        of the shape up to degree shDegree (if shDegree is set, see
+        sphericalHarmonics.py)
+      conditions.ssv - asteroid rotation axis + spacecraft approach angle
+      condition<cid>_distance<dist>_phase<phid>.png - asteroid renders
+      labels.npz - 2D ground truth of the renders (if saveLabels is set, see
+        AbstractShape.getImageLabels()): projected vertices, their
+        visibility, bounding boxes and silhouette masks, in frame order
+
+    Progress is recorded in an append-only manifest (manifest.jsonl by
+    default). A record is appended only after all files of an asteroid have
+    been written, so any asteroid directory without a record is partial. Each
+    record holds the state of the NumPy RNG before and after the asteroid
+    was sampled. When a run is restarted in the same directory, partial
+    directories are removed, the RNG is restored to the state that followed
+    the last completed asteroid and generation continues from the next ID.
+    The resumed run thus makes exactly the same random draws as an
+    uninterrupted one.
+
+    With a FramePostProcessor (see framePostProcessing.py), frames are
+    rendered into memory and reduced to gray, cropped, downsampled and
+    quantised before they are written or stored; saved labels are mapped to
+    the processed frames and get the crop boxes of the frames.
+
+    Sampling, writing, rendering and labelling of every asteroid are timed as
+    stages of instrumentation.py when a recorder is enabled, and run() counts
+    the completed asteroids and frames for its throughput summaries.
+
+    With outputMode='container' no per-asteroid directories are made.
+    Instead, shapes, shape descriptions, conditions and rendered frames of all
+    asteroids are appended to a single DatasetContainer (see
+    datasetContainer.py) that can be read with random access memory mapping.
+    A DatasetReader provides convenient access to such containers.
+'''
+
+import os
+import json
+import base64
+import shutil
+from pathlib import Path
+import numpy as np
+from multiprocessing.dummy import Pool as ThreadPool
+
+import icq
+import spatialState
+import instrumentation
+import sphericalHarmonics
+from abstractShape import massPropertiesVars, flattenMassProperties
+from datasetContainer import DatasetContainer
+from framePostProcessing import writePNG
+
+def encodeRNGState(state=None):
+	'''Converts the state of the NumPy legacy RNG (default: the global one) into a JSON-friendly dict'''
+	if state is None:
+		state = np.random.get_state()
+	name, keys, pos, hasGauss, cachedGaussian = state
+	return { 'name': name,
+	         'keys': base64.b64encode(np.asarray(keys, dtype='<u4').tobytes()).decode('ascii'),
+	         'pos': int(pos),
+	         'hasGauss': int(hasGauss),
+	         'cachedGaussian': float(cachedGaussian) }
+
+def decodeRNGState(encoded):
+	'''Inverse of encodeRNGState(). The result can be passed to np.random.set_state()'''
+	keys = np.frombuffer(base64.b64decode(encoded['keys']), dtype='<u4').astype(np.uint32)
+	return (encoded['name'], keys, encoded['pos'], encoded['hasGauss'], encoded['cachedGaussian'])
+
+class DatasetManifest:
+	'''Append-only JSON lines record of the completed asteroids of a dataset.
+
+	   Each record is written with a single write() on a file opened in append
+	   mode and is fsync'ed before append() returns, so a crash can at worst
+	   leave an incomplete last line. Such a line is discarded by read().
+	'''
+	def __init__(self, path):
+		self.path = Path(path)
+
+	def read(self):
+		'''Returns the list of complete records, truncating an incomplete trailing line if there is one'''
+		if not self.path.exists():
+			return []
+		with open(self.path, 'rb') as manFile:
+			data = manFile.read()
+		completeLength = data.rfind(b'\n') + 1
+		if completeLength < len(data):
+			with open(self.path, 'r+b') as manFile:
+				manFile.truncate(completeLength)
+		return [ json.loads(line) for line in data[:completeLength].decode('utf-8').splitlines() if line.strip() ]
+
+	def append(self, record):
+		line = (json.dumps(record, sort_keys=True) + '\n').encode('utf-8')
+		fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+		try:
+			os.write(fd, line)
+			os.fsync(fd)
+		finally:
+			os.close(fd)
+
+class DatasetGenerator:
+	'''Generates, saves and renders asteroids one by one, recording the progress in a DatasetManifest.
+	   See module description for the resumption procedure.
+	'''
+	def __init__(self, asteroidGenerator,
+	             workdir = None, # defaults to the current directory
+	             randomSeed = 42,
+	             numConditions = 1,
+	             approachAnglesRange = [0, 0],
+	             distances = [50],
+	             numPhases = 8,
+	             lightSourceDistance = 1000,
+	             lightSourceBrightness = 2,
+	             renderWidth = 600,
+	             renderHeight = 600,
+	             antialiasing = 0.01,
+	             threads = 1,
+	             manifestName = 'manifest.jsonl',
+	             outputMode = 'directories', # or 'container'
+	             containerName = 'dataset.pack',
+	             saveOBJ = False, # also save shape.obj in directories mode
+	             saveMassProperties = False, # also save mass properties of the shapes (unit density)
+	             shDegree = None, # if set, also save spherical harmonic coefficients of the shapes up to this degree
+	             saveLabels = False, # also save projected vertices, bounding boxes and masks of the renders
+	             postProcessor = None): # a FramePostProcessor applied to the renders before they are saved
+		if outputMode not in ('directories', 'container'):
+			raise ValueError(f'Unrecognized output mode {outputMode}')
+		if postProcessor is not None and not postProcessor.hasFixedOutputSize() and (outputMode == 'container' or saveLabels):
+			raise ValueError('Containers and labels need frames of a fixed size: give the post-processor an outputSize for bounding box cropping')
+		self.asteroidGenerator = asteroidGenerator
+		self.workdir = Path.cwd() if workdir is None else Path(workdir)
+		self.randomSeed = randomSeed
+		self.numConditions = numConditions
+		self.approachAnglesRange = approachAnglesRange
+		self.distances = distances
+		self.numPhases = numPhases
+		self.lightSourceDistance = lightSourceDistance
+		self.lightSourceBrightness = lightSourceBrightness
+		self.renderWidth = renderWidth
+		self.renderHeight = renderHeight
+		self.antialiasing = antialiasing
+		self.threads = threads
+		self.manifest = DatasetManifest(self.workdir / manifestName)
+		self.outputMode = outputMode
+		self.containerName = containerName
+		self.container = None
+		self.saveOBJ = saveOBJ
+		self.saveMassProperties = saveMassProperties
+		self.shDegree = shDegree
+		self.saveLabels = saveLabels
+		self.postProcessor = postProcessor
+
+	def asteroidDir(self, id):
+		return self.workdir / f'asteroid{id:05}'
+
+	def resume(self):
+		'''Restores the RNG and returns the ID of the first asteroid that has not been completed.
+		   Directories of asteroids that were started but not completed are removed.
+		'''
+		records = self.manifest.read()
+		if not records:
+			np.random.seed(self.randomSeed)
+			self.manifest.append({ 'type': 'header', 'randomSeed': self.randomSeed })
+			nextID = 0
+		else:
+			header = records[0]
+			if header.get('randomSeed') != self.randomSeed:
+				raise ValueError(f'Manifest {self.manifest.path} was made with random seed {header.get("randomSeed")}, cannot resume with seed {self.randomSeed}')
+			asteroidRecords = [ rec for rec in records if rec.get('type') == 'asteroid' ]
+			if asteroidRecords:
+				np.random.set_state(decodeRNGState(asteroidRecords[-1]['rngStateAfter']))
+				nextID = asteroidRecords[-1]['id'] + 1
+			else:
+				np.random.seed(self.randomSeed)
+				nextID = 0
+
+		for partialDir in self.workdir.glob('asteroid[0-9]*'):
+			idStr = partialDir.name[len('asteroid'):]
+			if partialDir.is_dir() and idStr.isdigit() and int(idStr) >= nextID:
+				shutil.rmtree(partialDir)
+
+		if self.outputMode == 'container':
+			self.container = DatasetContainer(self.workdir / self.containerName, mode='a')
+			if len(self.container) > nextID:
+				self.container.truncate(nextID)
+			elif len(self.container) < nextID:
+				raise RuntimeError(f'Container {self.container.path} holds {len(self.container)} asteroids, manifest records {nextID}')
+
+		return nextID
+
+	def renderState(self, astSh, ssDesc, outfile=None, tempfile=None, returnCropBox=False):
+		'''Renders one spatial state of the asteroid to outfile. If outfile is None, returns the image as a NumPy array.
+		   With returnCropBox, also returns the crop box of the post-processor (the full image without one).
+		'''
+		condID, astRotAxis, apprAngle, dist, phid, ph = ssDesc
+		objColor = (0.5,0.5,0.5)
+		lsColor = (self.lightSourceBrightness, self.lightSourceBrightness, self.lightSourceBrightness)
+		renderToMemory = outfile is None or self.postProcessor is not None
+		with instrumentation.stage('dataset.renderState', queueDepth=instrumentation.adjustQueue('render', -1)):
+			frame = astSh.renderSceneSpherical(None if renderToMemory else outfile, cameraR=dist, cameraTheta=np.pi/2., cameraPhi=apprAngle,
+			                                   rotationAxis=astRotAxis, rotationAngle=ph,
+			                                   lightR=self.lightSourceDistance, lightTheta=np.pi/2, lightPhi=0,
+			                                   lightColor=lsColor, backgroundColor=(0,0,0), objectColor=objColor,
+			                                   width=self.renderWidth, height=self.renderHeight, antialiasing=self.antialiasing,
+			                                   output_format='numpy' if renderToMemory else 'png', tempfile=tempfile)
+		cropBox = (0, 0, self.renderWidth, self.renderHeight)
+		if self.postProcessor is not None:
+			with instrumentation.stage('dataset.postProcess'):
+				frame, cropBox = self.postProcessor.process(frame)
+			if outfile is not None:
+				with instrumentation.stage('dataset.writeFrame'):
+					writePNG(outfile, frame)
+				frame = None
+		return (frame, cropBox) if returnCropBox else frame
+
+	def renderFrames(self, astSh, astDir, conditions, threadPool):
+		'''Renders all spatial states of the asteroid. If astDir is None, returns the frames as an array
+		   of shape (numFrames, height, width[, channels]), otherwise returns the list of frame file names.
+		   The crop boxes of the frames (see renderState()) are returned as the second value.
+		'''
+		spatialStates = spatialState.SpatialStatesIterator(conditions, distances=self.distances, numPhases=self.numPhases)
+		instrumentation.adjustQueue('render', len(spatialStates))
+		if astDir is None:
+			frames, cropBoxes = zip(*threadPool.map(lambda ssDesc: self.renderState(astSh, ssDesc, returnCropBox=True), spatialStates))
+			return np.stack(frames), cropBoxes
+		def renderPhase(ssDesc):
+			condID, _, _, dist, phid, _ = ssDesc
+			outfile = astDir / f'condition{condID}_distance{dist}_phase{phid:04}.png'
+			_, cropBox = self.renderState(astSh, ssDesc, outfile=outfile, returnCropBox=True)
+			return outfile.name, cropBox
+		frames, cropBoxes = zip(*threadPool.map(renderPhase, spatialStates))
+		return list(frames), cropBoxes
+
+	def computeLabels(self, astSh, conditions, cropBoxes):
+		'''Returns the 2D labels of all frames of the asteroid (see AbstractShape.getImageLabels()), in frame order,
+		   mapped to the post-processed frames with their crop boxes. Keypoints are stored in single precision.
+		'''
+		spatialStates = spatialState.SpatialStatesIterator(conditions, distances=self.distances, numPhases=self.numPhases)
+		labels = astSh.getImageLabels(spatialStates.toArray(lightSourceDistance=self.lightSourceDistance), self.renderWidth, self.renderHeight, masks=True)
+		labels['keypoints'] = labels['keypoints'].astype(np.float32)
+		if self.postProcessor is not None:
+			labels = self.postProcessor.transformLabels(labels, cropBoxes)
+		return labels
+
+	def generateAsteroid(self, id, threadPool):
+		'''Samples, saves and renders one asteroid. Returns its manifest record.'''
+		if self.outputMode == 'container':
+			return self.generateAsteroidIntoContainer(id, threadPool)
+
+		rngStateBefore = encodeRNGState()
+
+		with instrumentation.stage('dataset.sample', id=id) as st:
+			astSh, shDesc = self.asteroidGenerator.sampleAnAsteroid()
+			st.set(shape=astSh)
+		astDir = self.asteroidDir(id)
+		astDir.mkdir(parents=True, exist_ok=True)
+		with instrumentation.stage('dataset.writeShape', id=id):
+			astSh.writeICQ(astDir / 'shape.icq')
+			if self.saveOBJ:
+				astSh.writeOBJ(astDir / 'shape.obj')
+			self.asteroidGenerator.saveShapeDescription(shDesc, astDir / 'shape_description.ssv')
+			if self.saveMassProperties:
+				astSh.saveMassProperties(astDir / 'mass_properties.ssv')
+			if self.shDegree is not None:
+				sphericalHarmonics.saveCoefficients(astDir / 'sh_coefficients.ssv', sphericalHarmonics.fitShape(astSh, self.shDegree))
+
+		conditions = spatialState.sampleConditions(self.numConditions, approachAngleRange=self.approachAnglesRange)
+		spatialState.saveConditions(conditions, astDir / 'conditions.ssv')
+		rngStateAfter = encodeRNGState()
+
+		with instrumentation.stage('dataset.renderFrames', id=id, threads=self.threads) as st:
+			frames, cropBoxes = self.renderFrames(astSh, astDir, conditions, threadPool)
+			st.set(frames=len(frames))
+		instrumentation.count('frames', len(frames))
+		if self.saveLabels:
+			with instrumentation.stage('dataset.labels', id=id):
+				np.savez_compressed(astDir / 'labels.npz', **self.computeLabels(astSh, conditions, cropBoxes))
+
+		return { 'type': 'asteroid',
+		         'id': id,
+		         'dir': astDir.name,
+		         'shapeFile': 'shape.icq',
+		         'frames': frames,
+		         'rngState': rngStateBefore,
+		         'rngStateAfter': rngStateAfter }
+
+	def generateAsteroidIntoContainer(self, id, threadPool):
+		'''Samples and renders one asteroid, appending it to the container. Returns its manifest record.'''
+		rngStateBefore = encodeRNGState()
+		with instrumentation.stage('dataset.sample', id=id) as st:
+			astSh, shDesc = self.asteroidGenerator.sampleAnAsteroid()
+			st.set(shape=astSh)
+		conditions = spatialState.sampleConditions(self.numConditions, approachAngleRange=self.approachAnglesRange)
+		rngStateAfter = encodeRNGState()
+
+		with instrumentation.stage('dataset.renderFrames', id=id, threads=self.threads) as st:
+			frames, cropBoxes = self.renderFrames(astSh, None, conditions, threadPool)
+			st.set(frames=len(frames))
+		instrumentation.count('frames', len(frames))
+
+		if len(self.container) == 0:
+			self.container.attrs.update({ 'q': astSh.q,
+			                              'shapeDescriptionTitle': self.asteroidGenerator.shapeDescriptionTitle,
+			                              'shapeDescriptionVars': list(shDesc.keys()),
+			                              'conditionVars': ['RotAxis_x', 'RotAxis_y', 'RotAxis_z', 'ApproachAngle'],
+			                              'frames': [ f'condition{condID}_distance{dist}_phase{phid:04}'
+			                                          for condID, _, _, dist, phid, _ in spatialState.SpatialStatesIterator(conditions, distances=self.distances, numPhases=self.numPhases) ] })
+			if self.saveMassProperties:
+				self.container.attrs['massPropertiesVars'] = list(massPropertiesVars)
+			if self.shDegree is not None:
+				self.container.attrs['shDegree'] = self.shDegree
+		record = { 'shape': astSh.getVertexArray(),
+		           'shapeDescription': np.array([ shDesc[var] for var in self.container.attrs['shapeDescriptionVars'] ], dtype=float),
+		           'conditions': np.array([ list(axis) + [angle] for axis, angle in conditions ], dtype=float),
+		           'frames': frames }
+		if self.saveMassProperties:
+			record['massProperties'] = flattenMassProperties(astSh.getMassProperties())
+		if self.shDegree is not None:
+			record['shCoefficients'] = sphericalHarmonics.fitShape(astSh, self.shDegree)
+		if self.saveLabels:
+			with instrumentation.stage('dataset.labels', id=id):
+				record.update(self.computeLabels(astSh, conditions, cropBoxes))
+		with instrumentation.stage('dataset.append', id=id):
+			self.container.append(record)
+
+		return { 'type': 'asteroid',
+		         'id': id,
+		         'container': self.containerName,
+		         'index': len(self.container)-1,
+		         'rngState': rngStateBefore,
+		         'rngStateAfter': rngStateAfter }
+
+	def run(self, numAsteroids, onAsteroid=None):
+		'''Generates asteroids up to ID numAsteroids-1, continuing from the last completed one.
+		   onAsteroid, if given, is called with the manifest record of every completed asteroid, e.g. to report progress.
+		'''
+		threadPool = ThreadPool(self.threads)
+		for id in range(self.resume(), numAsteroids):
+			record = self.generateAsteroid(id, threadPool)
+			with instrumentation.stage('dataset.manifest', id=id):
+				self.manifest.append(record)
+			instrumentation.count('asteroids')
+			if onAsteroid is not None:
+				onAsteroid(record)
+		threadPool.close()
+
+class DatasetReader:
+	'''Random access reader for datasets generated with outputMode='container'.
+	   All fields are memory mapped; getBatch() loads a batch of asteroids without opening any per-sample files.
+	'''
+	def __init__(self, path):
+		self.container = DatasetContainer(path, mode='r')
+
+	def __len__(self):
+		return len(self.container)
+
+	def getShape(self, idx):
+		'''Returns the shape of the idx-th asteroid as an ICQShape'''
+		ish = icq.ICQShape()
+		ish.setVertexArray(self.container['shape'][idx])
+		return ish
+
+	def getShapeDescription(self, idx):
+		'''Returns the shape description of the idx-th asteroid in the format of sampleAnAsteroid()'''
+		values = self.container['shapeDescription'][idx]
+		return { var: np.array(values[i]) for i, var in enumerate(self.container.attrs['shapeDescriptionVars']) }
+
+	def getConditions(self, idx):
+		'''Returns the conditions of the idx-th asteroid in the format of spatialState.sampleConditions()'''
+		return [ (tuple(row[:3]), row[3]) for row in self.container['conditions'][idx].tolist() ]
+
+	def getMassProperties(self, idx):
+		'''Returns the mass properties of the idx-th asteroid as a dict from massPropertiesVars to values,
+		   if the dataset was generated with saveMassProperties
+		'''
+		return dict(zip(self.container.attrs['massPropertiesVars'], self.container['massProperties'][idx].tolist()))
+
+	def getSHCoefficients(self, idx):
+		'''Returns the spherical harmonic coefficients of the idx-th asteroid (see sphericalHarmonics.py),
+		   if the dataset was generated with shDegree
+		'''
+		return self.container['shCoefficients'][idx]
+
+	def getLabels(self, idx):
+		'''Returns the 2D labels of the frames of the idx-th asteroid as a dict of memory mapped arrays (keypoints,
+		   visible, boundingBoxes, masks and, with a post-processor, cropBoxes), if the dataset was generated with saveLabels
+		'''
+		return { field: self.container[field][idx] for field in ('keypoints', 'visible', 'boundingBoxes', 'masks', 'cropBoxes') if field in self.container.fields() }
+
+	def getFrames(self, idx):
+		'''Returns a memory mapped array of all frames of the idx-th asteroid'''
+		return self.container['frames'][idx]
+
+	def getBatch(self, indices, fields=None):
+		'''Returns a dict from field names ('shape', 'shapeDescription', 'conditions', 'frames' and the optional fields) to arrays for a batch of asteroids'''
+		return self.container.getBatch(indices, fields=fields)
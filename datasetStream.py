@@ -0,0 +1,98 @@
+''' A module for streaming rendered synthetic asteroids directly into a
+    consumer (e.g. a training loop), without writing anything to disk.
+
+    AsteroidStream takes a DatasetGenerator (see datasetGenerator.py) for the
+    asteroid generator, the conditions and the rendering configuration. Each
+    asteroid is sampled and rendered by a pool of worker processes; the
+    stream keeps at most `prefetch` asteroids in flight, so memory use does
+    not depend on the length of the stream.
+
+    The stream is deterministic: before the asteroid with ID k is sampled the
+    NumPy RNG of the worker is seeded with [randomSeed, k]. The results do not
+    depend on the number of processes, and asteroids are always yielded in
+    the order of their IDs. Note that the draws differ from the ones made by
+    DatasetGenerator.run(), which uses a single RNG sequence for all asteroids.
+'''
+
+import os
+from collections import deque
+from multiprocessing import Pool
+import numpy as np
+
+import spatialState
+
+_workerDatasetGenerator = None
+
+def _initWorker(datasetGenerator):
+	global _workerDatasetGenerator
+	_workerDatasetGenerator = datasetGenerator
+
+def _sampleAndRender(id, randomSeed, datasetGenerator=None):
+	'''Samples and renders the asteroid with the given ID. Returns
+	   (shapeArrays, spatialStates, frames), see AsteroidStream.
+	'''
+	dg = _workerDatasetGenerator if datasetGenerator is None else datasetGenerator
+	np.random.seed([randomSeed, id])
+	astSh, shDesc = dg.asteroidGenerator.sampleAnAsteroid()
+	conditions = spatialState.sampleConditions(dg.numConditions, approachAngleRange=dg.approachAnglesRange)
+	spatialStates = list(spatialState.SpatialStatesIterator(conditions, distances=dg.distances, numPhases=dg.numPhases))
+	frames = [ dg.renderState(astSh, ssDesc) for ssDesc in spatialStates ]
+	shapeArrays = { 'vertices': astSh.getVertexArray(), 'description': shDesc }
+	return shapeArrays, spatialStates, frames
+
+class AsteroidStream:
+	'''An iterator over (shapeArrays, spatialState, image) tuples, one per rendered frame.
+
+	   shapeArrays is a dict with the vertex array of the shape ('vertices',
+	   see ICQShape.getVertexArray()) and the shape description returned by
+	   the asteroid generator ('description'); it is shared between all frames
+	   of an asteroid. spatialState is the tuple
+	   (condID, rotationAxis, approachAngle, distance, phaseID, phase)
+	   yielded by spatialState.SpatialStatesIterator. image is a NumPy array.
+
+	   If processes is 0 the asteroids are produced in the calling process.
+	'''
+	def __init__(self, datasetGenerator,
+	             numAsteroids = None, # None for an infinite stream
+	             randomSeed = None, # defaults to datasetGenerator.randomSeed
+	             processes = None, # defaults to os.cpu_count()
+	             prefetch = None, # max number of asteroids in flight, defaults to 2*processes
+	             firstID = 0):
+		self.datasetGenerator = datasetGenerator
+		self.numAsteroids = numAsteroids
+		self.randomSeed = datasetGenerator.randomSeed if randomSeed is None else randomSeed
+		self.processes = os.cpu_count() if processes is None else processes
+		self.prefetch = max(1, 2*self.processes if prefetch is None else prefetch)
+		self.firstID = firstID
+
+	def _ids(self):
+		id = self.firstID
+		while self.numAsteroids is None or id < self.firstID+self.numAsteroids:
+			yield id
+			id += 1
+
+	def _asteroids(self):
+		'''Yields (shapeArrays, spatialStates, frames) of consecutive asteroids'''
+		if self.processes == 0:
+			for id in self._ids():
+				yield _sampleAndRender(id, self.randomSeed, datasetGenerator=self.datasetGenerator)
+			return
+
+		with Pool(self.processes, initializer=_initWorker, initargs=(self.datasetGenerator,)) as pool:
+			pending = deque()
+			ids = self._ids()
+			for id in ids:
+				pending.append(pool.apply_async(_sampleAndRender, (id, self.randomSeed)))
+				if len(pending) >= self.prefetch:
+					break
+			while pending:
+				result = pending.popleft().get()
+				nextID = next(ids, None)
+				if nextID is not None:
+					pending.append(pool.apply_async(_sampleAndRender, (nextID, self.randomSeed)))
+				yield result
+
+	def __iter__(self):
+		for shapeArrays, spatialStates, frames in self._asteroids():
+			for ssDesc, image in zip(spatialStates, frames):
+				yield shapeArrays, ssDesc, image
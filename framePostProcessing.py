@@ -0,0 +1,172 @@
+''' Post-processing of rendered frames before they are written.
+
+    Renders come out of POV-Ray as 8 bit RGB images of the full render size,
+    mostly black background around a grey asteroid. FramePostProcessor turns
+    them into what the loaders actually use, in this order:
+
+      1. channel reduction - 'gray' keeps one luma channel (the renders are
+         grey, so this loses nothing), 'rgb' keeps all three
+      2. cropping - 'margin' removes fixed margins from the image edges,
+         'bbox' crops to the bounding box of the pixels brighter than
+         backgroundThreshold, grown by cropMargin pixels and widened to the
+         aspect ratio of outputSize if it is given. Boxes reaching beyond
+         the image are padded with background. Frames without any object
+         pixels are not cropped.
+      3. area downsampling - by an integer factor or to a fixed outputSize.
+         Each output pixel is the average of the input area it covers, so
+         silhouettes get anti-aliased edges rather than aliasing.
+      4. bit depth - 8 or 16 bits per channel. 16 bits keep the fractional
+         levels produced by averaging.
+
+    The crop box of each frame, in pixels of the original render, is
+    returned along with the frame, so that 2D labels can be mapped to the
+    processed images (see transformLabels()).
+
+    Frames are written as PNGs by writePNG(), which only needs zlib.
+'''
+
+import zlib
+import struct
+import numpy as np
+
+lumaWeights = np.array([0.299, 0.587, 0.114]) # ITU-R BT.601
+
+def writePNG(fileName, image, compressionLevel=6):
+	'''Writes a uint8 or uint16 image of shape (height, width) (grayscale) or (height, width, 3) (RGB) as a PNG file'''
+	image = np.asarray(image)
+	if image.dtype not in (np.uint8, np.uint16):
+		raise ValueError(f'PNG images must be uint8 or uint16, got {image.dtype}')
+	if image.ndim == 3 and image.shape[2] == 1:
+		image = image[:,:,0]
+	if image.ndim == 2:
+		colorType = 0
+	elif image.ndim == 3 and image.shape[2] == 3:
+		colorType = 2
+	else:
+		raise ValueError(f'Unsupported image shape {image.shape}')
+	height, width = image.shape[:2]
+	rows = image.astype('>u2' if image.dtype == np.uint16 else np.uint8).reshape(height, -1).view(np.uint8)
+	raw = np.concatenate([ np.zeros((height, 1), dtype=np.uint8), rows ], axis=1) # filter type 0 for every row
+	def chunk(tag, data):
+		return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+	with open(fileName, 'wb') as pngFile:
+		pngFile.write(b'\x89PNG\r\n\x1a\n')
+		pngFile.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8*image.dtype.itemsize, colorType, 0, 0, 0)))
+		pngFile.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), compressionLevel)))
+		pngFile.write(chunk(b'IEND', b''))
+
+def areaResamplingMatrix(inputLength, outputLength):
+	'''Returns the (outputLength, inputLength) matrix averaging input pixels over the areas of output pixels'''
+	edges = np.arange(outputLength+1)*(inputLength/outputLength)
+	starts, ends = edges[:-1,np.newaxis], edges[1:,np.newaxis]
+	pixels = np.arange(inputLength)[np.newaxis]
+	return np.clip(np.minimum(pixels+1, ends) - np.maximum(pixels, starts), 0., None)/(ends - starts)
+
+def cropWithPadding(image, box):
+	'''Returns the part of the image within box = (left, top, right, bottom), padding with zeros beyond the image'''
+	left, top, right, bottom = box
+	height, width = image.shape[:2]
+	cropped = np.zeros((bottom-top, right-left) + image.shape[2:], dtype=image.dtype)
+	srcTop, srcBottom, srcLeft, srcRight = max(top, 0), min(bottom, height), max(left, 0), min(right, width)
+	if srcTop < srcBottom and srcLeft < srcRight:
+		cropped[srcTop-top:srcBottom-top, srcLeft-left:srcRight-left] = image[srcTop:srcBottom, srcLeft:srcRight]
+	return cropped
+
+class FramePostProcessor:
+	'''Channel reduction, cropping, area downsampling and bit depth selection of rendered frames, see the module description.
+	   cropMargin is the margin grown around the bounding box for crop='bbox' and the (top, bottom, left, right) margins
+	   removed for crop='margin' (a single number for all four). outputSize is (width, height); it excludes downsample.
+	'''
+	def __init__(self, channels='gray', crop=None, cropMargin=0, backgroundThreshold=0, downsample=1, outputSize=None, bitDepth=8):
+		if channels not in ('gray', 'rgb'):
+			raise ValueError(f'Unrecognized channels {channels}')
+		if crop not in (None, 'margin', 'bbox'):
+			raise ValueError(f'Unrecognized crop mode {crop}')
+		if bitDepth not in (8, 16):
+			raise ValueError(f'Unsupported bit depth {bitDepth}')
+		if outputSize is not None and downsample != 1:
+			raise ValueError('Give either outputSize or downsample')
+		self.channels = channels
+		self.crop = crop
+		self.cropMargin = cropMargin
+		self.backgroundThreshold = backgroundThreshold
+		self.downsample = downsample
+		self.outputSize = outputSize
+		self.bitDepth = bitDepth
+
+	def hasFixedOutputSize(self):
+		'''Tells whether all frames of one render size come out with the same size'''
+		return self.crop != 'bbox' or self.outputSize is not None
+
+	def getCropBox(self, frame):
+		'''Returns the crop box (left, top, right, bottom) of a frame of shape (height, width[, channels])'''
+		height, width = frame.shape[:2]
+		if self.crop == 'margin':
+			top, bottom, left, right = np.broadcast_to(self.cropMargin, 4)
+			return int(left), int(top), int(width-right), int(height-bottom)
+		if self.crop == 'bbox':
+			foreground = frame > self.backgroundThreshold
+			if foreground.ndim == 3:
+				foreground = foreground.any(axis=2)
+			rows, columns = np.nonzero(foreground.any(axis=1))[0], np.nonzero(foreground.any(axis=0))[0]
+			if len(rows):
+				left, top = columns[0] - self.cropMargin, rows[0] - self.cropMargin
+				right, bottom = columns[-1] + 1 + self.cropMargin, rows[-1] + 1 + self.cropMargin
+				if self.outputSize is not None:
+					# widen the box to the output aspect ratio, so that the frame is not distorted
+					boxWidth = max(right-left, int(np.ceil((bottom-top)*self.outputSize[0]/self.outputSize[1])))
+					boxHeight = max(bottom-top, int(np.ceil(boxWidth*self.outputSize[1]/self.outputSize[0])))
+					left -= (boxWidth - (right-left))//2
+					top -= (boxHeight - (bottom-top))//2
+					right, bottom = left + boxWidth, top + boxHeight
+				return int(left), int(top), int(right), int(bottom)
+		return 0, 0, width, height
+
+	def getOutputSize(self, cropBox):
+		'''Returns the (width, height) of the processed frame for a crop box'''
+		if self.outputSize is not None:
+			return tuple(self.outputSize)
+		left, top, right, bottom = cropBox
+		return max(1, (right-left)//self.downsample), max(1, (bottom-top)//self.downsample)
+
+	def resample(self, image, cropBox):
+		'''Crops an image of shape (height, width[, channels]) to the box and area-resamples it to the output size, in float64'''
+		cropped = cropWithPadding(np.asarray(image, dtype=np.float64), cropBox)
+		outputWidth, outputHeight = self.getOutputSize(cropBox)
+		if (outputWidth, outputHeight) == cropped.shape[1::-1]:
+			return cropped
+		rowWeights = areaResamplingMatrix(cropped.shape[0], outputHeight)
+		columnWeights = areaResamplingMatrix(cropped.shape[1], outputWidth)
+		return np.einsum('ij,jk...,lk->il...', rowWeights, cropped, columnWeights)
+
+	def process(self, frame):
+		'''Returns the processed frame and its crop box'''
+		frame = np.asarray(frame)
+		maxValue = np.iinfo(frame.dtype).max if np.issubdtype(frame.dtype, np.integer) else 1.
+		if self.channels == 'gray' and frame.ndim == 3:
+			reduced = frame[:,:,:3] @ lumaWeights if frame.shape[2] >= 3 else frame[:,:,0]
+		else:
+			reduced = frame
+		cropBox = self.getCropBox(reduced)
+		resampled = self.resample(reduced, cropBox)
+		outputMax = 2**self.bitDepth - 1
+		return np.round(np.clip(resampled/maxValue, 0., 1.)*outputMax).astype(np.uint8 if self.bitDepth == 8 else np.uint16), cropBox
+
+	def transformLabels(self, labels, cropBoxes):
+		'''Maps labels of AbstractShape.getImageLabels() to the processed frames with the crop boxes returned by process().
+		   Masks are resampled like the frames and thresholded at half coverage.
+		'''
+		cropBoxes = np.asarray(cropBoxes, dtype=np.float64)
+		sizes = np.array([ self.getOutputSize(tuple(map(int, box))) for box in cropBoxes ], dtype=np.float64)
+		scales = sizes/(cropBoxes[:,2:] - cropBoxes[:,:2])
+		transformed = dict(labels)
+		transformed['keypoints'] = ((labels['keypoints'] - cropBoxes[:,np.newaxis,:2])*scales[:,np.newaxis]).astype(labels['keypoints'].dtype)
+		boxes = (labels['boundingBoxes'].reshape(-1, 2, 2) - cropBoxes[:,np.newaxis,:2])*scales[:,np.newaxis]
+		transformed['boundingBoxes'] = np.clip(boxes, 0., sizes[:,np.newaxis]).reshape(-1, 4)
+		if 'visible' in labels:
+			inside = np.all((transformed['keypoints'] >= 0.) & (transformed['keypoints'] < sizes[:,np.newaxis].astype(np.float32)), axis=-1)
+			transformed['visible'] = labels['visible'] & inside
+		if 'masks' in labels:
+			transformed['masks'] = np.stack([ self.resample(mask, tuple(map(int, box))) >= 0.5 for mask, box in zip(labels['masks'], cropBoxes) ])
+		transformed['cropBoxes'] = cropBoxes.astype(np.int64)
+		return transformed
@@ -1,5 +1,12 @@
+import threading
+from pathlib import Path
 import numpy as np
-from abstractShape import AbstractShape
+from abstractShape import AbstractShape, writeFormattedRows
+
+shapesDir = Path(__file__).resolve().parent / 'shapes' # base shapes shipped with the package, e.g. shapesDir / 'cube1.icq'
+
+_uniqueIndexArraysCache = {} # q -> (uniqueToRaw, rawToUnique, trianglesOnFlatIndices), see ICQShape.getUniqueIndexArrays()
+_sparseTopologyCache = {} # q -> (adjacency, cornerIncidence), see ICQShape.getAdjacencyMatrix() and ICQShape.getCornerIncidenceMatrix()
 
 class ICQShape(AbstractShape):
 	''' Class for handling 3d models in implicitly connected quadrilateral format.
@@ -34,70 +41,187 @@ class ICQShape(AbstractShape):
 	      |  .  .  .  .  .  .  .  .  .
 	      Q  .  .  .  .  .  .  .  .  .
 
+
+	    Vertices are stored in a NumPy array of shape (6, Q+1, Q+1, 3) and of
+	    selectable floating point type (dtype, float64 by default). Since the
+	    ICQ text format only keeps 6 decimals, float32 is sufficient for most
+	    purposes and halves the memory footprint. Quantities that accumulate
+	    many terms (normals, angles, perturbation weights) are always computed
+	    in float64.
+
+	    Local edits (setVertex(), setVertexRegion()) are tracked as dirty
+	    tiles of tileSize x tileSize cells of a face, see invalidateRegion().
+	    The angular feature size, the vertex normals and the bounding volume
+	    hierarchy are then updated for the cells of the dirty tiles only; the
+	    other derived quantities are dropped as on any other change.
+
+	    Derived quantities are computed lazily under a per-shape lock, so any
+	    number of threads may read and render the same shape at once, as long
+	    as none of them changes the vertices.
 	'''
-	def __init__(self):
+	tileSize = 16 # cells per side of the tiles of dirty region tracking
+
+	def __init__(self, dtype=np.float64):
 		self.q = None # Model resolution
-		self.rawVertices = None # Flat list of vertices of the model
-		self.vertices = None # Three-dimensional list of vertices.
+		self.dtype = np.dtype(dtype)
+		self.rawVertices = None # Flat array of vertices of the model, shape (6*(Q+1)**2, 3). A view of self.vertices.
+		self.vertices = None # Array of vertices of shape (6, Q+1, Q+1, 3).
 		                     # Vertex at self.vertices[f][j][i] is on face f at position (i,j)
 		self.rawVerticesUpToDate = False
 		self.maxFeatureSize = None
+		self.lodPyramid = None # coarser versions of the shape, see getLevelOfDetail()
+		self.cotangentLaplacian = None
+		self.bvh = None
+		self.tileMinCosines = None # smallest cosine of the angles of the edges of the cells of each tile, see getMinAngularFeatureSize()
+		self.faceNormals = None # unnormalized normals of the triangles and their sums at the unique vertices, see getVertexNormals()
+		self.vertexNormalSums = None
+		self.dirtyTiles = {} # name of an incrementally updated quantity -> boolean array of shape (6, T, T) of the tiles changed since it was computed
+		self.sceneMesh = None # see getSceneMesh()
+		self.cacheLock = threading.RLock() # guards the lazy computation of all of the above
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		del state['cacheLock']
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.cacheLock = threading.RLock()
+
+	def invalidateCaches(self):
+		'''Drops all quantities derived from the vertices. Must be called whenever the vertices change.'''
+		self.maxFeatureSize = None
+		self.lodPyramid = None
+		self.cotangentLaplacian = None
+		self.bvh = None
+		self.tileMinCosines = None
+		self.faceNormals = None
+		self.vertexNormalSums = None
+		self.dirtyTiles = {}
+		self.sceneMesh = None
+
+	def invalidateRegion(self, face, start, stop):
+		'''Records that the vertices self.vertices[face, start[0]:stop[0], start[1]:stop[1]] have changed. Must be called
+		   instead of invalidateCaches() after a local change. The tiles holding the cells around these vertices are marked
+		   dirty for the incrementally updated quantities; the rest of the derived quantities are dropped. Regions
+		   reaching the edges of the face fall back to invalidateCaches(), as their vertices have records on other faces.
+		'''
+		(a0, b0), (a1, b1) = start, stop
+		if a0 <= 0 or b0 <= 0 or a1 > self.q or b1 > self.q:
+			self.invalidateCaches()
+			return
+		self.maxFeatureSize = None
+		self.lodPyramid = None
+		self.cotangentLaplacian = None
+		self.sceneMesh = None
+		ts = self.tileSize
+		# vertex k is a corner of cells k-1 and k
+		for mask in self.dirtyTiles.values():
+			mask[face, (a0-1)//ts:(a1-1)//ts+1, (b0-1)//ts:(b1-1)//ts+1] = True
+
+	def _numTiles(self):
+		return -(-self.q//self.tileSize)
+
+	def _takeDirtyCells(self, name):
+		'''Returns the boolean array of shape (6, Q, Q) of the cells in the tiles changed since the quantity name was
+		   computed and starts tracking changes anew. Returns None if the quantity has to be computed from scratch:
+		   if it was never computed or if more than a quarter of the tiles changed.
+		'''
+		mask = self.dirtyTiles.get(name)
+		numTiles = self._numTiles()
+		self.dirtyTiles[name] = np.zeros((6, numTiles, numTiles), dtype=bool)
+		if mask is None or mask.shape[1] != numTiles or 4*np.count_nonzero(mask) > mask.size:
+			return None
+		ts = self.tileSize
+		return np.repeat(np.repeat(mask, ts, axis=1), ts, axis=2)[:, :self.q, :self.q]
+
+	def _getDirtyTriangleIDs(self, cells):
+		'''Returns the indices (as in getTriangleIndices()) of the triangles of a boolean array of cells of shape (6, Q, Q)'''
+		cellIDs = np.flatnonzero(cells.transpose(0, 2, 1)) # triangles are ordered by face, second and first cell index
+		return (2*cellIDs[:,np.newaxis] + np.arange(2)).ravel()
+
+	def setVertexRegion(self, face, start, newValues):
+		'''Sets the vertices self.vertices[face, start[0]:start[0]+h, start[1]:start[1]+w] to an array of shape (h, w, 3).
+		   Like setVertex(), only inner vertices of the face can be modified.
+		'''
+		newValues = np.asarray(newValues)
+		stop = (start[0] + newValues.shape[0], start[1] + newValues.shape[1])
+		if start[0] <= 0 or start[1] <= 0 or stop[0] > self.q or stop[1] > self.q:
+			raise NotImplementedError('Modification of edge vertices is currently not supported')
+		self.vertices[face, start[0]:stop[0], start[1]:stop[1]] = newValues
+		self.invalidateRegion(face, start, stop)
+
+	def setDtype(self, dtype):
+		'''Changes the floating point type used to store the vertices'''
+		self.dtype = np.dtype(dtype)
+		if self.vertices is not None:
+			self.setVertexArray(self.vertices)
 
 	def readICQ(self, icqfilename):
 		with open(icqfilename, 'r') as icqfile:
 			self.q = int(icqfile.readline())
-		self.rawVertices = list(map(tuple, np.loadtxt(icqfilename, skiprows=1).tolist()))
+		self.rawVertices = np.loadtxt(icqfilename, skiprows=1, dtype=self.dtype).reshape(-1, 3)
 		self.parseRawVertices()
-		self.rawVerticesUpToDate = True
+		with self.cacheLock:
+			self.invalidateCaches()
 
 	def writeICQ(self, icqfilename):
+		if self.vertices is None:
+			raise ValueError('No data to write to the ICQ file!')
 		if not self.rawVerticesUpToDate:
-			if not self.vertices:
-				raise ValueError('No data to write to the ICQ file!')
-			else:
-				self.unparseVerticesToRaw()
+			self.unparseVerticesToRaw()
 
 		# Format mirrors the output of cubeICQ.c exactly, potentially with all its errors
 		with open(icqfilename, 'w') as icqfile:
 			icqfile.write('\t     ' + str(self.q) + '\n')
-			for vertex in self.rawVertices:
-				for component in vertex:
-					icqfile.write('\t{:.6f}'.format(component))
-				icqfile.write('\n')
+			writeFormattedRows(icqfile, '\t%.6f\t%.6f\t%.6f\n', self.rawVertices)
+
+	def readICQBinary(self, icqbfilename):
+		'''Reads the shape from a binary ICQ file written by writeICQBinary()'''
+		self.setVertexArray(np.load(icqbfilename))
+
+	def writeICQBinary(self, icqbfilename):
+		'''Writes the shape as a NumPy .npy file holding the vertex array of shape (6, Q+1, Q+1, 3).
+		   Unlike the text format, it preserves the coordinates exactly and is much faster to read and write.
+		'''
+		if self.vertices is None:
+			raise ValueError('No data to write to the ICQ file!')
+		with open(icqbfilename, 'wb') as icqbfile:
+			np.save(icqbfile, self.getVertexArray())
 
 	def parseRawVertices(self):
-		'''Parses the flat list of vertices self.rawVertices into the three-dimensional structure
-		   self.vertices. Each element of this structure is a triple, so it's really four dimensional.
-		   Additionally, a map is generated from the three indices on self.vertices to the single
-		   index of self.rawVertices. The map is stored at self.indexMap3to1
+		'''Parses the flat array of vertices self.rawVertices into the four-dimensional array
+		   self.vertices. Vertex at self.vertices[f][j][i] is the one at self.rawVertices[getFlatIndex(f, j, i)].
 		'''
-		curidx = 0
-		self.vertices = []
-		self.indexMap3to1 = {}
-		for face in range(6):
-			faceMatrix = []
-			for j in range(self.q+1):
-				faceRow = []
-				for i in range(self.q+1):
-					faceRow.append(self.rawVertices[curidx])
-					self.indexMap3to1[(face, j, i)] = curidx
-					curidx += 1
-				faceMatrix.append(faceRow)
-			self.vertices.append(faceMatrix)
+		self.vertices = np.ascontiguousarray(self.rawVertices, dtype=self.dtype).reshape(6, self.q+1, self.q+1, 3)
+		self.unparseVerticesToRaw()
 
 	def unparseVerticesToRaw(self):
-		'''Updates the flat list of vertices (self.rawVertices) based on self.vertices.'''
-		curIdx = 0
-		self.rawVertices = []
-		self.indexMap3to1 = {}
-		for face in range(6):
-			for j in range(self.q+1):
-				for i in range(self.q+1):
-					self.rawVertices.append(self.vertices[face][j][i])
-					self.indexMap3to1[(face, j, i)] = curIdx
-					curIdx += 1
+		'''Updates the flat array of vertices (self.rawVertices) based on self.vertices. The result is a view, so it stays
+		   up to date until self.vertices is replaced.
+		'''
+		self.rawVertices = self.vertices.reshape(-1, 3)
 		self.rawVerticesUpToDate = True
 
+	def getGridDirections(self):
+		'''Returns the unit vectors pointing from the origin towards the vertices of the unit cube ICQ grid at the
+		   current Q, as an array of shape (6, Q+1, Q+1, 3). The grid is the one obtained by densifying cube1.icq,
+		   and redundant vertices get bitwise identical directions.
+		'''
+		cube = ICQShape()
+		cube.readICQ(shapesDir / 'cube1.icq')
+		ts = np.arange(self.q+1)/self.q
+		js, is_ = ts[np.newaxis,:,np.newaxis,np.newaxis], ts[np.newaxis,np.newaxis,:,np.newaxis]
+		c = cube.vertices.astype(np.float64)
+		points = (1-js)*(1-is_)*c[:,:1,:1] + (1-js)*is_*c[:,:1,1:] + js*(1-is_)*c[:,1:,:1] + js*is_*c[:,1:,1:]
+		uniqueToRaw, rawToUnique, _ = self.getUniqueIndexArrays()
+		points = points.reshape(-1, 3)[uniqueToRaw][rawToUnique].reshape(points.shape)
+		return points/np.linalg.norm(points, axis=-1, keepdims=True)
+
+	def getFlatIndex(self, face, j, i):
+		'''Returns the index in self.rawVertices of the vertex at self.vertices[face][j][i]. Works elementwise on arrays.'''
+		return (face*(self.q+1) + j)*(self.q+1) + i
+
 	def validate(self, exceptionIfInvalid=True):
 		'''Checks if the coordinates of redundant vertices coincide, returns true if they do'''
 
@@ -105,7 +229,7 @@ class ICQShape(AbstractShape):
 		def eq(v1, v2):
 			f1,i1,j1 = v1
 			f2,i2,j2 = v2
-			eqval = (self.vertices[f1][i1][j1]==self.vertices[f2][i2][j2])
+			eqval = np.array_equal(self.vertices[f1][i1][j1], self.vertices[f2][i2][j2])
 			if not exceptionIfInvalid:
 				# if not eqval:
 				#	print('Vertices at f={}, i={}, j={} and at f={}, i={}, j={} are different: {} and {}, correspondingly'.format(f1,i1,j1,f2,i2,j2,self.vertices[f1][i1][j1],self.vertices[f2][i2][j2]))
@@ -161,8 +285,27 @@ class ICQShape(AbstractShape):
 
 		return all(map(all, edges)) and all(map(all, corners))
 
+	def getMaxRedundantVertexDeviation(self):
+		'''Returns the largest distance between any record of a redundant vertex and its first record
+		   (see getRedundancyList()). Zero for valid shapes.
+		'''
+		uniqueToRaw, rawToUnique, _ = self.getUniqueIndexArrays()
+		flatVertices = self.getVertices().astype(np.float64)
+		return float(np.max(np.linalg.norm(flatVertices - flatVertices[uniqueToRaw][rawToUnique], axis=1)))
+
 	def getRedundancyList(self):
 		'''Returns a list of lists, where each sublist contains all 3D indices of a unique vertex'''
+		# inner vertices
+		faces = []
+		for face in range(6):
+			for i in range(1, self.q):
+				for j in range(1, self.q):
+					faces.append([(face, i, j)])
+
+		return self.getBoundaryRedundancyList() + faces
+
+	def getBoundaryRedundancyList(self):
+		'''Returns the part of getRedundancyList() that describes the vertices on the edges of the faces'''
 		corners = [ [ (0, 0, 0), (2, 0, 0), (3, 0, self.q) ],                    # v(0,0,0) = v(0,0,2) = v(Q,0,3)
 		            [ (0, self.q, 0), (1, 0, 0), (2, 0, self.q) ],               # v(0,Q,0) = v(0,0,1) = v(Q,0,2)
 		            [ (0, 0, self.q), (3, 0, 0), (4, 0, self.q) ],               # v(Q,0,0) = v(0,0,3) = v(Q,0,4)
@@ -187,14 +330,7 @@ class ICQShape(AbstractShape):
 		              [ [ (4, i, 0), (1, i, self.q) ] for i in range(1, self.q) ]               # v(0,I,4)=v(Q,I,1)
 								], [])
 
-		# inner vertices
-		faces = []
-		for face in range(6):
-			for i in range(1, self.q):
-				for j in range(1, self.q):
-					faces.append([(face, i, j)])
-
-		return corners + edges + faces
+		return corners + edges
 
 	def getTrianglesOn3DIndices(self):
 		'''Returns the list of six lists of triangles constituting the model.
@@ -211,94 +347,175 @@ class ICQShape(AbstractShape):
 			faceLists.append(faceTriangles)
 		return faceLists
 
+	def getTriangleArrayOnFlatIndices(self):
+		'''Returns the triangles of getTrianglesOnFlatIndices() as an integer array of shape (numTriangles, 3).
+		   Depends only on Q and does not require self.rawVertices to be up to date.
+		'''
+		return self.getUniqueIndexArrays()[2]
+
+	def getUniqueIndexArrays(self):
+		'''Returns a triple of int32 arrays describing the topology of the model at the current Q:
+		     uniqueToRaw - for each unique vertex, the flat index (as in self.rawVertices) of its first record
+		     rawToUnique - for each flat index, the index of the corresponding unique vertex
+		     triangles - array of shape (numTriangles, 3) of flat indices, in the order of getTrianglesOn3DIndices()
+		   The unique vertices are ordered as in getRedundancyList(). The arrays are computed once per Q and shared
+		   between all shapes, so they must not be modified.
+		'''
+		if self.q not in _uniqueIndexArraysCache:
+			side = self.q+1
+			flat = self.getFlatIndex
+
+			# boundary vertices come first, followed by the inner vertices in the order of their flat indices
+			boundaryRedlist = self.getBoundaryRedundancyList()
+			numBoundary = len(boundaryRedlist)
+			innerMask = np.zeros((6, side, side), dtype=bool)
+			innerMask[:, 1:self.q, 1:self.q] = True
+			innerToRaw = np.flatnonzero(innerMask).astype(np.int32)
+
+			uniqueToRaw = np.concatenate([ np.array([ flat(*allvertidxs[0]) for allvertidxs in boundaryRedlist ], dtype=np.int32), innerToRaw ])
+			rawToUnique = np.empty(6*side*side, dtype=np.int32)
+			for uidx, allvertidxs in enumerate(boundaryRedlist):
+				for vertidxs in allvertidxs:
+					rawToUnique[flat(*vertidxs)] = uidx
+			rawToUnique[innerToRaw] = numBoundary + np.arange(len(innerToRaw), dtype=np.int32)
+
+			f, i, j = np.meshgrid(np.arange(6, dtype=np.int32), np.arange(self.q, dtype=np.int32), np.arange(self.q, dtype=np.int32), indexing='ij')
+			triangles = np.stack([ np.stack([ flat(f,j,i), flat(f,j+1,i+1), flat(f,j,i+1) ], axis=-1),
+			                       np.stack([ flat(f,j,i), flat(f,j+1,i), flat(f,j+1,i+1) ], axis=-1) ], axis=-2).reshape(-1, 3)
+
+			for arr in (uniqueToRaw, rawToUnique, triangles):
+				arr.flags.writeable = False
+			_uniqueIndexArraysCache[self.q] = (uniqueToRaw, rawToUnique, triangles)
+		return _uniqueIndexArraysCache[self.q]
+
 	def getTrianglesOnFlatIndices(self):
 		'''Returns the list of triangles constituting the model.
 		   Each triangle is represented as a triple of indices in self.rawVertices.
 		'''
-		if not self.rawVerticesUpToDate:
-			self.unparseVerticesToRaw()
-		triangles3di = sum(self.getTrianglesOn3DIndices(), [])
-		return [ (self.indexMap3to1[i], self.indexMap3to1[j], self.indexMap3to1[k]) for i,j,k in triangles3di ]
+		return list(map(tuple, self.getTriangleArrayOnFlatIndices().tolist()))
 
 	def densifyTwofold(self, passes=1):
-		def interpolate(face, j1, i1, j2, i2):
-			vec1 = self.vertices[face][j1][i1]
-			vec2 = self.vertices[face][j2][i2]
-			return tuple( (c1+c2)/2. for c1,c2 in zip(vec1, vec2) )
-		newVertices = []
-		for face in range(6):
-			faceMatrix = []
-			lastRow = []
-			for j in range(self.q):
-				upperRow = []
-				lowerRow = []
-				for i in range(self.q):
-					# i,j     X      i+1,j   <--- upper row
-					#  X      X        X     <--- lower row
-					# i,j+1   X      i+1,j+1 <--- last row (only processed on the lower boundary)
-					# last column elements are only added on the right boundary
-
-					upperRow.append(self.vertices[face][j][i])
-					upperRow.append(interpolate(face, j, i, j, i+1))
-					if i==self.q-1:
-						upperRow.append(self.vertices[face][j][i+1])
-
-					lowerRow.append(interpolate(face, j, i, j+1, i))
-					lowerRow.append(interpolate(face, j, i, j+1, i+1))
-					if i==self.q-1:
-						lowerRow.append(interpolate(face, j, i+1, j+1, i+1))
-
-					if j==self.q-1:
-						lastRow.append(self.vertices[face][j+1][i])
-						lastRow.append(interpolate(face, j+1, i, j+1, i+1))
-						if i==self.q-1:
-							lastRow.append(self.vertices[face][j+1][i+1])
-
-				faceMatrix.append(upperRow)
-				faceMatrix.append(lowerRow)
-
-			faceMatrix.append(lastRow)
-
-			newVertices.append(faceMatrix)
-
-		self.vertices = newVertices
-		self.q *= 2
-
-		if passes>1:
-			self.densifyTwofold(passes=passes-1)
+		# i,j     X      i+1,j   <--- even rows: old vertices and midpoints of the horizontal edges
+		#  X      X        X     <--- odd rows: midpoints of the vertical and diagonal edges
+		# i,j+1   X      i+1,j+1
+		for _ in range(passes):
+			old = self.vertices
+			new = np.empty((6, 2*self.q+1, 2*self.q+1, 3), dtype=self.dtype)
+			new[:, ::2, ::2] = old
+			new[:, ::2, 1::2] = (old[:, :, :-1] + old[:, :, 1:])/2.
+			new[:, 1::2, ::2] = (old[:, :-1, :] + old[:, 1:, :])/2.
+			new[:, 1::2, 1::2] = (old[:, :-1, :-1] + old[:, 1:, 1:])/2.
+			self.vertices = new
+			self.q *= 2
 
 		self.rawVerticesUpToDate = False
-		self.maxFeatureSize = None
+		self.invalidateCaches()
 
 	def dumberTwofold(self, passes=1):
 		if self.q//(2**passes) < 1:
 			raise ValueError('Model resolution cannot be lowered (q={}, {} passes of twofold coarse graining requested)'.format(self.q, passes))
-		newVertices = []
-		for face in range(6):
-			faceMatrix = []
-			for j in range(self.q//2+1):
-				row = []
-				for i in range(self.q//2+1):
-					row.append(self.vertices[face][2*j][2*i])
-				faceMatrix.append(row)
-			newVertices.append(faceMatrix)
+		for _ in range(passes):
+			self.vertices = self.vertices[:, ::2, ::2].copy()
+			self.q //= 2
 
-		self.vertices = newVertices
-		self.q //= 2
+		self.rawVerticesUpToDate = False
+		self.invalidateCaches()
 
-		if passes>1:
-			self.dumberTwofold(passes=passes-1)
+	def antialiasedDumberTwofold(self, passes=1):
+		'''Like dumberTwofold(), but low-pass filters the shape before discarding the vertices, so that
+		   features smaller than the new resolution are averaged out rather than sampled.
+
+		   The filter acts on the radii of vertices; the directions of the remaining vertices are kept.
+		   Radii of inner vertices are convolved with the separable binomial kernel [1,2,1]/4 x [1,2,1]/4,
+		   radii of vertices on face edges - with [1,2,1]/4 along the edge only, and corners are kept as is.
+		   Records of redundant vertices are thus filtered in the same way on all faces, and valid
+		   shapes stay valid.
+		'''
+		if self.q % (2**passes) != 0:
+			raise ValueError('Model resolution cannot be lowered (q={}, {} passes of twofold coarse graining requested)'.format(self.q, passes))
+		for _ in range(passes):
+			radii = np.linalg.norm(self.vertices.astype(np.float64), axis=-1)
+			filtered = radii.copy()
+			# sums of pairs of opposite neighbours are computed first, so the result does not depend on the direction of traversal
+			alongI = ((radii[:, :, :-2] + radii[:, :, 2:]) + 2.*radii[:, :, 1:-1])/4.
+			filtered[:, 1:-1, 1:-1] = ((alongI[:, :-2, :] + alongI[:, 2:, :]) + 2.*alongI[:, 1:-1, :])/4.
+			filtered[:, 0, 1:-1] = alongI[:, 0, :]
+			filtered[:, -1, 1:-1] = alongI[:, -1, :]
+			filtered[:, 1:-1, 0] = ((radii[:, :-2, 0] + radii[:, 2:, 0]) + 2.*radii[:, 1:-1, 0])/4.
+			filtered[:, 1:-1, -1] = ((radii[:, :-2, -1] + radii[:, 2:, -1]) + 2.*radii[:, 1:-1, -1])/4.
+
+			scales = (filtered/radii)[:, ::2, ::2, np.newaxis]
+			self.vertices = (self.vertices[:, ::2, ::2]*scales).astype(self.dtype)
+			self.q //= 2
 
 		self.rawVerticesUpToDate = False
-		self.maxFeatureSize = None
+		self.invalidateCaches()
+
+	def getMaxEdgeLength(self):
+		'''Returns the length of the longest edge of the triangle mesh'''
+		verts = self.vertices.astype(np.float64)
+		return float(max(np.max(np.linalg.norm(verts[:, :, 1:] - verts[:, :, :-1], axis=-1)),
+		                 np.max(np.linalg.norm(verts[:, 1:, :] - verts[:, :-1, :], axis=-1)),
+		                 np.max(np.linalg.norm(verts[:, 1:, 1:] - verts[:, :-1, :-1], axis=-1))))
+
+	def getLevelOfDetail(self, level):
+		'''Returns a version of the shape with resolution lowered by 2**level with antialiasedDumberTwofold().
+		   Level 0 is the shape itself. Levels are computed lazily, each from the previous one, and cached
+		   until the shape changes. Returns None if the resolution cannot be lowered that much.
+		'''
+		with self.cacheLock:
+			if self.lodPyramid is None:
+				self.lodPyramid = [ self ]
+			while len(self.lodPyramid) <= level:
+				finer = self.lodPyramid[-1]
+				if finer.q % 2 != 0 or finer.q < 4:
+					return None
+				coarser = ICQShape(dtype=self.dtype)
+				coarser.q = finer.q
+				coarser.vertices = finer.vertices
+				coarser.antialiasedDumberTwofold()
+				self.lodPyramid.append(coarser)
+			return self.lodPyramid[level]
+
+	def getLevelOfDetailFor(self, cameraDistance, width, maxEdgePixels=1., fieldOfView=None):
+		'''Returns the coarsest level of detail (see getLevelOfDetail()) whose longest edge, seen from
+		   cameraDistance from the origin, projects onto at most maxEdgePixels pixels of an image
+		   width pixels wide. If even the full resolution shape does not satisfy the criterion, returns
+		   the shape itself. See AbstractShape.getLevelOfDetailFor() for the camera model.
+		'''
+		maxRadius = float(np.max(np.linalg.norm(self.vertices.astype(np.float64), axis=-1)))
+		pixelsPerUnitLength = self.getPixelsPerUnitLength(cameraDistance-maxRadius, width, fieldOfView=fieldOfView)
+		chosen = self
+		level = 1
+		while True:
+			candidate = self.getLevelOfDetail(level)
+			if candidate is None or candidate.getMaxEdgeLength()*pixelsPerUnitLength > maxEdgePixels:
+				return chosen
+			chosen = candidate
+			level += 1
+
+	def getVertexArray(self):
+		'''Returns a copy of the vertex array of shape (6, Q+1, Q+1, 3)'''
+		return self.vertices.copy()
+
+	def setVertexArray(self, vertexArray):
+		'''Sets the vertices from an array of shape (6, Q+1, Q+1, 3), as returned by getVertexArray()'''
+		vertexArray = np.asarray(vertexArray)
+		if vertexArray.ndim != 4 or vertexArray.shape[0] != 6 or vertexArray.shape[1] != vertexArray.shape[2] or vertexArray.shape[3] != 3:
+			raise ValueError(f'Vertex array of shape {vertexArray.shape} does not describe an ICQ shape')
+		self.q = vertexArray.shape[1]-1
+		self.vertices = np.array(vertexArray, dtype=self.dtype)
+		self.rawVerticesUpToDate = False
+		self.invalidateCaches()
 
 	def getVertex(self, face, i, j):
-		return self.vertices[face][i][j]
+		return tuple(self.vertices[face, i, j].tolist())
 
 	def setVertex(self, face, i, j, newValue):
 		if i==0 or i==self.q or j==0 or j==self.q:
 			raise NotImplementedError('Modification of edge vertices is currently not supported')
-		self.vertices[face][i][j] = newValue
+		self.vertices[face, i, j] = newValue
+		self.invalidateRegion(face, (i, j), (i+1, j+1))
 
 	###### Overloading abstract methods of AbstractShape #####
 
@@ -307,64 +524,211 @@ class ICQShape(AbstractShape):
 			self.unparseVerticesToRaw()
 		return self.rawVertices
 
-	def setVertices(self, newVertices, newq=None): # TODO: make sure that the new verices are adequate for the q
+	def setVertices(self, newVertices, newq=None):
 		if newq:
 			self.q = newq
+		newVertices = np.asarray(newVertices)
+		if newVertices.shape != (6*(self.q+1)**2, 3):
+			raise ValueError(f'Got {newVertices.shape} array of vertices, shape with q={self.q} requires ({6*(self.q+1)**2}, 3)')
 		self.rawVertices = newVertices
 		self.parseRawVertices()
+		self.invalidateCaches()
 
 	def getTriangleIndices(self):
 		return self.getTrianglesOnFlatIndices()
 
+	def getTriangleIndexArray(self):
+		return self.getTriangleArrayOnFlatIndices()
+
+	def getBoundingVolumeHierarchy(self):
+		'''Returns the cached hierarchy, refitted to the triangles of the dirty tiles after local changes'''
+		with self.cacheLock:
+			dirtyCells = self._takeDirtyCells('bvh')
+			if self.bvh is None or dirtyCells is None:
+				self.bvh = super().getBoundingVolumeHierarchy()
+			elif dirtyCells.any():
+				self.bvh.refit(self.getVertices(), self._getDirtyTriangleIDs(dirtyCells))
+			return self.bvh
+
+	def getSceneMesh(self):
+		'''Cached until the vertices change, see AbstractShape.getSceneMesh()'''
+		with self.cacheLock:
+			if self.sceneMesh is None:
+				self.sceneMesh = super().getSceneMesh()
+			return self.sceneMesh
+
 	def getUniqueVertices(self):
-		redlist = self.getRedundancyList()
-		uniqverts = []
-		for allvertidxs in redlist:
-			vertrecs = [ self.vertices[f][j][i] for f,j,i in allvertidxs ]
-			if len(set(map(tuple, vertrecs))) > 1:
-				print(f'WARNING: found inconsistent records of vertex vals while uniquifying vertices\n{vertrecs}')
-			uniqverts.append(vertrecs[0])
-		return uniqverts
+		return list(map(tuple, self.getUniqueVertexArray().tolist()))
 
 	def getTriangleIndicesForUniqueVertices(self):
-		redlist = self.getRedundancyList()
-		numverts = len(redlist)
+		return list(map(tuple, self.getTriangleIndexArrayForUniqueVertices().tolist()))
+
+	def getUniqueVertexArray(self):
+		uniqueToRaw, rawToUnique, _ = self.getUniqueIndexArrays()
+		flatVertices = self.getVertices()
+		uniqueVertices = flatVertices[uniqueToRaw]
+		inconsistent = np.any(flatVertices != uniqueVertices[rawToUnique], axis=1)
+		if np.any(inconsistent):
+			print(f'WARNING: found {np.count_nonzero(inconsistent)} inconsistent records of vertex vals while uniquifying vertices')
+		return uniqueVertices
+
+	def getTriangleIndexArrayForUniqueVertices(self):
+		_, rawToUnique, triangles = self.getUniqueIndexArrays()
+		return rawToUnique[triangles]
+
+	###### Sparse operators on unique vertices #####
+	# Rows and columns are indexed like getUniqueVertexArray(). Matrices that depend only on Q are shared
+	# between all shapes and must not be modified.
+
+	def _getSparseTopology(self):
+		if self.q not in _sparseTopologyCache:
+			from scipy import sparse # imported here to keep scipy out of the import time of the module
+			triangles = self.getTriangleIndexArrayForUniqueVertices()
+			numUnique = len(self.getUniqueIndexArrays()[0])
+			edges = np.concatenate([ triangles[:, [0,1]], triangles[:, [1,2]], triangles[:, [2,0]] ])
+			adjacency = sparse.coo_matrix((np.ones(len(edges)), (edges[:,0], edges[:,1])), shape=(numUnique, numUnique)).tocsr()
+			adjacency = adjacency + adjacency.T
+			adjacency.data[:] = 1. # every edge is shared by two triangles
+			cornerIncidence = sparse.csr_matrix((np.ones(triangles.size), triangles.ravel(), np.arange(triangles.size+1)),
+			                                    shape=(triangles.size, numUnique)).T.tocsr()
+			_sparseTopologyCache[self.q] = (adjacency, cornerIncidence)
+		return _sparseTopologyCache[self.q]
+
+	def getAdjacencyMatrix(self):
+		'''Returns the symmetric adjacency matrix of the mesh (a scipy.sparse CSR matrix with ones for connected vertices)'''
+		return self._getSparseTopology()[0]
+
+	def getDegreeMatrix(self):
+		'''Returns the diagonal matrix of the numbers of neighbours of the vertices'''
+		from scipy import sparse
+		return sparse.diags(np.asarray(self.getAdjacencyMatrix().sum(axis=1)).ravel(), format='csr')
+
+	def getCornerIncidenceMatrix(self):
+		'''Returns the matrix of shape (numUniqueVertices, 3*numTriangles) mapping per-corner quantities, ordered as
+		   getTriangleIndexArrayForUniqueVertices().ravel(), onto their sums over the corners at each vertex
+		'''
+		return self._getSparseTopology()[1]
 
-		invredlist = {}
-		for i in range(numverts):
-			for vertidxs in redlist[i]:
-				invredlist[vertidxs] = i
+	def _getTriangleCorners(self):
+		'''Returns the triangles on unique vertices and the float64 coordinates of their corners, shape (numTriangles, 3, 3)'''
+		triangles = self.getTriangleIndexArrayForUniqueVertices()
+		return triangles, self.getUniqueVertexArray().astype(np.float64)[triangles]
 
-		return [ (invredlist[v0],invredlist[v1],invredlist[v2]) for v0,v1,v2 in sum(self.getTrianglesOn3DIndices(), []) ]
+	def getCotangentLaplacian(self):
+		'''Returns the cotangent Laplacian L, with L @ x = sum_j w_ij (x_j - x_i) and w_ij = (cot a_ij + cot b_ij)/2,
+		   where a_ij and b_ij are the angles opposite to edge ij. Depends on the vertex coordinates, so it is cached
+		   until the vertices change.
+		'''
+		with self.cacheLock:
+			if self.cotangentLaplacian is None:
+				from scipy import sparse
+				triangles, corners = self._getTriangleCorners()
+				numUnique = len(self.getUniqueIndexArrays()[0])
+				cotangents = np.empty(triangles.shape)
+				for k in range(3):
+					e1 = corners[:, (k+1)%3] - corners[:, k]
+					e2 = corners[:, (k+2)%3] - corners[:, k]
+					sines = np.maximum(np.linalg.norm(np.cross(e1, e2), axis=-1), np.finfo(np.float64).tiny)
+					cotangents[:, k] = np.einsum('ij,ij->i', e1, e2)/sines
+				# the angle at corner k is opposite to the edge between corners k+1 and k+2
+				rows = np.concatenate([ triangles[:, (k+1)%3] for k in range(3) ])
+				cols = np.concatenate([ triangles[:, (k+2)%3] for k in range(3) ])
+				weights = sparse.coo_matrix((cotangents.T.ravel()/2., (rows, cols)), shape=(numUnique, numUnique)).tocsr()
+				weights = weights + weights.T
+				self.cotangentLaplacian = (weights - sparse.diags(np.asarray(weights.sum(axis=1)).ravel())).tocsr()
+			return self.cotangentLaplacian
+
+	def getVertexAreas(self):
+		'''Returns the barycentric area of each unique vertex, i.e. one third of the total area of its triangles'''
+		_, corners = self._getTriangleCorners()
+		areas = np.linalg.norm(np.cross(corners[:,1]-corners[:,0], corners[:,2]-corners[:,0]), axis=-1)/2.
+		return self.getCornerIncidenceMatrix() @ np.repeat(areas/3., 3)
+
+	def getVertexNormals(self):
+		'''Returns the unit normals at the unique vertices, computed as area weighted averages of the triangle normals.
+		   After local changes, only the normals of the triangles of the dirty tiles are recomputed and their changes
+		   are added to the cached sums.
+		'''
+		with self.cacheLock:
+			dirtyCells = self._takeDirtyCells('normals')
+			if self.vertexNormalSums is None or dirtyCells is None:
+				_, corners = self._getTriangleCorners()
+				self.faceNormals = np.cross(corners[:,1]-corners[:,0], corners[:,2]-corners[:,0]) # length is twice the area
+				self.vertexNormalSums = self.getCornerIncidenceMatrix() @ np.repeat(self.faceNormals, 3, axis=0)
+			elif dirtyCells.any():
+				triangleIDs = self._getDirtyTriangleIDs(dirtyCells)
+				corners = self.getVertices()[self.getTriangleArrayOnFlatIndices()[triangleIDs]].astype(np.float64)
+				faceNormals = np.cross(corners[:,1]-corners[:,0], corners[:,2]-corners[:,0])
+				np.add.at(self.vertexNormalSums, self.getTriangleIndexArrayForUniqueVertices()[triangleIDs].ravel(),
+				          np.repeat(faceNormals - self.faceNormals[triangleIDs], 3, axis=0))
+				self.faceNormals[triangleIDs] = faceNormals
+			return self.vertexNormalSums/np.linalg.norm(self.vertexNormalSums, axis=-1, keepdims=True)
+
+	def getMeanCurvature(self):
+		'''Returns the mean curvature at the unique vertices, estimated with the cotangent Laplacian.
+		   Positive for convex regions (1/R on a sphere of radius R).
+		'''
+		uniqueVertices = self.getUniqueVertexArray().astype(np.float64)
+		laplacian = self.getCotangentLaplacian() @ uniqueVertices
+		return -np.einsum('ij,ij->i', laplacian, self.getVertexNormals())/(2.*self.getVertexAreas())
+
+	def getGaussianCurvature(self):
+		'''Returns the Gaussian curvature at the unique vertices, estimated as the angle defect divided by the vertex area'''
+		_, corners = self._getTriangleCorners()
+		angles = np.empty(corners.shape[:2])
+		for k in range(3):
+			e1 = corners[:, (k+1)%3] - corners[:, k]
+			e2 = corners[:, (k+2)%3] - corners[:, k]
+			angles[:, k] = np.arctan2(np.linalg.norm(np.cross(e1, e2), axis=-1), np.einsum('ij,ij->i', e1, e2))
+		angleSums = self.getCornerIncidenceMatrix() @ angles.ravel()
+		return (2.*np.pi - angleSums)/self.getVertexAreas()
+
+	def smooth(self, iterations=1, stepSize=0.5, weights='uniform'):
+		'''Laplacian smoothing: each iteration moves every vertex stepSize of the way towards the weighted average
+		   of its neighbours. Weights are either 'uniform' or 'cotangent' (recomputed at every iteration).
+		'''
+		if weights not in ('uniform', 'cotangent'):
+			raise ValueError(f'Unrecognized weights {weights}')
+		_, rawToUnique, _ = self.getUniqueIndexArrays()
+		uniqueVertices = self.getUniqueVertexArray().astype(np.float64)
+		for _ in range(iterations):
+			if weights == 'uniform':
+				adjacency = self.getAdjacencyMatrix()
+				uniqueVertices += stepSize*((adjacency @ uniqueVertices)/np.asarray(adjacency.sum(axis=1)) - uniqueVertices)
+			else:
+				laplacian = self.getCotangentLaplacian()
+				uniqueVertices += stepSize*(laplacian @ uniqueVertices)/(-laplacian.diagonal())[:,np.newaxis]
+			self.setVertices(uniqueVertices[rawToUnique])
 
 	def getMinAngularFeatureSize(self):
-		'''Returns the minimum side length of any triangle in the mesh representation of the model'''
-		if not self.maxFeatureSize:
-			def angleBetween(face, j1, i1, j2, i2):
-				vec1 = self.vertices[face][j1][i1]
-				vec2 = self.vertices[face][j2][i2]
-				# result = np.arccos( np.dot(vec1, vec2) / (np.linalg.norm(vec1)*np.linalg.norm(vec2)) )
-				# if face == 0:
-				# 	print('At face {} angle between vectors {} and {} fas found to be {} pi radians'.format(face, (j1,i1), (j2,i2), result/np.pi))
-				return np.arccos( np.dot(vec1, vec2) / (np.linalg.norm(vec1)*np.linalg.norm(vec2)) )
-			facemaxs = []
-			for face in range(6):
-				rowmaxs = []
-				for j in range(self.q):
-					rowdists = []
-					for i in range(self.q):
-						rowdists.append(angleBetween(face, j, i, j, i+1))
-						rowdists.append(angleBetween(face, j, i, j+1, i))
-						rowdists.append(angleBetween(face, j, i, j+1, i+1))
-					rowdists.append(angleBetween(face, j, self.q, j+1, self.q))
-					rowmaxs.append(max(rowdists))
-				rowdists = []
-				for i in range(self.q):
-					rowdists.append(angleBetween(face, self.q, i, self.q, i+1))
-				rowmaxs.append(max(rowdists))
-				facemaxs.append(max(rowmaxs))
-			self.maxFeatureSize = max(facemaxs)
-		return self.maxFeatureSize
+		'''Returns the minimum side length of any triangle in the mesh representation of the model.
+		   The smallest cosine of the edge angles is kept per tile, so after local changes only the dirty tiles are recomputed.
+		'''
+		with self.cacheLock:
+			if not self.maxFeatureSize:
+				# angles are computed in float64 regardless of self.dtype
+				def normalized(vs):
+					vs = vs.astype(np.float64)
+					return vs/np.linalg.norm(vs, axis=-1, keepdims=True)
+				def cellMinCosines(d00, d01, d10, d11):
+					cosines = lambda dirs1, dirs2: np.einsum('...k,...k->...', dirs1, dirs2)
+					return np.minimum.reduce([ cosines(d00, d01), cosines(d10, d11),    # horizontal edges
+					                           cosines(d00, d10), cosines(d01, d11),    # vertical edges
+					                           cosines(d00, d11) ])                     # diagonal
+				dirtyCells = self._takeDirtyCells('featureSizes')
+				ts, numTiles = self.tileSize, self._numTiles()
+				if self.tileMinCosines is None or dirtyCells is None:
+					directions = normalized(self.vertices)
+					cells = np.full((6, numTiles*ts, numTiles*ts), np.inf)
+					cells[:, :self.q, :self.q] = cellMinCosines(directions[:, :-1, :-1], directions[:, :-1, 1:], directions[:, 1:, :-1], directions[:, 1:, 1:])
+					self.tileMinCosines = cells.reshape(6, numTiles, ts, numTiles, ts).min(axis=(2, 4))
+				elif dirtyCells.any():
+					f, a, b = np.nonzero(dirtyCells)
+					self.tileMinCosines[f, a//ts, b//ts] = np.inf
+					np.minimum.at(self.tileMinCosines, (f, a//ts, b//ts), cellMinCosines(normalized(self.vertices[f, a, b]), normalized(self.vertices[f, a, b+1]),
+					                                                                     normalized(self.vertices[f, a+1, b]), normalized(self.vertices[f, a+1, b+1])))
+				self.maxFeatureSize = float(np.arccos(np.clip(self.tileMinCosines.min(), -1., 1.)))
+			return self.maxFeatureSize
 
 	def upscale(self):
 		self.densifyTwofold()
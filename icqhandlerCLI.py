@@ -0,0 +1,220 @@
+''' Single command line entry point for the package, see bin/icqhandler.
+
+    Subcommands:
+      convert - validate and convert ICQ files (see batchConvert.py)
+      validate - validate ICQ files and print the summary table
+      render - render an ICQ file with POV-Ray
+      generate - generate a dataset of rendered synthetic asteroids
+      import - resample an OBJ, PLY or STL mesh into an ICQ file
+      dedupe - find near-duplicate shapes (see shapeDistances.py)
+
+    Only argparse is imported at startup. Modules needed by a subcommand are
+    imported when it runs, so the I/O subcommands never load the renderer or
+    scipy.
+'''
+
+import argparse
+
+def _number(string):
+	'''Parses integers as ints, so that they appear in file names without a decimal point'''
+	try:
+		return int(string)
+	except ValueError:
+		return float(string)
+
+def _convert(cliArgs):
+	import batchConvert
+	rows = batchConvert.batchConvert(cliArgs.inputs, outputFormat=cliArgs.outputFormat, outputDir=cliArgs.outputDir, processes=cliArgs.processes)
+	if cliArgs.summaryFileName:
+		batchConvert.saveSummary(rows, cliArgs.summaryFileName)
+	numInvalid = sum(1 for row in rows if row['valid'] is False)
+	numFailed = sum(1 for row in rows if row['status'] != 'ok')
+	print(f'Processed {len(rows)} files: {numInvalid} invalid, {numFailed} failed')
+	return 1 if numInvalid or numFailed else 0
+
+def _validate(cliArgs):
+	import batchConvert
+	rows = batchConvert.batchConvert(cliArgs.inputs, outputFormat='none', processes=cliArgs.processes)
+	print('\n'.join(batchConvert.formatSummary(rows)))
+	if cliArgs.summaryFileName:
+		batchConvert.saveSummary(rows, cliArgs.summaryFileName)
+	return 0 if all(row['valid'] and row['status'] == 'ok' for row in rows) else 1
+
+def _render(cliArgs):
+	import icq
+	ish = icq.ICQShape()
+	ish.readICQ(cliArgs.icqFileName)
+	if not ish.validate(exceptionIfInvalid=False):
+		print('WARNING: input ICQ file {} is invalid!'.format(cliArgs.icqFileName))
+
+	lightColor = [cliArgs.brightness]*3
+	rotationKwargs = {}
+	if cliArgs.rotationAxis is not None:
+		rotationKwargs = { 'rotationAxis': tuple(cliArgs.rotationAxis), 'rotationAngle': cliArgs.rotationAngle }
+	renderKwargs = { 'width': cliArgs.width, 'height': cliArgs.height, 'antialiasing': cliArgs.antialiasing }
+	if cliArgs.cartesian is not None:
+		camera = list(cliArgs.cartesian)
+		light = list(cliArgs.light) if cliArgs.light is not None else list(camera)
+		outfile = cliArgs.outfile or cliArgs.icqFileName[:-4] + '_x{}_y{}_z{}.png'.format(*camera)
+		ish.renderSceneCartesian(outfile, cameraLocation=camera, lightLocation=light, lightColor=lightColor,
+		                         backgroundColor=[0,0,0], objectColor=[0.5,0.5,0.5], **rotationKwargs, **renderKwargs)
+	else:
+		camR, camT, camP = cliArgs.spherical
+		lightR, lightT, lightP = cliArgs.light if cliArgs.light is not None else (camR, camT, camP)
+		outfile = cliArgs.outfile or cliArgs.icqFileName[:-4] + '_r{}_t{}_p{}.png'.format(camR, camT, camP)
+		ish.renderSceneSpherical(outfile, cameraR=camR, cameraTheta=camT, cameraPhi=camP,
+		                         lightR=lightR, lightTheta=lightT, lightPhi=lightP, lightColor=lightColor,
+		                         backgroundColor=(0,0,0), objectColor=(0.5,0.5,0.5), **rotationKwargs, **renderKwargs)
+	print('Rendered {} to {}'.format(cliArgs.icqFileName, outfile))
+	return 0
+
+def _generate(cliArgs):
+	import numpy as np
+	from datasetGenerator import DatasetGenerator
+	generatorKwargs = { 'dtype': cliArgs.dtype }
+	if cliArgs.baseResolution is not None:
+		generatorKwargs['baseResolution'] = cliArgs.baseResolution
+	if cliArgs.generator == 'arend':
+		from arendConesAsteroidGenerator import ArendConesAsteroidGenerator
+		astGen = ArendConesAsteroidGenerator(**generatorKwargs)
+	else:
+		from sphericalHarmonicsAsteroidGenerator import SphericalHarmonicsAsteroidGenerator
+		astGen = SphericalHarmonicsAsteroidGenerator(**generatorKwargs)
+	approachAnglesRange = [0, 2.*np.pi] if cliArgs.approachAngles is None else cliArgs.approachAngles
+	postProcessor = None
+	if cliArgs.channels or cliArgs.crop or cliArgs.downsample != 1 or cliArgs.outputSize or cliArgs.bitDepth != 8:
+		from framePostProcessing import FramePostProcessor
+		postProcessor = FramePostProcessor(channels=cliArgs.channels or 'rgb', crop=cliArgs.crop, cropMargin=cliArgs.cropMargin,
+		                                   downsample=cliArgs.downsample, outputSize=cliArgs.outputSize, bitDepth=cliArgs.bitDepth)
+	datasetGen = DatasetGenerator(astGen, workdir=cliArgs.workdir, randomSeed=cliArgs.seed,
+	                              numConditions=cliArgs.conditions, approachAnglesRange=approachAnglesRange,
+	                              distances=cliArgs.distances, numPhases=cliArgs.phases,
+	                              renderWidth=cliArgs.width, renderHeight=cliArgs.height,
+	                              threads=cliArgs.threads, outputMode=cliArgs.outputMode,
+	                              saveMassProperties=cliArgs.massProperties, shDegree=cliArgs.shDegree,
+	                              saveLabels=cliArgs.labels, postProcessor=postProcessor)
+	if cliArgs.instrument:
+		import instrumentation
+		instrumentation.enable(cliArgs.instrument, summaryInterval=cliArgs.summaryInterval)
+	try:
+		datasetGen.run(cliArgs.numAsteroids, onAsteroid=lambda record: print(f'ast id {record["id"]}'))
+	finally:
+		if cliArgs.instrument:
+			instrumentation.disable()
+	return 0
+
+def _import(cliArgs):
+	import meshImport
+	ish, report = meshImport.importMesh(cliArgs.meshFileName, cliArgs.q, center=cliArgs.center)
+	outfile = cliArgs.outfile or cliArgs.meshFileName[:cliArgs.meshFileName.rfind('.')] + '.icq'
+	ish.writeICQ(outfile)
+	print(f'Imported {cliArgs.meshFileName} to {outfile} at Q={cliArgs.q}, {report["nonStarShaped"]} directions not star-shaped')
+	return 1 if report['nonStarShaped'] and cliArgs.strict else 0
+
+def _dedupe(cliArgs):
+	import shapeDistances
+	rows = shapeDistances.dedupeReport(cliArgs.inputs, cliArgs.threshold, degree=cliArgs.degree, processes=cliArgs.processes)
+	print('\n'.join(shapeDistances.formatReport(rows)))
+	if cliArgs.summaryFileName:
+		shapeDistances.saveReport(rows, cliArgs.summaryFileName)
+	return 0
+
+def getParser():
+	parser = argparse.ArgumentParser(prog='icqhandler', description='Tools for 3d shapes in implicitly connected quadrilateral (ICQ) format')
+	subparsers = parser.add_subparsers(dest='command', required=True, metavar='command')
+
+	convert = subparsers.add_parser('convert', help='validate and convert ICQ files in parallel',
+	                                description='Validate and convert ICQ files. Inputs may be files, directories (searched recursively for *.icq) or glob patterns.')
+	convert.add_argument('inputs', metavar='input', type=str, nargs='+')
+	convert.add_argument('-f', '--format', dest='outputFormat', choices=['obj', 'ply', 'stl', 'icqb'], default='obj',
+	                     help='output format; icqb is a binary ICQ (.npy vertex array) (default: obj)')
+	convert.add_argument('-o', '--outdir', dest='outputDir', type=str, default=None,
+	                     help='directory for converted files, mirroring the input directory structure (default: next to the inputs)')
+	convert.add_argument('-j', '--processes', type=int, default=None, help='number of worker processes (default: number of CPUs)')
+	convert.add_argument('-s', '--summary', dest='summaryFileName', type=str, default=None, help='save the summary table to this file')
+	convert.set_defaults(func=_convert)
+
+	validate = subparsers.add_parser('validate', help='validate ICQ files and print a summary table')
+	validate.add_argument('inputs', metavar='input', type=str, nargs='+')
+	validate.add_argument('-j', '--processes', type=int, default=None, help='number of worker processes (default: number of CPUs)')
+	validate.add_argument('-s', '--summary', dest='summaryFileName', type=str, default=None, help='also save the summary table to this file')
+	validate.set_defaults(func=_validate)
+
+	render = subparsers.add_parser('render', help='render an ICQ file with POV-Ray')
+	render.add_argument('icqFileName', metavar='icqFileName', type=str)
+	cameraGroup = render.add_mutually_exclusive_group(required=True)
+	cameraGroup.add_argument('--cartesian', nargs=3, type=float, metavar=('X', 'Y', 'Z'), help='camera location in Cartesian coordinates')
+	cameraGroup.add_argument('--spherical', nargs=3, type=float, metavar=('R', 'THETA', 'PHI'), help='camera location in spherical (ISO) coordinates')
+	render.add_argument('--light', nargs=3, type=float, default=None, help='light source location, in the same coordinates as the camera (default: at the camera)')
+	render.add_argument('--brightness', type=float, default=5., help='light source brightness (default: 5)')
+	render.add_argument('--rotation-axis', dest='rotationAxis', nargs=3, type=float, default=None, metavar=('X', 'Y', 'Z'))
+	render.add_argument('--rotation-angle', dest='rotationAngle', type=float, default=0.)
+	render.add_argument('--width', type=int, default=500)
+	render.add_argument('--height', type=int, default=500)
+	render.add_argument('--antialiasing', type=float, default=0.01)
+	render.add_argument('-o', '--outfile', type=str, default=None, help='output PNG file (default: derived from the input name and camera location)')
+	render.set_defaults(func=_render)
+
+	generate = subparsers.add_parser('generate', help='generate a dataset of rendered synthetic asteroids (resumable)')
+	generate.add_argument('generator', choices=['arend', 'harmonics'], help='asteroid shape generator')
+	generate.add_argument('-n', '--num-asteroids', dest='numAsteroids', type=int, default=1000)
+	generate.add_argument('--workdir', type=str, default=None, help='output directory (default: current directory)')
+	generate.add_argument('--seed', type=int, default=42)
+	generate.add_argument('--base-resolution', dest='baseResolution', type=int, default=None,
+	                      help='number of twofold upscalings of the base shape (default: the one of the generator, 6 for arend, 4 for harmonics)')
+	generate.add_argument('--dtype', choices=['float64', 'float32'], default='float64', help='floating point type of the shape vertices (default: float64)')
+	generate.add_argument('--conditions', type=int, default=1, help='number of conditions per asteroid')
+	generate.add_argument('--approach-angles', dest='approachAngles', nargs=2, type=float, default=None, metavar=('MIN', 'MAX'),
+	                      help='range of spacecraft approach angles (default: 0 2pi)')
+	generate.add_argument('--distances', nargs='+', type=_number, default=[50])
+	generate.add_argument('--phases', type=int, default=8)
+	generate.add_argument('--width', type=int, default=600)
+	generate.add_argument('--height', type=int, default=600)
+	generate.add_argument('--threads', type=int, default=1)
+	generate.add_argument('--output-mode', dest='outputMode', choices=['directories', 'container'], default='directories')
+	generate.add_argument('--mass-properties', dest='massProperties', action='store_true',
+	                      help='also save volume, area, centroid and inertia tensor of each shape')
+	generate.add_argument('--sh-degree', dest='shDegree', type=int, default=None,
+	                      help='also save spherical harmonic coefficients of each shape up to this degree')
+	generate.add_argument('--labels', action='store_true',
+	                      help='also save projected vertices, their visibility, bounding boxes and silhouette masks of the renders')
+	generate.add_argument('--instrument', type=str, default=None, metavar='FILE',
+	                      help='append per-stage timings to FILE as JSON lines and print throughput summaries (see instrumentation.py)')
+	generate.add_argument('--summary-interval', dest='summaryInterval', type=float, default=60.,
+	                      help='seconds between throughput summaries with --instrument (default: 60)')
+	postProcessing = generate.add_argument_group('frame post-processing', 'applied to the renders before they are saved (see framePostProcessing.py)')
+	postProcessing.add_argument('--channels', choices=['gray', 'rgb'], default=None, help='channels of the saved frames (default: rgb)')
+	postProcessing.add_argument('--crop', choices=['margin', 'bbox'], default=None,
+	                            help='remove fixed margins or crop to the bounding box of the asteroid (default: no cropping)')
+	postProcessing.add_argument('--crop-margin', dest='cropMargin', type=int, default=0, help='margin removed or kept around the bounding box, in pixels')
+	postProcessing.add_argument('--downsample', type=int, default=1, help='area downsampling factor')
+	postProcessing.add_argument('--output-size', dest='outputSize', nargs=2, type=int, default=None, metavar=('WIDTH', 'HEIGHT'),
+	                            help='area resample the cropped frames to this size')
+	postProcessing.add_argument('--bit-depth', dest='bitDepth', type=int, choices=[8, 16], default=8)
+	generate.set_defaults(func=_generate)
+
+	meshImport = subparsers.add_parser('import', help='resample an OBJ, PLY or STL mesh into an ICQ file',
+	                                   description='Resample a closed triangle mesh into an ICQ file by casting rays from the center along the ICQ grid directions.')
+	meshImport.add_argument('meshFileName', metavar='meshFileName', type=str)
+	meshImport.add_argument('-q', type=int, default=64, help='resolution of the ICQ shape (default: 64)')
+	meshImport.add_argument('--center', nargs=3, type=float, default=[0., 0., 0.], metavar=('X', 'Y', 'Z'),
+	                        help='point from which the mesh is star-shaped (default: the origin)')
+	meshImport.add_argument('-o', '--outfile', type=str, default=None, help='output ICQ file (default: input name with .icq extension)')
+	meshImport.add_argument('--strict', action='store_true', help='exit with an error if the mesh is not star-shaped')
+	meshImport.set_defaults(func=_import)
+
+	dedupe = subparsers.add_parser('dedupe', help='find near-duplicate shapes in ICQ files or a dataset container',
+	                               description='Find pairs of shapes whose RMS radial difference is not above the threshold. '
+	                                           'Inputs are ICQ files, directories or glob patterns, or a single dataset container.')
+	dedupe.add_argument('inputs', metavar='input', type=str, nargs='+')
+	dedupe.add_argument('-t', '--threshold', type=float, required=True, help='largest RMS radial difference of near-duplicates')
+	dedupe.add_argument('--degree', type=int, default=4, help='degree of the spherical harmonic fingerprints (default: 4)')
+	dedupe.add_argument('-j', '--processes', type=int, default=None, help='number of worker processes (default: number of CPUs)')
+	dedupe.add_argument('-s', '--summary', dest='summaryFileName', type=str, default=None, help='also save the report to this file')
+	dedupe.set_defaults(func=_dedupe)
+
+	return parser
+
+def main(argv=None):
+	cliArgs = getParser().parse_args(argv)
+	return cliArgs.func(cliArgs)
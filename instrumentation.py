@@ -0,0 +1,187 @@
+''' Optional per-stage timing and throughput instrumentation of dataset
+    generation.
+
+    The generators, the Sculptor, the scene and render code of AbstractShape
+    and DatasetGenerator mark their stages with
+
+      with instrumentation.stage('sculptor.arendCones', cones=len(thetas)) as st:
+          ...
+          st.set(shape=shape)
+
+    and count their outputs with instrumentation.count('frames', n). While no
+    recorder is enabled, stage() returns a shared do-nothing context and
+    count() and adjustQueue() return at once, so the only cost is one
+    function call per stage; stages are never finer than one sculpting step
+    or one frame.
+
+    enable() installs a StageRecorder, which appends one JSON line per
+    completed stage to a file:
+
+      {"type": "stage", "stage": name, "start": s, "wall": s, "cpu": s,
+       "thread": name, "vertices": n, ...fields}
+
+    start is measured from enable(). cpu is the CPU time of the calling
+    thread (time.thread_time()), so it does not include POV-Ray, which runs
+    as a child process: wall - cpu of 'shape.renderScene' is the time spent
+    waiting for the renderer. vertices is the number of vertices of the shape
+    given with shape=, counted only when the record is written. Stages may be
+    nested, e.g. the upscaling steps within 'sculptor.sphericalHarmonic'.
+
+    Queue depths are tracked with adjustQueue(): DatasetGenerator adds the
+    frames of an asteroid to the 'render' queue before handing them to its
+    thread pool and every render takes one off, recording the number of
+    frames still waiting as queueDepth.
+
+    Every summaryInterval seconds the recorder prints the throughput of the
+    counters (asteroids/s, frames/s) since the previous summary and overall,
+    and writes it as a {"type": "summary", ...} line. disable() writes the
+    final summary and closes the file.
+'''
+
+import json
+import time
+import threading
+
+_recorder = None
+
+def _toJSON(value):
+	'''Converts NumPy scalars and arrays in stage fields'''
+	return value.tolist() if hasattr(value, 'tolist') else str(value)
+
+class _NullStage:
+	'''Stand-in for a Stage while instrumentation is disabled'''
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		return False
+
+	def __bool__(self):
+		return False
+
+	def set(self, **fields):
+		pass
+
+_nullStage = _NullStage()
+
+class Stage:
+	'''Context manager timing one stage; fields added with set() are written with the record'''
+	def __init__(self, recorder, name, fields):
+		self.recorder = recorder
+		self.name = name
+		self.fields = fields
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		self.cpuStart = time.thread_time()
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		wall = time.perf_counter() - self.start
+		cpu = time.thread_time() - self.cpuStart
+		if excType is not None:
+			self.fields['error'] = excType.__name__
+		self.recorder.recordStage(self.name, self.start, wall, cpu, self.fields)
+		return False
+
+	def set(self, **fields):
+		self.fields.update(fields)
+
+class StageRecorder:
+	'''Writes stage records and throughput summaries as JSON lines to a file (a path or an open text file).
+	   Safe to use from several threads.
+	'''
+	def __init__(self, outfile, summaryInterval=10., printSummary=True):
+		self.ownsFile = isinstance(outfile, str) or hasattr(outfile, '__fspath__')
+		self.outfile = open(outfile, 'a') if self.ownsFile else outfile
+		self.summaryInterval = summaryInterval
+		self.printSummary = printSummary
+		self.lock = threading.Lock()
+		self.startTime = time.perf_counter()
+		self.lastSummaryTime = self.startTime
+		self.counts = {}
+		self.lastSummaryCounts = {}
+		self.queues = {}
+
+	def _write(self, record):
+		# called with the lock held
+		self.outfile.write(json.dumps(record, default=_toJSON) + '\n')
+
+	def recordStage(self, name, start, wall, cpu, fields):
+		shape = fields.pop('shape', None)
+		if shape is not None:
+			fields['vertices'] = len(shape.getVertices())
+		record = { 'type': 'stage', 'stage': name, 'start': start - self.startTime, 'wall': wall, 'cpu': cpu,
+		           'thread': threading.current_thread().name, **fields }
+		with self.lock:
+			self._write(record)
+			self.outfile.flush() # keeps the records of an interrupted run
+
+	def count(self, name, n=1):
+		with self.lock:
+			self.counts[name] = self.counts.get(name, 0) + n
+			if time.perf_counter() - self.lastSummaryTime >= self.summaryInterval:
+				self._summarize()
+
+	def adjustQueue(self, name, delta):
+		'''Changes the depth of a queue by delta and returns the new depth'''
+		with self.lock:
+			self.queues[name] = self.queues.get(name, 0) + delta
+			return self.queues[name]
+
+	def _summarize(self):
+		# called with the lock held
+		now = time.perf_counter()
+		interval, elapsed = now - self.lastSummaryTime, now - self.startTime
+		rates = { name: (total - self.lastSummaryCounts.get(name, 0))/interval if interval > 0 else 0. for name, total in self.counts.items() }
+		overallRates = { name: total/elapsed if elapsed > 0 else 0. for name, total in self.counts.items() }
+		self._write({ 'type': 'summary', 'elapsed': elapsed, 'counts': dict(self.counts), 'rates': rates, 'overallRates': overallRates,
+		              'queues': dict(self.queues) })
+		self.outfile.flush()
+		if self.printSummary:
+			print(f'throughput after {elapsed:.1f} s: ' + ', '.join(f'{rates[name]:.3g} {name}/s ({overallRates[name]:.3g} overall, {total} total)'
+			                                                          for name, total in sorted(self.counts.items())), flush=True)
+		self.lastSummaryTime = now
+		self.lastSummaryCounts = dict(self.counts)
+
+	def close(self):
+		with self.lock:
+			self._summarize()
+			if self.ownsFile:
+				self.outfile.close()
+			else:
+				self.outfile.flush()
+
+def enable(outfile, summaryInterval=10., printSummary=True):
+	'''Starts recording stages to outfile, see StageRecorder. Returns the recorder.'''
+	global _recorder
+	disable()
+	_recorder = StageRecorder(outfile, summaryInterval=summaryInterval, printSummary=printSummary)
+	return _recorder
+
+def disable():
+	'''Stops recording, writing the final summary'''
+	global _recorder
+	recorder, _recorder = _recorder, None
+	if recorder is not None:
+		recorder.close()
+
+def isEnabled():
+	return _recorder is not None
+
+def stage(name, **fields):
+	'''Returns a context manager timing the stage, or a shared do-nothing one if instrumentation is disabled'''
+	if _recorder is None:
+		return _nullStage
+	return Stage(_recorder, name, fields)
+
+def count(name, n=1):
+	'''Adds n to the throughput counter name (e.g. 'asteroids', 'frames')'''
+	if _recorder is not None:
+		_recorder.count(name, n)
+
+def adjustQueue(name, delta):
+	'''Changes the depth of a queue by delta. Returns the new depth, or None if instrumentation is disabled.'''
+	if _recorder is None:
+		return None
+	return _recorder.adjustQueue(name, delta)
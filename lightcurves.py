@@ -0,0 +1,113 @@
+''' Disk-integrated lightcurves of shapes, computed from per-facet
+    illumination and visibility without rendering any images.
+
+    The flux scattered towards the observer is the sum over facets
+
+      F = sum_f A_f law(mu0_f, mu_f, cos(alpha))
+
+    over the facets that are both lit (mu0 > 0) and visible (mu > 0), where
+    A_f is the facet area, mu0 and mu are the cosines of the angles between
+    the facet normal and the directions to the light source and to the
+    observer and alpha is the phase angle. The directions are taken from the
+    origin, i.e. light source and observer are assumed to be far from the
+    shape compared to its size. The flux is for unit irradiance and does not
+    decrease with the observer distance.
+
+    Spatial states follow the conventions of the dataset generators and of
+    SpatialStatesIterator.toArray(): the shape is rotated as by getScene()
+    (see abstractShape.scene_rotation_matrices()), the observer is at
+    'cameraLocation' and the light source at 'lightLocation'.
+
+    Without self-shadowing, fluxes of all states are computed as products of
+    (facets x states) matrices, which is exact for convex shapes. With
+    selfShadowing=True, rays are cast from the lit and visible facets
+    towards the light source and the observer through the bounding volume
+    hierarchy of the shape, and facets with blocked rays are excluded.
+    Facets that are faces of the convex hull of the shape cannot be shadowed,
+    so rays are only cast from the remaining ones; self-shadowing is thus
+    cheap for nearly convex shapes.
+'''
+
+import numpy as np
+
+from abstractShape import scene_rotation_matrices
+
+def lambert(mu0, mu, cosAlpha):
+	return mu0*mu
+
+def lommelSeeliger(mu0, mu, cosAlpha):
+	return mu0*mu/(mu0 + mu)
+
+def lambertPhong(mu0, mu, cosAlpha, diffuse=0.6, phong=0.1, phongSize=40.):
+	'''Approximates the texture of getScene(): POV-Ray's default diffuse coefficient plus a Phong highlight that
+	   depends on the angle between the mirrored light direction and the direction to the observer
+	'''
+	reflectedCosines = np.maximum(2.*mu0*mu - cosAlpha, 0.)
+	return mu*(diffuse*mu0 + phong*reflectedCosines**phongSize)
+
+scatteringLaws = { 'lambert': lambert, 'lommelSeeliger': lommelSeeliger, 'lambertPhong': lambertPhong }
+
+def getFacetGeometry(shape):
+	'''Returns facet centroids, unit normals and areas of a shape, in float64'''
+	corners = shape.getUniqueVertexArray().astype(np.float64)[shape.getTriangleIndexArrayForUniqueVertices()]
+	crosses = np.cross(corners[:,1]-corners[:,0], corners[:,2]-corners[:,0])
+	doubleAreas = np.linalg.norm(crosses, axis=-1)
+	return corners.mean(axis=1), crosses/doubleAreas[:,np.newaxis], doubleAreas/2.
+
+def getBodyFrameDirections(states):
+	'''Returns unit directions towards the light source and the observer in the frame of the (rotated) shape for an
+	   array of states (see SpatialStatesIterator.toArray()), each of shape (N, 3)
+	'''
+	rotations = scene_rotation_matrices(states['axis'], states['phase'])
+	normalize = lambda vs: vs/np.linalg.norm(vs, axis=-1, keepdims=True)
+	# rotations take the shape frame to the scene frame, so row vectors are taken back by multiplying on the right
+	lightDirections = np.einsum('ni,nij->nj', normalize(np.broadcast_to(states['lightLocation'], (len(states), 3))), rotations)
+	observerDirections = np.einsum('ni,nij->nj', normalize(np.broadcast_to(states['cameraLocation'], (len(states), 3))), rotations)
+	return lightDirections, observerDirections
+
+def getConvexHullFacets(shape):
+	'''Tells which facets of a shape (in the order of getTriangleIndexArrayForUniqueVertices()) are faces of its convex hull'''
+	from scipy.spatial import ConvexHull # imported here to keep scipy out of the import time of the module
+	vertices = shape.getUniqueVertexArray().astype(np.float64)
+	triangles = shape.getTriangleIndexArrayForUniqueVertices()
+	encode = lambda tris: np.sort(tris, axis=1).astype(np.int64) @ np.array([ len(vertices)**2, len(vertices), 1 ], dtype=np.int64)
+	return np.isin(encode(triangles), encode(ConvexHull(vertices).simplices))
+
+def _unshadowed(shape, centroids, normals, facets, directions, offset):
+	'''Tells which rays from the facet centroids in the given directions escape the shape'''
+	_, hitIDs, _ = shape.getBoundingVolumeHierarchy().intersectRays(centroids[facets] + offset*normals[facets], directions)
+	return hitIDs < 0
+
+def computeLightcurve(shape, states, scatteringLaw='lambert', selfShadowing=False, blockSize=None, **lawParameters):
+	'''Returns the fluxes of the shape for an array of spatial states (SpatialStatesIterator.toArray(), or the
+	   iterator itself). scatteringLaw is a name from scatteringLaws or a function (mu0, mu, cosAlpha) -> reflectance
+	   times mu; lawParameters are passed to it. States are processed in blocks of blockSize to bound memory.
+	'''
+	if not isinstance(states, np.ndarray):
+		states = states.toArray()
+	law = scatteringLaws[scatteringLaw] if isinstance(scatteringLaw, str) else scatteringLaw
+	centroids, normals, areas = getFacetGeometry(shape)
+	lightDirections, observerDirections = getBodyFrameDirections(states)
+	cosAlphas = np.einsum('ni,ni->n', lightDirections, observerDirections)
+	offset = 1e-3*np.sqrt(areas.mean()) # lifts the shadow rays off their facets
+	if selfShadowing:
+		shadowable = ~getConvexHullFacets(shape)
+	if blockSize is None:
+		blockSize = max(1, 2**22//len(areas))
+
+	fluxes = np.empty(len(states))
+	for start in range(0, len(states), blockSize):
+		block = slice(start, start+blockSize)
+		mu0s = normals @ lightDirections[block].T # shape (facets, states)
+		mus = normals @ observerDirections[block].T
+		contributing = (mu0s > 0.) & (mus > 0.)
+		if selfShadowing:
+			facets, blockStates = np.nonzero(contributing & shadowable[:,np.newaxis])
+			lit = _unshadowed(shape, centroids, normals, facets, lightDirections[block][blockStates], offset)
+			seen = _unshadowed(shape, centroids, normals, facets[lit], observerDirections[block][blockStates[lit]], offset)
+			contributing[facets, blockStates] = False
+			contributing[facets[lit][seen], blockStates[lit][seen]] = True
+		with np.errstate(divide='ignore', invalid='ignore'):
+			reflectances = np.where(contributing, law(mu0s, mus, cosAlphas[np.newaxis,block], **lawParameters), 0.)
+		fluxes[block] = areas @ reflectances
+	return fluxes
@@ -0,0 +1,186 @@
+''' A module for importing arbitrary closed triangle meshes (Wavefront OBJ,
+    PLY or STL files, or vertex and triangle arrays) into ICQ format.
+
+    The mesh is resampled radially: for every vertex direction of the ICQ
+    grid at the chosen Q (see ICQShape.getGridDirections()) a ray is cast
+    from the center (the origin by default) and intersected with the mesh,
+    all rays at once through a BoundingVolumeHierarchy. The ICQ vertex is
+    placed at the intersection.
+
+    ICQ can only represent shapes that are star-shaped with respect to the
+    center, i.e. that are crossed exactly once by every ray from it. Rays
+    are therefore continued past each intersection, counting the crossings.
+    Where a ray crosses the surface more than once, the outermost crossing
+    is used and the direction is reported as not star-shaped. Rays that do
+    not cross the surface at all mean that the center is outside of the
+    mesh or that the mesh has holes, and the import fails.
+'''
+
+import struct
+import numpy as np
+
+import icq
+from boundingVolumeHierarchy import BoundingVolumeHierarchy
+
+def readOBJ(objFileName):
+	'''Reads vertices and faces of a Wavefront OBJ file. Polygons are split into triangle fans. Returns arrays of
+	   vertices (N, 3) and of zero based vertex indices of the triangles (M, 3).
+	'''
+	vertices, triangles = [], []
+	with open(objFileName, 'r') as objFile:
+		for line in objFile:
+			fields = line.split()
+			if not fields:
+				continue
+			if fields[0] == 'v':
+				vertices.append(fields[1:4])
+			elif fields[0] == 'f':
+				# entries may be v, v/vt, v//vn or v/vt/vn; negative indices count from the end
+				indices = [ int(field.split('/')[0]) for field in fields[1:] ]
+				indices = [ idx-1 if idx > 0 else len(vertices)+idx for idx in indices ]
+				triangles.extend([ indices[0], indices[k], indices[k+1] ] for k in range(1, len(indices)-1))
+	return np.array(vertices, dtype=np.float64).reshape(-1, 3), np.array(triangles, dtype=np.int64).reshape(-1, 3)
+
+_plyTypes = { 'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1', 'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+              'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4', 'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8' }
+
+def readPLY(plyFileName):
+	'''Reads the vertex coordinates and the faces of an ASCII or binary PLY file, such as the ones written by
+	   AbstractShape.writePLY(). Returns arrays like readOBJ().
+	'''
+	with open(plyFileName, 'rb') as plyFile:
+		if plyFile.readline().strip() != b'ply':
+			raise ValueError(f'{plyFileName} is not a PLY file')
+		elements = [] # [name, count, [(property name, type or (count type, item type))]]
+		while True:
+			fields = plyFile.readline().decode('ascii').split()
+			if not fields or fields[0] in ('comment', 'obj_info'):
+				continue
+			if fields[0] == 'format':
+				fileFormat = fields[1]
+			elif fields[0] == 'element':
+				elements.append([ fields[1], int(fields[2]), [] ])
+			elif fields[0] == 'property':
+				elements[-1][2].append((fields[-1], (fields[2], fields[3]) if fields[1] == 'list' else fields[1]))
+			elif fields[0] == 'end_header':
+				break
+		byteOrder = { 'binary_little_endian': '<', 'binary_big_endian': '>' }.get(fileFormat)
+		data = plyFile.read()
+
+	vertices, triangles = None, None
+	tokens = data.split() if byteOrder is None else None
+	offset = 0
+	for name, count, properties in elements:
+		if byteOrder is None:
+			rows = []
+			for _ in range(count):
+				row = []
+				for _, propType in properties:
+					if isinstance(propType, tuple):
+						listLength = int(tokens[offset])
+						row.append(tokens[offset+1:offset+1+listLength])
+						offset += 1+listLength
+					else:
+						row.append(tokens[offset])
+						offset += 1
+				rows.append(row)
+			columns = { propName: [ row[k] for row in rows ] for k, (propName, _) in enumerate(properties) }
+		elif not any(isinstance(propType, tuple) for _, propType in properties):
+			recordType = np.dtype([ (propName, byteOrder + _plyTypes[propType]) for propName, propType in properties ])
+			columns = np.frombuffer(data, dtype=recordType, count=count, offset=offset)
+			offset += count*recordType.itemsize
+		else:
+			# lists of equal length, as in triangle meshes, are read with a structured dtype; others one by one
+			(propName, (countType, itemType)), = properties
+			countType, itemType = np.dtype(byteOrder + _plyTypes[countType]), np.dtype(byteOrder + _plyTypes[itemType])
+			firstLength = int(np.frombuffer(data, dtype=countType, count=1, offset=offset)[0]) if count else 0
+			recordType = np.dtype([ ('count', countType), ('items', itemType, (firstLength,)) ])
+			records = np.frombuffer(data, dtype=recordType, count=count, offset=offset) if len(data) >= offset + count*recordType.itemsize else None
+			if records is not None and np.all(records['count'] == firstLength):
+				columns = { propName: records['items'] }
+				offset += count*recordType.itemsize
+			else:
+				lists = []
+				for _ in range(count):
+					listLength = int(np.frombuffer(data, dtype=countType, count=1, offset=offset)[0])
+					lists.append(np.frombuffer(data, dtype=itemType, count=listLength, offset=offset+countType.itemsize))
+					offset += countType.itemsize + listLength*itemType.itemsize
+				columns = { propName: lists }
+
+		if name == 'vertex':
+			vertices = np.stack([ np.asarray(columns[c], dtype=np.float64) for c in 'xyz' ], axis=-1)
+		elif name == 'face':
+			propName = properties[0][0]
+			triangles = [ [ int(p[0]), int(p[k]), int(p[k+1]) ] for p in columns[propName] for k in range(1, len(p)-1) ] \
+			            if isinstance(columns[propName], list) or columns[propName].dtype == object or columns[propName].shape[1] != 3 \
+			            else columns[propName]
+	if vertices is None or triangles is None:
+		raise ValueError(f'{plyFileName} does not contain vertex and face elements')
+	return vertices, np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+
+def readSTL(stlFileName):
+	'''Reads an ASCII or binary STL file. STL does not share vertices between facets, so every triangle gets three
+	   vertices of its own. Returns arrays like readOBJ().
+	'''
+	with open(stlFileName, 'rb') as stlFile:
+		data = stlFile.read()
+	numFacets = struct.unpack('<I', data[80:84])[0] if len(data) >= 84 else -1
+	if len(data) == 84 + 50*numFacets:
+		records = np.frombuffer(data, dtype=[('normal', '<f4', (3,)), ('vertices', '<f4', (3,3)), ('attributes', '<u2')], count=numFacets, offset=84)
+		vertices = records['vertices'].astype(np.float64).reshape(-1, 3)
+	else:
+		lines = data.decode('ascii').splitlines()
+		vertices = np.array([ line.split()[1:4] for line in lines if line.strip().startswith('vertex') ], dtype=np.float64).reshape(-1, 3)
+	return vertices, np.arange(len(vertices), dtype=np.int64).reshape(-1, 3)
+
+meshReaders = { '.obj': readOBJ, '.ply': readPLY, '.stl': readSTL }
+
+def readMesh(meshFileName):
+	'''Reads a mesh with the reader chosen by the file extension'''
+	extension = str(meshFileName)[str(meshFileName).rfind('.'):].lower()
+	if extension not in meshReaders:
+		raise ValueError(f'Unrecognized mesh file extension {extension}, supported: {", ".join(meshReaders)}')
+	return meshReaders[extension](meshFileName)
+
+def importMesh(mesh, q, center=(0.,0.,0.), dtype=np.float64, maxCrossings=64):
+	'''Resamples a closed triangle mesh onto the ICQ grid of resolution q, see the module description.
+	   mesh is a file name or a pair of arrays (vertices, triangles). Returns the ICQShape and a report dict with
+	     crossings - number of surface crossings of the ray towards each unique vertex of the shape
+	                 (ordered as in ICQShape.getUniqueVertexArray())
+	     nonStarShaped - number of directions with more than one crossing
+	     nonStarShapedDirections - unit vectors of those directions, shape (nonStarShaped, 3)
+	'''
+	vertices, triangles = readMesh(mesh) if isinstance(mesh, (str, bytes)) or hasattr(mesh, '__fspath__') else mesh
+	center = np.asarray(center, dtype=np.float64)
+	vertices = np.asarray(vertices, dtype=np.float64) - center
+
+	ish = icq.ICQShape(dtype=dtype)
+	ish.q = q
+	uniqueToRaw, rawToUnique, _ = ish.getUniqueIndexArrays()
+	directions = ish.getGridDirections().reshape(-1, 3)[uniqueToRaw]
+
+	bvh = BoundingVolumeHierarchy.fromArrays(vertices, triangles)
+	step = 1e-9*np.abs(vertices).max() # moves the continued rays past the last intersection
+	radii = np.zeros(len(directions))
+	crossings = np.zeros(len(directions), dtype=np.int64)
+	active = np.arange(len(directions))
+	for _ in range(maxCrossings):
+		starts = radii[active] + step*(crossings[active] > 0)
+		distances, triangleIDs, _ = bvh.intersectRays(starts[:,np.newaxis]*directions[active], directions[active])
+		hit = triangleIDs >= 0
+		active = active[hit]
+		radii[active] = starts[hit] + distances[hit]
+		crossings[active] += 1
+		if len(active) == 0:
+			break
+
+	if np.any(crossings == 0):
+		raise ValueError(f'{np.count_nonzero(crossings == 0)} rays from the center {tuple(center)} do not cross the mesh: '
+		                 'the center is outside of the mesh or the mesh is not closed')
+	nonStarShaped = crossings > 1
+	if np.any(nonStarShaped):
+		print(f'WARNING: the mesh is not star-shaped with respect to {tuple(center)}, {np.count_nonzero(nonStarShaped)} of {len(directions)} '
+		      'rays cross it more than once; outermost crossings are used')
+
+	ish.setVertexArray((center + radii[:,np.newaxis]*directions)[rawToUnique].reshape(6, q+1, q+1, 3))
+	return ish, { 'crossings': crossings, 'nonStarShaped': int(np.count_nonzero(nonStarShaped)), 'nonStarShapedDirections': directions[nonStarShaped] }
@@ -0,0 +1,140 @@
+''' Gravitational field of a homogeneous polyhedron after Werner and Scheeres
+    (1997), "Exterior gravitation of a polyhedron derived and compared with
+    harmonic and mascon gravitation representations of asteroid 4769
+    Castalia".
+
+    For a closed, outward oriented triangle mesh of constant density sigma,
+    potential, acceleration and Laplacian at a point r are
+
+      U = G*sigma/2 * ( sum_e r_e.E_e.r_e L_e - sum_f r_f.F_f.r_f w_f )
+      g = -G*sigma * ( sum_e E_e.r_e L_e - sum_f F_f.r_f w_f )
+      lap U = -G*sigma * sum_f w_f
+
+    with the sign convention of the paper, U = GM/|r| far from the body, and
+    where r_e and r_f are vectors from r to any point of edge e or facet f,
+    F_f = n_f n_f^T is the facet dyad, E_e = n_A n_eA^T + n_B n_eB^T is the
+    edge dyad built from the normals of the two facets A, B sharing the edge
+    and the in-plane edge normals, L_e is the potential of a wire along the
+    edge and w_f is the signed solid angle subtended by facet f. The sum of
+    the solid angles is 4pi inside the polyhedron and zero outside.
+
+    The dyads depend only on the shape and are computed once per
+    PolyhedronGravity object. Queries are vectorised over facets and edges
+    for blocks of query points; large query sets can be split across a
+    process pool. With lengths in metres and density in kg/m^3 the results
+    are in SI units.
+'''
+
+import numpy as np
+from multiprocessing import Pool
+
+gravitationalConstant = 6.67430e-11 # m^3 kg^-1 s^-2
+
+_workerModel = None # PolyhedronGravity of a worker process, see PolyhedronGravity.evaluate()
+
+def _initWorker(model):
+	global _workerModel
+	_workerModel = model
+
+def _evaluateInWorker(points):
+	return _workerModel.evaluate(points, processes=1)
+
+class PolyhedronGravity:
+	'''Constant density polyhedron gravity model of a shape. The shape (any AbstractShape) is read once on construction;
+	   the model does not follow subsequent changes of the shape.
+	'''
+	def __init__(self, shape, density=1., G=gravitationalConstant, maxBlockElements=2**20):
+		self.density = density
+		self.G = G
+		self.maxBlockElements = maxBlockElements # bounds the size of the (points x edges) temporary arrays
+		self.vertices = shape.getUniqueVertexArray().astype(np.float64)
+		self.triangles = shape.getTriangleIndexArrayForUniqueVertices().astype(np.int64)
+
+		corners = self.vertices[self.triangles]
+		normals = np.cross(corners[:,1]-corners[:,0], corners[:,2]-corners[:,0])
+		self.facetNormals = normals/np.linalg.norm(normals, axis=-1, keepdims=True) # F_f = n_f n_f^T
+
+		# each edge appears once in each of its two facets, in opposite directions
+		starts = self.triangles.ravel()
+		ends = np.roll(self.triangles, -1, axis=1).ravel()
+		facets = np.repeat(np.arange(len(self.triangles)), 3)
+		order = np.lexsort((np.maximum(starts, ends), np.minimum(starts, ends)))
+		if len(order) % 2 or np.any(np.minimum(starts, ends)[order[0::2]] != np.minimum(starts, ends)[order[1::2]]) \
+		                  or np.any(np.maximum(starts, ends)[order[0::2]] != np.maximum(starts, ends)[order[1::2]]):
+			raise ValueError('The mesh is not closed: every edge must be shared by exactly two triangles')
+		sideA, sideB = order[0::2], order[1::2]
+		self.edges = np.stack([ starts[sideA], ends[sideA] ], axis=-1)
+		edgeVectors = self.vertices[ends] - self.vertices[starts]
+		edgeNormals = np.cross(edgeVectors, self.facetNormals[facets]) # in-plane, pointing out of the facet
+		edgeNormals /= np.linalg.norm(edgeNormals, axis=-1, keepdims=True)
+		self.edgeDyads = np.einsum('ei,ej->eij', self.facetNormals[facets[sideA]], edgeNormals[sideA]) + \
+		                 np.einsum('ei,ej->eij', self.facetNormals[facets[sideB]], edgeNormals[sideB])
+		self.edgeLengths = np.linalg.norm(edgeVectors[sideA], axis=-1)
+
+	def getBlockSize(self):
+		return max(1, self.maxBlockElements//len(self.edges))
+
+	def _evaluateBlock(self, points):
+		dot = lambda u, v: np.einsum('...i,...i->...', u, v)
+		toVertices = self.vertices[np.newaxis] - points[:,np.newaxis] # shape (P, V, 3)
+		distances = np.sqrt(dot(toVertices, toVertices))
+
+		edgeStarts = toVertices[:, self.edges[:,0]] # r_e, shape (P, E, 3)
+		distSums = distances[:, self.edges[:,0]] + distances[:, self.edges[:,1]]
+		wires = np.log((distSums + self.edgeLengths)/(distSums - self.edgeLengths)) # L_e
+		edgeTerms = np.matmul(self.edgeDyads, edgeStarts[..., np.newaxis])[..., 0] # E_e.r_e
+
+		r1, r2, r3 = ( toVertices[:, self.triangles[:,k]] for k in range(3) )
+		n1, n2, n3 = ( distances[:, self.triangles[:,k]] for k in range(3) )
+		solidAngles = 2.*np.arctan2(dot(r1, np.cross(r2, r3)), n1*n2*n3 + n1*dot(r2, r3) + n2*dot(r3, r1) + n3*dot(r1, r2)) # w_f
+		facetProjections = dot(self.facetNormals, r1) # n_f.r_f, so that F_f.r_f = n_f (n_f.r_f)
+
+		scale = self.G*self.density
+		potentials = scale/2.*(np.einsum('pe,pe->p', dot(edgeStarts, edgeTerms), wires) - np.einsum('pf,pf->p', facetProjections**2, solidAngles))
+		accelerations = -scale*(np.matmul(wires[:,np.newaxis], edgeTerms)[:,0] - np.matmul(facetProjections*solidAngles, self.facetNormals))
+		laplacians = -scale*solidAngles.sum(axis=1)
+		return potentials, accelerations, laplacians
+
+	def evaluate(self, points, processes=1):
+		'''Returns potentials (shape (P,)), accelerations (P, 3) and Laplacians of the potential (P,) at an array of
+		   P query points. With processes > 1, blocks of points are evaluated by a pool of worker processes.
+		   Points on edges or vertices of the mesh give infinite wire potentials and must be avoided.
+		'''
+		points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+		blockSize = self.getBlockSize()
+		blocks = [ points[start:start+blockSize] for start in range(0, len(points), blockSize) ]
+		if processes is None or processes > 1:
+			with Pool(processes, initializer=_initWorker, initargs=(self,)) as pool:
+				results = pool.map(_evaluateInWorker, blocks)
+		else:
+			results = [ self._evaluateBlock(block) for block in blocks ]
+		if not results:
+			return np.empty(0), np.empty((0, 3)), np.empty(0)
+		return tuple(np.concatenate(arrays) for arrays in zip(*results))
+
+	def getPotential(self, points, processes=1):
+		return self.evaluate(points, processes=processes)[0]
+
+	def getAcceleration(self, points, processes=1):
+		return self.evaluate(points, processes=processes)[1]
+
+	def isInside(self, points, processes=1):
+		'''Tells which points are inside the polyhedron, based on the Laplacian of the potential (-4pi*G*density inside, 0 outside)'''
+		return self.evaluate(points, processes=processes)[2] < -2.*np.pi*self.G*self.density
+
+	def getSurfaceAccelerations(self, angularVelocity=None, processes=1):
+		'''Returns the facet centroids and the accelerations at them. If the angular velocity vector of the body is
+		   given, the centrifugal acceleration in the body frame is included.
+		'''
+		centroids = self.vertices[self.triangles].mean(axis=1)
+		accelerations = self.evaluate(centroids, processes=processes)[1]
+		if angularVelocity is not None:
+			angularVelocity = np.asarray(angularVelocity, dtype=np.float64)
+			accelerations -= np.cross(angularVelocity, np.cross(angularVelocity, centroids))
+		return centroids, accelerations
+
+	def getSurfaceSlopes(self, angularVelocity=None, processes=1):
+		'''Returns the angle between the inward facet normal and the surface acceleration at each facet centroid, in radians'''
+		_, accelerations = self.getSurfaceAccelerations(angularVelocity=angularVelocity, processes=processes)
+		cosines = -np.einsum('fi,fi->f', self.facetNormals, accelerations)/np.linalg.norm(accelerations, axis=-1)
+		return np.arccos(np.clip(cosines, -1., 1.))
@@ -1,5 +1,6 @@
 import numpy as np
-from scipy.special import sph_harm
+
+import instrumentation
 
 _sqrt2 = np.sqrt(2.)
 
@@ -28,6 +29,7 @@ def real_sph_harm(m, n, theta, phi):
 	'''Real spherical harmonics based on complex ones from scipy.See
 	   https://en.wikipedia.org/wiki/Spherical_harmonics#Real_form
 	'''
+	from scipy.special import sph_harm # imported here to keep scipy out of the import time of the module
 	if m==0:
 		return np.real(sph_harm(0, n, theta, phi))
 	else:
@@ -39,8 +41,14 @@ def real_sph_harm(m, n, theta, phi):
 	raise ValueError('Unacceptable value of m: {}'.format(m))
 
 class Sculptor:
-	def __init__(self, baseShape):
+	'''Applies transformations to a shape. If dtype is given, the shape is converted to store its vertices
+	   in that floating point type (see ICQShape). Transformations are always computed in float64 and
+	   rounded to the storage type of the shape when the new vertices are set.
+	'''
+	def __init__(self, baseShape, dtype=None):
 		self.shape = baseShape
+		if dtype is not None:
+			self.shape.setDtype(dtype)
 
 	def getShape(self):
 		return self.shape
@@ -49,7 +57,14 @@ class Sculptor:
 		self.shape.renderSceneSpherical(outfile, **kwargs)
 
 	def upscaleShape(self):
-		self.shape.upscale()
+		with instrumentation.stage('sculptor.upscale') as st:
+			self.shape.upscale()
+			st.set(shape=self.shape)
+
+	def smoothShape(self, iterations=1, stepSize=0.5, weights='uniform'):
+		'''Laplacian smoothing of the shape, e.g. to soften the ridges left by cone perturbations. See ICQShape.smooth().'''
+		with instrumentation.stage('sculptor.smooth', iterations=iterations, shape=self.shape):
+			self.shape.smooth(iterations=iterations, stepSize=stepSize, weights=weights)
 
 	def adaptiveUpscale(self, angularFeatureSize, margin=2.):
 		while margin*self.shape.getMinAngularFeatureSize() > angularFeatureSize:
@@ -61,11 +76,21 @@ class Sculptor:
 			newVertices.append(shaperFunc(v))
 		self.shape.setVertices(newVertices)
 
+	def applyArrayShaperFunction(self, shaperFunc, blockSize=262144):
+		'''Like applyShaperFunction(), but shaperFunc transforms many vertices at once: it takes
+		   and returns an array of shape (numVertices, 3). The input is in float64. Vertices are
+		   passed in blocks of at most blockSize to bound the memory taken by temporary arrays.
+		'''
+		verts = self.shape.getVertices()
+		newVertices = np.empty(verts.shape, dtype=verts.dtype)
+		for start in range(0, len(verts), blockSize):
+			newVertices[start:start+blockSize] = shaperFunc(np.asarray(verts[start:start+blockSize], dtype=np.float64))
+		self.shape.setVertices(newVertices)
+
 	def rollIntoABall(self, radius=1.):
-		def normalize(v):
-			npv = np.array(v)
-			return tuple(npv*radius/np.linalg.norm(npv))
-		self.applyShaperFunction(normalize)
+		def normalize(vs):
+			return vs*radius/np.linalg.norm(vs, axis=1, keepdims=True)
+		self.applyArrayShaperFunction(normalize)
 
 	def rollIntoAConcentricEllipsoid(self, a, b, c):
 		def scaleVertexAppropriately(vertex):
@@ -90,46 +115,50 @@ class Sculptor:
 			shAngularFeatureSize = min(np.pi/(n-np.abs(m)+1), 2*np.pi if m==0 else np.pi/np.abs(m)) # ...they vanish are l-m parallels of latitude and 2m meridians...
 			                                                                   # http://mathworld.wolfram.com/TesseralHarmonic.html
 			self.adaptiveUpscale(shAngularFeatureSize, margin=upscaleMargin)
-		def scaleVertexAppropriately(vertex):
-			vmag = np.linalg.norm(vertex)
-			vtheta = np.arccos(vertex[2]/vmag)
-			vphi = np.arctan(vertex[1]/vmag)
+		def scaleVerticesAppropriately(vs):
+			vmag = np.linalg.norm(vs, axis=1)
+			vtheta = np.arccos(vs[:,2]/vmag)
+			vphi = np.arctan(vs[:,1]/vmag)
 			newmag = 1. + magnitude*real_sph_harm(m, n, vphi, vtheta)/vmag # the coordinates are swapped because code follows physical (ISO) convention while scikit follows mathematical convention
-#			print('old mag = {}, new mag = {}'.format(vmag, vmag*newmag))
-			return tuple( v*newmag for v in vertex )
-		self.applyShaperFunction(scaleVertexAppropriately)
-
-	def shapeWithArendCones(self, thetas, phis, radii, magnitudes, baseRadius=1., coneType='linear'):
+			return vs*newmag[:,np.newaxis]
+		with instrumentation.stage('sculptor.sphericalHarmonic', degree=n, order=m, shape=self.shape):
+			self.applyArrayShaperFunction(scaleVerticesAppropriately)
+
+	def shapeWithArendCones(self, thetas, phis, radii, magnitudes, baseRadius=1., coneType='linear', blockSize=262144):
+		'''Vertices are processed in blocks of blockSize, which bounds the memory taken by temporary arrays for large shapes'''
+		if coneType not in ('gaussian', 'linear', 'quadratic', 'linearWithFillet'):
+			raise ValueError(f'sculptor.shapeWithArendCones: unknown cone type {coneType}')
 		self.rollIntoABall(radius=1.)
-		verts = self.shape.getVertices()
-		numVerts = len(verts)
 		numCones = len(thetas)
-
-		npverts = np.array(verts, dtype=np.float)
-		weights = np.ones(numVerts)
-		for nc in range(numCones):
-			dirvec = np.array([np.sin(thetas[nc])*np.cos(phis[nc]), np.sin(thetas[nc])*np.sin(phis[nc]), np.cos(thetas[nc])], dtype=np.float)
-
-			if coneType == 'gaussian':
-				pows = (npverts.dot(dirvec)-1.) / radii[nc]**2
-				weights += magnitudes[nc]*np.exp(pows)
-			elif coneType == 'linear' or coneType == 'quadratic' or coneType == 'linearWithFillet':
-				distances = np.sqrt(2.*(1.-npverts.dot(dirvec)))
-				wholeSphereCone = radii[nc]-distances
-				wholeSphereCone = wholeSphereCone.clip(min=0.)
-				if coneType == 'linear':
-					weights += magnitudes[nc]*wholeSphereCone # the original Arend cones
-				elif coneType == 'linearWithFillet':
-					if magnitudes[nc]>0:
-						weights += filletCone(distances, magnitudes[nc]*radii[nc], radii[nc], 1.*radii[nc], topFilletRadius=0.5*radii[nc])
-					else:
-						weights += -1.*filletCone(distances, -1.*magnitudes[nc]*radii[nc], radii[nc], 1.*radii[nc], topFilletRadius=radii[nc])
+		dirvecs = np.array([ [np.sin(thetas[nc])*np.cos(phis[nc]), np.sin(thetas[nc])*np.sin(phis[nc]), np.cos(thetas[nc])] for nc in range(numCones) ], dtype=np.float64)
+
+		def coneWeights(npverts):
+			# weights are accumulated in float64 regardless of the storage type of the shape
+			weights = np.ones(len(npverts))
+			for nc in range(numCones):
+				dirvec = dirvecs[nc]
+				if coneType == 'gaussian':
+					pows = (npverts.dot(dirvec)-1.) / radii[nc]**2
+					weights += magnitudes[nc]*np.exp(pows)
 				else:
-					weights += magnitudes[nc]*wholeSphereCone**2/radii[nc]**2
-			else:
-				raise ValueError(f'sculptor.shapeWithArendCones: unknown cone type {coneType}')
-
-		newVertices = []
-		for i in range(numVerts):
-			newVertices.append([ baseRadius*weights[i]*x for x in verts[i] ])
-		self.shape.setVertices(newVertices)
+					distances = np.sqrt(2.*np.clip(1.-npverts.dot(dirvec), 0., None)) # clipping guards against rounding in low precision shapes
+					wholeSphereCone = radii[nc]-distances
+					wholeSphereCone = wholeSphereCone.clip(min=0.)
+					if coneType == 'linear':
+						weights += magnitudes[nc]*wholeSphereCone # the original Arend cones
+					elif coneType == 'linearWithFillet':
+						if magnitudes[nc]>0:
+							weights += filletCone(distances, magnitudes[nc]*radii[nc], radii[nc], 1.*radii[nc], topFilletRadius=0.5*radii[nc])
+						else:
+							weights += -1.*filletCone(distances, -1.*magnitudes[nc]*radii[nc], radii[nc], 1.*radii[nc], topFilletRadius=radii[nc])
+					else:
+						weights += magnitudes[nc]*wholeSphereCone**2/radii[nc]**2
+			return weights
+
+		with instrumentation.stage('sculptor.arendCones', cones=numCones, shape=self.shape):
+			verts = self.shape.getVertices()
+			newVertices = np.empty(verts.shape, dtype=verts.dtype)
+			for start in range(0, len(verts), blockSize):
+				npverts = np.asarray(verts[start:start+blockSize], dtype=np.float64)
+				newVertices[start:start+blockSize] = baseRadius*coneWeights(npverts)[:,np.newaxis]*npverts
+			self.shape.setVertices(newVertices)
@@ -0,0 +1,189 @@
+''' Distances between ICQ shapes and detection of near-duplicate shapes in
+    datasets.
+
+    Shapes on the same ICQ grid are compared vertex by vertex through their
+    radii, i.e. the distances of the unique vertices from the origin:
+
+      rmsRadialDifference - root mean square of the radius differences
+      maxRadialDeviation - largest absolute radius difference
+
+    Pairwise matrices of both metrics are computed for whole batches of
+    shapes at once. The grid of resolution q is contained in the grid of
+    resolution k*q, so shapes of different Q (such as the ones made by
+    adaptive upscaling) are compared on the coarser grid.
+
+    Comparing all pairs of a large dataset is quadratic, so near-duplicates
+    are found through fingerprints: the spherical harmonic coefficients of
+    the radii up to a low degree (see sphericalHarmonics.py), fitted on the
+    grid by least squares. The fit is a projection, so the fingerprint
+    difference of two shapes is bounded by their rmsRadialDifference times
+    sqrt(V/lambda), where V is the number of unique vertices and lambda the
+    smallest eigenvalue of the normal equations of the fit. Pairs of shapes
+    closer than a threshold are therefore all among the pairs of
+    fingerprints closer than the scaled threshold, which are found with a
+    k-d tree. Only these candidates are loaded again and compared on the
+    full grid. For shapes of different Q the bound is approximate.
+
+    Shapes are read from ICQ files (files, directories or glob patterns as
+    in batchConvert.py) or from a dataset container made by DatasetGenerator
+    with outputMode='container'. The report lists the pairs of shapes within
+    the threshold and can be saved as a whitespace separated file, with
+    names containing whitespace quoted as in batchConvert.py.
+'''
+
+import os
+from multiprocessing import Pool
+import numpy as np
+
+import icq
+import batchConvert
+import sphericalHarmonics
+from datasetContainer import DatasetContainer
+
+reportColumns = [ 'shapeA', 'shapeB', 'rmsRadialDifference', 'maxRadialDeviation' ]
+
+def getRadii(vertexArrays):
+	'''Returns the radii of the unique vertices of vertex arrays of shape (6, Q+1, Q+1, 3) or (B, 6, Q+1, Q+1, 3)'''
+	vertexArrays = np.asarray(vertexArrays)
+	ish = icq.ICQShape()
+	ish.q = vertexArrays.shape[-3]-1
+	uniqueToRaw, _, _ = ish.getUniqueIndexArrays()
+	vertices = vertexArrays.reshape(vertexArrays.shape[:-4] + (-1, 3))[..., uniqueToRaw, :].astype(np.float64)
+	return np.sqrt(np.einsum('...i,...i->...', vertices, vertices))
+
+def coarsenVertexArray(vertexArray, q):
+	'''Returns the vertices of the grid of resolution q contained in a vertex array of a multiple of q'''
+	step, remainder = divmod(vertexArray.shape[-3]-1, q)
+	if remainder:
+		raise ValueError(f'Grid of resolution {vertexArray.shape[-3]-1} does not contain the grid of resolution {q}')
+	return vertexArray[..., ::step, ::step, :]
+
+def getCommonGridRadii(shapeA, shapeB):
+	'''Returns the radii of two shapes on the coarser of their grids'''
+	q = min(shapeA.q, shapeB.q)
+	return getRadii(coarsenVertexArray(shapeA.getVertexArray(), q)), getRadii(coarsenVertexArray(shapeB.getVertexArray(), q))
+
+def pairwiseRMSRadialDifferences(radiiA, radiiB=None):
+	'''Returns the matrix of rmsRadialDifference between the rows of radiiA (shape (A, V)) and of radiiB (shape (B, V),
+	   radiiA by default)
+	'''
+	radiiA = np.asarray(radiiA, dtype=np.float64)
+	radiiB = radiiA if radiiB is None else np.asarray(radiiB, dtype=np.float64)
+	# subtracting a common mean keeps the expansion below from cancelling catastrophically for similar shapes
+	mean = radiiA.mean(axis=0)
+	a, b = radiiA - mean, radiiB - mean
+	squares = np.einsum('av,av->a', a, a)[:,np.newaxis] + np.einsum('bv,bv->b', b, b)[np.newaxis] - 2.*(a @ b.T)
+	return np.sqrt(np.maximum(squares, 0.)/radiiA.shape[1])
+
+def pairwiseMaxRadialDeviations(radiiA, radiiB=None, maxBlockElements=2**24):
+	'''Returns the matrix of maxRadialDeviation between the rows of radiiA and radiiB (see pairwiseRMSRadialDifferences()).
+	   maxBlockElements bounds the size of the temporary (rows x B x V) arrays.
+	'''
+	radiiA = np.asarray(radiiA, dtype=np.float64)
+	radiiB = radiiA if radiiB is None else np.asarray(radiiB, dtype=np.float64)
+	deviations = np.empty((len(radiiA), len(radiiB)))
+	blockSize = max(1, maxBlockElements//radiiB.size)
+	for start in range(0, len(radiiA), blockSize):
+		deviations[start:start+blockSize] = np.abs(radiiA[start:start+blockSize,np.newaxis] - radiiB[np.newaxis]).max(axis=-1)
+	return deviations
+
+def shapeDistance(shapeA, shapeB):
+	'''Returns rmsRadialDifference and maxRadialDeviation of two shapes'''
+	radiiA, radiiB = getCommonGridRadii(shapeA, shapeB)
+	differences = radiiA - radiiB
+	return np.sqrt(np.mean(differences**2)), np.abs(differences).max()
+
+def getFingerprints(radii, q, degree=4):
+	'''Returns the fingerprints (rows of spherical harmonic coefficients) of radii of shape (V,) or (B, V) on the grid of resolution q'''
+	return sphericalHarmonics.fitRadii(np.asarray(radii).T, q, degree).T
+
+def getFingerprintRadius(threshold, q, degree=4):
+	'''Returns the fingerprint distance below which all pairs of shapes within rmsRadialDifference threshold fall'''
+	designMatrix, _ = sphericalHarmonics.getDesignMatrix(q, degree)
+	return threshold*np.sqrt(len(designMatrix)/np.linalg.eigvalsh(designMatrix.T @ designMatrix)[0])
+
+def findCandidatePairs(fingerprints, radius):
+	'''Returns the pairs of indices (i < j) of fingerprints closer than radius, as an array of shape (P, 2)'''
+	from scipy.spatial import cKDTree # imported here to keep scipy out of the import time of the module
+	pairs = cKDTree(fingerprints).query_pairs(radius, output_type='ndarray')
+	return pairs[np.lexsort((pairs[:,1], pairs[:,0]))] if len(pairs) else pairs.reshape(0, 2)
+
+class ShapeLibrary:
+	'''Names and random access to the shapes of a list of ICQ files or of a dataset container.
+	   inputs are files, directories or glob patterns, or a single container directory.
+	'''
+	def __init__(self, inputs):
+		if isinstance(inputs, (str, os.PathLike)):
+			inputs = [inputs]
+		inputs = list(map(str, inputs))
+		self.container = None
+		if len(inputs) == 1 and os.path.isfile(os.path.join(inputs[0], DatasetContainer.indexName)):
+			self.container = DatasetContainer(inputs[0], mode='r')
+			self.names = [ f'{inputs[0]}[{idx}]' for idx in range(len(self.container)) ]
+		else:
+			self.names = batchConvert.findICQFiles(inputs)
+
+	def __len__(self):
+		return len(self.names)
+
+	def getShape(self, idx):
+		ish = icq.ICQShape()
+		if self.container is not None:
+			ish.setVertexArray(np.asarray(self.container['shape'][idx]))
+		else:
+			ish.readICQ(self.names[idx])
+		return ish
+
+def _fingerprintFile(args):
+	icqFileName, degree = args
+	ish = icq.ICQShape()
+	ish.readICQ(icqFileName)
+	return ish.q, getFingerprints(getRadii(ish.getVertexArray()), ish.q, degree=degree)
+
+def computeFingerprints(library, degree=4, processes=None, blockSize=256):
+	'''Returns the resolutions (shape (N,)) and fingerprints (N, K) of all shapes of a ShapeLibrary. Shapes of a
+	   container are processed in blocks of blockSize, ICQ files by a pool of worker processes.
+	'''
+	if library.container is not None:
+		q = library.container['shape'].shape[-3]-1
+		fingerprints = np.concatenate([ getFingerprints(getRadii(library.container['shape'][start:start+blockSize]), q, degree=degree)
+		                                for start in range(0, len(library), blockSize) ] or [ np.empty((0, sphericalHarmonics.numCoefficients(degree))) ])
+		return np.full(len(library), q), fingerprints
+	tasks = [ (name, degree) for name in library.names ]
+	processes = min(os.cpu_count() if processes is None else processes, len(tasks))
+	if processes <= 1:
+		results = list(map(_fingerprintFile, tasks))
+	else:
+		with Pool(processes) as pool:
+			results = pool.map(_fingerprintFile, tasks)
+	if not results:
+		return np.empty(0, dtype=int), np.empty((0, sphericalHarmonics.numCoefficients(degree)))
+	qs, fingerprints = zip(*results)
+	return np.array(qs), np.stack(fingerprints)
+
+def dedupeReport(inputs, threshold, degree=4, processes=None):
+	'''Finds the pairs of shapes with rmsRadialDifference not above threshold, see the module description.
+	   Returns the report as a list of dicts with reportColumns as keys, sorted by the indices of the shapes.
+	'''
+	library = ShapeLibrary(inputs)
+	qs, fingerprints = computeFingerprints(library, degree=degree, processes=processes)
+	if len(library) < 2:
+		return []
+	radius = max(getFingerprintRadius(threshold, q, degree=degree) for q in np.unique(qs))
+	rows = []
+	shapeA, lastA = None, None
+	for a, b in findCandidatePairs(fingerprints, radius):
+		if a != lastA:
+			shapeA, lastA = library.getShape(a), a
+		rms, maxDeviation = shapeDistance(shapeA, library.getShape(b))
+		if rms <= threshold:
+			rows.append({ 'shapeA': library.names[a], 'shapeB': library.names[b], 'rmsRadialDifference': rms, 'maxRadialDeviation': maxDeviation })
+	return rows
+
+def formatReport(rows):
+	'''Returns the report as a list of lines, header first'''
+	return [ '# ' + ' '.join(reportColumns) ] + [ ' '.join(batchConvert.formatField(row[col]) for col in reportColumns) for row in rows ]
+
+def saveReport(rows, filename):
+	with open(filename, 'w') as outfile:
+		outfile.write('\n'.join(formatReport(rows)) + '\n')
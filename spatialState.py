@@ -21,10 +21,17 @@
     to conveniently save lists of these.
 
     Modules relies on the default NumPy RNG for random numbers.
+
+    Besides iterating over spatial states one by one, SpatialStatesIterator
+    can return the whole sweep at once as a structured array (toArray()),
+    together with the Cartesian positions of the camera and the light source
+    and the stack of asteroid rotation matrices (getRotationMatrices()).
 '''
 
 import numpy as np
 
+from abstractShape import rotation_matrices, spherical_to_cartesian
+
 def _sampleARotationAxis():
 	'''Uniformly samples an asteroid rotation axis. Courtesy of Wolfram:
 	   http://mathworld.wolfram.com/SpherePointPicking.html
@@ -55,6 +62,15 @@ def saveConditions(conditions, filename):
 			vars = [x, y, z, angle]
 			outfile.write(' '.join(map(str, vars)) + '\n')
 
+spatialStateDtype = np.dtype([ ('condID', np.int64),
+                               ('axis', np.float64, (3,)),
+                               ('approachAngle', np.float64),
+                               ('distance', np.float64),
+                               ('phaseID', np.int64),
+                               ('phase', np.float64),
+                               ('cameraLocation', np.float64, (3,)),
+                               ('lightLocation', np.float64, (3,)) ])
+
 class SpatialStatesIterator:
 	'''An iterator over values of spatial parameters of the asteroid'''
 	def __init__(self,
@@ -71,3 +87,36 @@ class SpatialStatesIterator:
 			for dist in self.distances:
 				for phid, phase in enumerate(self.phases):
 					yield condID, axis, aangle, dist, phid, phase
+
+	def __len__(self):
+		return len(self.conditions)*len(self.distances)*len(self.phases)
+
+	def toArray(self, lightSourceDistance=1000):
+		'''Returns all spatial states as a structured array of dtype spatialStateDtype, in the order of iteration.
+		   Camera and light locations follow the conventions of the dataset generators: the camera is at
+		   (distance, pi/2, approachAngle) and the light source at (lightSourceDistance, pi/2, 0) in spherical
+		   coordinates.
+		'''
+		numConditions, numDistances, numPhases = len(self.conditions), len(self.distances), len(self.phases)
+		states = np.empty(len(self), dtype=spatialStateDtype)
+		if len(states) == 0:
+			return states
+		condIDs, distIDs, phaseIDs = np.meshgrid(np.arange(numConditions), np.arange(numDistances), np.arange(numPhases), indexing='ij')
+		condIDs, distIDs, phaseIDs = condIDs.ravel(), distIDs.ravel(), phaseIDs.ravel()
+		axes = np.array([ axis for axis, _ in self.conditions ], dtype=float)
+		approachAngles = np.array([ aangle for _, aangle in self.conditions ], dtype=float)
+
+		states['condID'] = condIDs
+		states['axis'] = axes[condIDs]
+		states['approachAngle'] = approachAngles[condIDs]
+		states['distance'] = np.asarray(self.distances, dtype=float)[distIDs]
+		states['phaseID'] = phaseIDs
+		states['phase'] = np.asarray(self.phases)[phaseIDs]
+		states['cameraLocation'] = np.stack(spherical_to_cartesian(states['distance'], np.pi/2., states['approachAngle']), axis=-1)
+		states['lightLocation'] = spherical_to_cartesian(lightSourceDistance, np.pi/2, 0)
+		return states
+
+	def getRotationMatrices(self):
+		'''Returns an (N,3,3) stack of asteroid rotation matrices, one for each spatial state in the order of iteration'''
+		states = self.toArray()
+		return rotation_matrices(states['axis'], states['phase'])
@@ -0,0 +1,165 @@
+''' Spherical harmonic (SH) decomposition of shapes and reconstruction of
+    shapes from SH coefficients.
+
+    The radius of a shape is expanded in the real spherical harmonics of
+    sculptor.real_sph_harm() up to a chosen degree L,
+
+      r(theta, phi) = sum_{n=0..L} sum_{m=-n..n} c_nm Y_nm(theta, phi)
+
+    with theta the polar and phi the azimuthal angle. The (L+1)^2
+    coefficients are ordered by degree and then by order, see
+    getDegreesAndOrders().
+
+    Coefficients are fitted by least squares to the radii of the unique
+    vertices of an ICQ shape. Shapes that were densified before being shaped
+    radially (as in ArendConesAsteroidGenerator) and shapes made by
+    meshImport or shapeFromCoefficients() have their vertices on the
+    directions of the ICQ grid (ICQShape.getGridDirections()), so the design
+    matrix only depends on Q and L. It is computed once per (Q, L) together with the Cholesky factor
+    of its normal equations, and the radii of any number of shapes are then
+    fitted with one matrix product and one triangular solve. Vertices that
+    have been moved off the grid directions (e.g. by upscaling a sphere or by
+    ICQShape.smooth()) are fitted with a design matrix of their own directions, which is not cached.
+
+    Reconstruction evaluates the expansion on the grid directions of any Q.
+    A coefficient vector takes (L+1)^2 numbers against the 18(Q+1)^2 of the
+    vertex array, which makes it a compact label or storage format for
+    smooth shapes.
+'''
+
+import numpy as np
+
+import icq
+from sculptor import real_sph_harm
+
+_gridDirectionsCache = {} # q -> unit vectors towards the unique grid vertices, see getGridDirections()
+_designMatrixCache = {} # (q, degree) -> (design matrix, Cholesky factor of its normal equations), see getDesignMatrix()
+
+def numCoefficients(degree):
+	return (degree+1)**2
+
+def getDegree(numCoeffs):
+	'''Inverse of numCoefficients()'''
+	degree = int(round(np.sqrt(numCoeffs))) - 1
+	if numCoefficients(degree) != numCoeffs:
+		raise ValueError(f'{numCoeffs} is not a valid number of spherical harmonic coefficients')
+	return degree
+
+def getDegreesAndOrders(degree):
+	'''Returns the degrees n and orders m of the coefficients up to the given degree, as two integer arrays'''
+	degrees = np.concatenate([ np.full(2*n+1, n) for n in range(degree+1) ])
+	orders = np.concatenate([ np.arange(-n, n+1) for n in range(degree+1) ])
+	return degrees, orders
+
+def getSphericalHarmonicsMatrix(directions, degree):
+	'''Returns the values of all real spherical harmonics up to the given degree in an array of unit vectors,
+	   as a matrix of shape (len(directions), numCoefficients(degree))
+	'''
+	directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+	polar = np.arccos(np.clip(directions[:,2], -1., 1.))
+	azimuth = np.arctan2(directions[:,1], directions[:,0])
+	# scipy takes the azimuthal angle first, see the note in Sculptor.perturbWithSphericalHarmonic()
+	return np.stack([ real_sph_harm(m, n, azimuth, polar) for n, m in zip(*getDegreesAndOrders(degree)) ], axis=-1)
+
+def _choleskyOfNormalEquations(designMatrix):
+	from scipy.linalg import cho_factor # imported here to keep scipy out of the import time of the module
+	if designMatrix.shape[0] < designMatrix.shape[1]:
+		raise ValueError(f'{designMatrix.shape[0]} vertices are too few to fit {designMatrix.shape[1]} spherical harmonic coefficients')
+	return cho_factor(designMatrix.T @ designMatrix)
+
+def getGridDirections(q):
+	'''Returns the unit vectors towards the unique vertices of the ICQ grid of resolution q (order of ICQShape.getUniqueVertexArray())'''
+	if q not in _gridDirectionsCache:
+		ish = icq.ICQShape()
+		ish.q = q
+		uniqueToRaw, _, _ = ish.getUniqueIndexArrays()
+		_gridDirectionsCache[q] = ish.getGridDirections().reshape(-1, 3)[uniqueToRaw]
+	return _gridDirectionsCache[q]
+
+def getDesignMatrix(q, degree):
+	'''Returns the spherical harmonics matrix of the ICQ grid directions at resolution q and the Cholesky factor
+	   of the normal equations. Both are cached; the matrix takes 8*(6q^2+2)*(degree+1)^2 bytes.
+	'''
+	if (q, degree) not in _designMatrixCache:
+		designMatrix = getSphericalHarmonicsMatrix(getGridDirections(q), degree)
+		_designMatrixCache[(q, degree)] = (designMatrix, _choleskyOfNormalEquations(designMatrix))
+	return _designMatrixCache[(q, degree)]
+
+def _solve(designMatrix, cholesky, radii):
+	from scipy.linalg import cho_solve # imported here to keep scipy out of the import time of the module
+	return cho_solve(cholesky, designMatrix.T @ radii)
+
+def fitRadii(radii, q, degree):
+	'''Fits coefficients to radii along the ICQ grid directions. radii has shape (V,) or (V, B) for a batch of B
+	   shapes, with V the number of unique vertices at resolution q. Returns coefficients of shape (K,) or (K, B).
+	'''
+	designMatrix, cholesky = getDesignMatrix(q, degree)
+	return _solve(designMatrix, cholesky, np.asarray(radii, dtype=np.float64))
+
+def _getRadiusField(shape, tolerance):
+	'''Returns radii and unit directions of the unique vertices and whether the directions are those of the grid'''
+	vertices = shape.getUniqueVertexArray().astype(np.float64)
+	radii = np.linalg.norm(vertices, axis=-1)
+	directions = vertices/radii[:,np.newaxis]
+	return radii, directions, np.max(np.linalg.norm(directions - getGridDirections(shape.q), axis=-1)) <= tolerance
+
+def fitShape(shape, degree, tolerance=1e-6):
+	'''Fits the coefficients of the radius field of an ICQ shape. Vertices that deviate from the grid directions
+	   by more than tolerance (in radians) make the fit use the actual vertex directions, without caching.
+	'''
+	radii, directions, onGrid = _getRadiusField(shape, tolerance)
+	if onGrid:
+		return fitRadii(radii, shape.q, degree)
+	designMatrix = getSphericalHarmonicsMatrix(directions, degree)
+	return _solve(designMatrix, _choleskyOfNormalEquations(designMatrix), radii)
+
+def fitShapes(shapes, degree, tolerance=1e-6):
+	'''Fits several shapes at once. Shapes of equal Q with vertices on the grid directions share one solve.
+	   Returns an array of shape (len(shapes), K).
+	'''
+	coefficients = np.empty((len(shapes), numCoefficients(degree)))
+	batches = {} # q -> [(index, radii)]
+	for idx, shape in enumerate(shapes):
+		radii, _, onGrid = _getRadiusField(shape, tolerance)
+		if onGrid:
+			batches.setdefault(shape.q, []).append((idx, radii))
+		else:
+			coefficients[idx] = fitShape(shape, degree, tolerance=tolerance)
+	for q, batch in batches.items():
+		indices, radii = zip(*batch)
+		coefficients[list(indices)] = fitRadii(np.stack(radii, axis=-1), q, degree).T
+	return coefficients
+
+def evaluateRadii(coefficients, directions):
+	'''Returns the radii along an array of unit vectors for coefficients of shape (K,) or (B, K)'''
+	coefficients = np.asarray(coefficients, dtype=np.float64)
+	harmonics = getSphericalHarmonicsMatrix(directions, getDegree(coefficients.shape[-1]))
+	return coefficients @ harmonics.T
+
+def shapeFromCoefficients(coefficients, q, dtype=np.float64):
+	'''Reconstructs an ICQShape of resolution q from the coefficients'''
+	coefficients = np.asarray(coefficients, dtype=np.float64)
+	designMatrix, _ = getDesignMatrix(q, getDegree(len(coefficients)))
+	ish = icq.ICQShape(dtype=dtype)
+	ish.q = q
+	_, rawToUnique, _ = ish.getUniqueIndexArrays()
+	vertices = (designMatrix @ coefficients)[:,np.newaxis]*getGridDirections(q)
+	ish.setVertexArray(vertices[rawToUnique].reshape(6, q+1, q+1, 3))
+	return ish
+
+def saveCoefficients(filePath, coefficients):
+	'''Saves coefficients as rows of degree, order and value'''
+	coefficients = np.asarray(coefficients, dtype=np.float64)
+	with open(filePath, 'w') as outFile:
+		outFile.write('# Real spherical harmonic coefficients of the radius\n')
+		outFile.write('# degree order coefficient\n')
+		for n, m, c in zip(*getDegreesAndOrders(getDegree(len(coefficients))), coefficients.tolist()):
+			outFile.write(f'{n} {m} {c!r}\n')
+
+def loadCoefficients(filePath):
+	'''Reads coefficients saved with saveCoefficients()'''
+	rows = np.loadtxt(filePath, ndmin=2)
+	degrees, orders = getDegreesAndOrders(getDegree(len(rows)))
+	if np.any(rows[:,0] != degrees) or np.any(rows[:,1] != orders):
+		raise ValueError(f'{filePath}: coefficients are not ordered by degree and order')
+	return rows[:,2]
@@ -0,0 +1,90 @@
+import numpy as np
+
+import icq, sculptor, instrumentation
+
+class SphericalHarmonicsAsteroidGenerator:
+	''' A class for sampling synthetic asteroid shapes using the spherical
+	    harmonics perturbation.
+
+	    Asteroid sampling procedure:
+	    1. An sculptable shape is generated as a sphere of radius baseRadius. The
+	       resolution is increased baseResolution times, in Shape-class specific
+	       discrete steps.
+	    2. A spherical harmonic perturbation is sampled as follows:
+	       a. Degree n of the spherical harmonic perturbation is sampled from
+	          geometric distribution decaying at rate degreeDecay.
+	       b. Order m of the spherical harmonic perturbation is sampled from uniform
+	          distribution over {-n, -n+1, ..., n}
+	       c. Amplitude of the spherical harmonic perturbation is computed as
+	          r*baseRadius, where r is a random number from [0,1] sampled from beta
+	          distribution with alpha=1 and beta=1+magnitudeDecay*n*abs(m)
+	    3. Perturbation is applied to the shape. If the perturbation has fine
+	       features, resolution of the shape is increased until the feature size is
+	       at least resolutionMargin times larger than the largest triangle side in
+	       the shape's mesh.
+	    4. Steps 2 and 3 are repeated numPerturbationApplications times.
+
+	    The function that performs the sampling
+	    (SphericalHarmonicsAsteroidGenerator.sampleAnAsteroid()) returns the
+	    shape and the description of the perturbations. A method for saving the
+	    said description is provided. Only one shape is held at a time, so the
+	    generator can be used with the streaming drivers in datasetGenerator.py
+	    and datasetStream.py.
+
+	    The class relies on the default NumPy RNG for random numbers.
+	'''
+	def __init__(self,
+	             baseRadius = 15.,
+	             baseResolution = 4, # for ICQShape, Q will be 2**(baseResolution+1) unless a spherical harmonic
+	                                 # with finer features is applied
+	             resolutionMargin = 4, # model resolution must be such that the smallest spherical
+	                                   # harmonic feature must be at least resolutionMargin times
+	                                   # larger than the smallest triangle
+	             numPerturbationApplications = 15,
+	             degreeDecay = 0.15,
+	             magnitudeDecay = 0.35,
+	             dtype = np.float64): # floating point type used to store the vertices of the shapes
+		self.baseRadius = baseRadius
+		self.baseResolution = baseResolution
+		self.resolutionMargin = resolutionMargin
+		self.numPerturbationApplications = numPerturbationApplications
+		self.degreeDecay = degreeDecay
+		self.magnitudeDecay = magnitudeDecay
+		self.dtype = dtype
+		self.shapeDescriptionTitle = 'Overall asteroid shape produced by sequentially applying spherical harmonic perturbations'
+
+	def sampleAnAsteroid(self):
+		with instrumentation.stage('harmonics.baseShape') as st:
+			cubeicqpath = icq.shapesDir / 'cube2.icq'
+			ish = icq.ICQShape(dtype=self.dtype)
+			ish.readICQ(cubeicqpath)
+
+			scu = sculptor.Sculptor(ish)
+			for _ in range(self.baseResolution):
+				scu.upscaleShape()
+			scu.rollIntoABall(radius=self.baseRadius)
+			st.set(shape=ish)
+
+		degrees, orders, magnitudes = [], [], []
+		for _ in range(self.numPerturbationApplications):
+			n = np.random.geometric(self.degreeDecay)
+			m = np.random.randint(-n, n+1)
+			beta = 1. + self.magnitudeDecay*n*np.abs(m)
+			mag = self.baseRadius*np.random.beta(a=1, b=beta)
+			scu.perturbWithSphericalHarmonic(mag, m, n, upscaleMargin=self.resolutionMargin)
+			degrees.append(n)
+			orders.append(m)
+			magnitudes.append(mag)
+
+		shapeDescription = { 'degrees': np.array(degrees), 'orders': np.array(orders), 'magnitudes': np.array(magnitudes) }
+
+		return scu.getShape(), shapeDescription
+
+	def saveShapeDescription(self, shapeDescription, filePath):
+		with open(filePath, 'w') as outFile:
+			outFile.write('# ' + self.shapeDescriptionTitle + '\n')
+			vars = list(shapeDescription.keys())
+			numVars = len(shapeDescription[vars[0]])
+			outFile.write('# ' + ' '.join(vars) + '\n')
+			for i in range(numVars):
+				outFile.write(' '.join([ str(shapeDescription[var][i]) for var in vars ]) + '\n')
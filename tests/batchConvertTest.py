@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import os
+import shlex
+import tempfile
+import numpy as np
+from pathlib import Path
+
+import icq, sculptor
+import batchConvert
+
+ish = icq.ICQShape()
+ish.readICQ('./shapes/cube1.icq')
+scu = sculptor.Sculptor(ish)
+for _ in range(2):
+	scu.upscaleShape()
+
+with tempfile.TemporaryDirectory() as tmpdir:
+	libDir = os.path.join(tmpdir, 'library')
+	os.makedirs(os.path.join(libDir, 'sub dir'))
+	validFile = os.path.join(libDir, 'valid.icq')
+	invalidFile = os.path.join(libDir, 'sub dir', 'invalid.icq')
+	brokenFile = os.path.join(libDir, 'broken.icq')
+	ish.writeICQ(validFile)
+	invalid = icq.ICQShape()
+	invalid.readICQ(validFile)
+	invalid.vertices[0, 0, 1] *= 1.5 # moves one record of a redundant vertex only
+	invalid.writeICQ(invalidFile)
+	with open(brokenFile, 'w') as icqfile:
+		icqfile.write('\t     4\n\tnot\ta\tvertex\n')
+	with open(os.path.join(libDir, 'notes.txt'), 'w') as txtfile:
+		txtfile.write('not a shape\n')
+
+	print('Finding files...')
+	files = [brokenFile, invalidFile, validFile]
+	assert files == sorted(files)
+	assert batchConvert.findICQFiles([libDir]) == files
+	assert batchConvert.findICQFiles([os.path.join(libDir, '*.icq'), validFile]) == [brokenFile, validFile]
+	assert batchConvert.findICQFiles([os.path.join(libDir, '**', 'inv*.icq'), libDir]) == files
+	try:
+		batchConvert.findICQFiles([os.path.join(libDir, 'missing.icq')])
+		assert False, 'missing inputs must raise'
+	except FileNotFoundError:
+		pass
+
+	print('Output paths...')
+	assert batchConvert.getOutputPath(invalidFile, 'none') is None
+	for outputFormat, extension in [('obj', '.obj'), ('ply', '.ply'), ('stl', '.stl'), ('icqb', '.icqb.npy')]:
+		assert batchConvert.getOutputPath(invalidFile, outputFormat) == Path(libDir) / 'sub dir' / f'invalid{extension}'
+		assert batchConvert.getOutputPath(invalidFile, outputFormat, outputDir='out', inputRoot=libDir) == Path('out') / 'sub dir' / f'invalid{extension}'
+		assert batchConvert.getOutputPath(invalidFile, outputFormat, outputDir='out') == Path('out') / f'invalid{extension}'
+
+	print('Converting...')
+	outDir = os.path.join(tmpdir, 'converted')
+	for processes in (1, 2):
+		rows = batchConvert.batchConvert([libDir], outputFormat='icqb', outputDir=outDir, processes=processes)
+		assert [ row['file'] for row in rows ] == files
+		broken, invalidRow, valid = rows
+		assert valid == { 'file': validFile, 'q': 4, 'numVertices': 6*4**2 + 2, 'valid': True, 'maxDeviation': 0., 'status': 'ok' }
+		assert invalidRow['valid'] is False and invalidRow['status'] == 'ok'
+		assert np.isclose(invalidRow['maxDeviation'], 0.5*np.linalg.norm(ish.vertices[0, 0, 1]), rtol=1e-5)
+		assert broken['q'] is None and broken['valid'] is None
+		assert broken['status'].startswith('error:ValueError: ') and len(broken['status']) > len('error:ValueError: '), broken['status']
+		converted = icq.ICQShape()
+		converted.readICQBinary(os.path.join(outDir, 'valid.icqb.npy'))
+		assert np.allclose(converted.getVertexArray(), ish.getVertexArray(), atol=1e-6)
+		assert os.path.isfile(os.path.join(outDir, 'sub dir', 'invalid.icqb.npy'))
+		assert not os.path.exists(os.path.join(outDir, 'broken.icqb.npy'))
+
+	print('Summary table...')
+	summaryFile = os.path.join(tmpdir, 'summary.ssv')
+	batchConvert.saveSummary(rows, summaryFile)
+	with open(summaryFile) as ssvfile:
+		lines = ssvfile.read().splitlines()
+	assert lines[0] == '# ' + ' '.join(batchConvert.summaryColumns)
+	assert len(lines) == 1 + len(rows)
+	for line, row in zip(lines[1:], rows):
+		fields = shlex.split(line)
+		assert len(fields) == len(batchConvert.summaryColumns), line
+		assert fields[0] == row['file'] and fields[-1] == row['status']
+	assert shlex.split(lines[1])[1:5] == ['-', '-', '-', '-']
+	assert shlex.split(lines[3])[1:5] == ['4', str(6*4**2 + 2), 'True', '0']
+
+print('All tests passed')
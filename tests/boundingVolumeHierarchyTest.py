@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import icq, sculptor
+from boundingVolumeHierarchy import BoundingVolumeHierarchy
+
+radius = 10.
+
+ish = icq.ICQShape()
+ish.readICQ('./shapes/cube1.icq')
+scu = sculptor.Sculptor(ish)
+for _ in range(5):
+	scu.upscaleShape()
+scu.rollIntoABall(radius=radius)
+bvh = BoundingVolumeHierarchy(ish, leafSize=4)
+vertices, triangles = ish.getVertices(), ish.getTriangleIndexArray()
+
+print('Casting rays...')
+np.random.seed(0)
+origins = np.random.randn(1000, 3)
+origins *= 3.*radius/np.linalg.norm(origins, axis=-1, keepdims=True)
+directions = -origins + np.random.randn(1000, 3)
+distances, triangleIDs, barycentrics = bvh.intersectRays(origins, directions)
+hits = triangleIDs >= 0
+assert hits.mean() > 0.9
+hitPoints = origins[hits] + distances[hits,np.newaxis]*directions[hits]
+assert np.allclose(hitPoints, np.einsum('ij,ijk->ik', barycentrics[hits], vertices[triangles[triangleIDs[hits]]]))
+assert np.allclose(np.linalg.norm(hitPoints, axis=-1), radius, rtol=1e-2)
+assert np.all(np.einsum('ij,ij->i', hitPoints - origins[hits], hitPoints) < 0) # the first hit is on the near side
+assert np.all(bvh.intersectRays(origins, -directions)[1] == -1)
+
+print('Finding closest points...')
+queries = 2.*radius*np.random.randn(1000, 3)
+distances, triangleIDs, closestPoints, barycentrics = bvh.closestPoints(queries)
+assert np.allclose(distances, np.abs(np.linalg.norm(queries, axis=-1) - radius), atol=2e-2*radius)
+assert np.allclose(closestPoints, np.einsum('ij,ijk->ik', barycentrics, vertices[triangles[triangleIDs]]))
+assert np.allclose(bvh.closestPoints(vertices[:100])[0], 0.)
+
+print('All tests passed')
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import icq, sculptor, spatialState
+from abstractShape import scene_rotation_matrices
+
+radius = 10.
+width, height = 80, 60
+
+ish = icq.ICQShape()
+ish.readICQ('./shapes/cube1.icq')
+scu = sculptor.Sculptor(ish)
+for _ in range(4):
+	scu.upscaleShape()
+scu.rollIntoABall(radius=radius)
+
+print('Projecting a sphere...')
+np.random.seed(1)
+states = spatialState.SpatialStatesIterator(spatialState.sampleConditions(2), distances=[50.], numPhases=3).toArray()
+pixels, depths, visible = ish.projectVertices(states, width, height, visibility=True)
+vertices = ish.getUniqueVertexArray()
+assert pixels.shape == (len(states), len(vertices), 2) and depths.shape == visible.shape == (len(states), len(vertices))
+for state, statePixels, stateDepths, stateVisible in zip(states, pixels, depths, visible):
+	rotated = vertices @ scene_rotation_matrices(state['axis'], state['phase']).T
+	cosines = np.einsum('vi,vi->v', rotated, state['cameraLocation'] - rotated)/np.linalg.norm(state['cameraLocation'] - rotated, axis=-1)/radius
+	assert np.all(stateVisible[cosines > 0.2]) and not np.any(stateVisible[cosines < -0.2]) # the front half of the sphere, up to the facets cutting the silhouette
+	assert np.allclose(stateDepths, np.linalg.norm(state['cameraLocation']) - rotated @ state['cameraLocation']/np.linalg.norm(state['cameraLocation']))
+	assert np.allclose(statePixels[np.argmin(stateDepths)], [ width/2., height/2. ], atol=1.) # the closest vertex faces the camera
+
+print('Matching projections with the ray cast silhouettes...')
+ish.setVertexArray(ish.getVertexArray()*[1., 0.6, 0.8])
+labels = ish.getImageLabels(states, width, height, masks=True)
+assert labels['masks'].shape == (len(states), height, width)
+for keypoints, visibleFlags, box, mask in zip(labels['keypoints'], labels['visible'], labels['boundingBoxes'], labels['masks']):
+	rows, columns = np.nonzero(mask)
+	assert np.allclose(box, [ columns.min(), rows.min(), columns.max()+1, rows.max()+1 ], atol=1.)
+	visibleColumns, visibleRows = np.floor(keypoints[visibleFlags]).astype(int).T
+	padded = np.pad(mask, 1)
+	dilated = np.any([ padded[1+dr:1+dr+height, 1+dc:1+dc+width] for dr in (-1, 0, 1) for dc in (-1, 0, 1) ], axis=0)
+	assert np.all(dilated[visibleRows, visibleColumns]) # silhouette pixels may not have their centers covered
+
+print('All tests passed')
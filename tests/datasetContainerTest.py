@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+import tempfile
+from pathlib import Path
+import numpy as np
+
+import icq
+from datasetContainer import DatasetContainer
+
+ish = icq.ICQShape()
+ish.readICQ('./shapes/cube2.icq')
+
+with tempfile.TemporaryDirectory() as tmpdir:
+	packPath = Path(tmpdir) / 'test.pack'
+
+	print('Appending records...')
+	cont = DatasetContainer(packPath, mode='a')
+	for i in range(5):
+		cont.append({ 'shape': ish.getVertexArray()*(i+1), 'frames': np.full((2, 4, 4), i, dtype=np.uint8) })
+	cont.attrs['q'] = ish.q
+	cont.commitAttrs()
+
+	print('Simulating a crash after writing field data, but before committing the index...')
+	with open(packPath / 'frames.bin', 'ab') as fieldFile:
+		fieldFile.write(b'garbage')
+	cont = DatasetContainer(packPath, mode='a')
+	assert len(cont) == 5
+	assert (packPath / 'frames.bin').stat().st_size == 5*2*4*4
+
+	print('Reading records back...')
+	cont = DatasetContainer(packPath, mode='r')
+	assert cont.attrs['q'] == 2
+	batch = cont.getBatch([4, 1])
+	assert np.array_equal(batch['frames'][:,0,0,0], [4, 1])
+	assert np.allclose(batch['shape'][1], 2*ish.getVertexArray())
+
+	restored = icq.ICQShape()
+	restored.setVertexArray(cont['shape'][0])
+	assert restored.validate()
+	assert np.array_equal(restored.getVertices(), ish.getVertices())
+
+print('All tests passed')
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import tempfile
+from pathlib import Path
+
+from arendConesAsteroidGenerator import ArendConesAsteroidGenerator
+from datasetGenerator import DatasetGenerator, DatasetManifest
+
+numAsteroids = 5
+
+class Interrupted(Exception):
+	pass
+
+class StubRenderGenerator(DatasetGenerator):
+	'''Writes no frames and raises Interrupted when rendering the asteroid interruptAt, after its shape files are written'''
+	def __init__(self, *args, interruptAt=None, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.interruptAt = interruptAt
+
+	def renderFrames(self, astSh, astDir, conditions, threadPool):
+		if self.interruptAt is not None and astDir == self.asteroidDir(self.interruptAt):
+			raise Interrupted()
+		return [], []
+
+def makeGenerator(workdir, randomSeed=42, interruptAt=None):
+	return StubRenderGenerator(ArendConesAsteroidGenerator(baseResolution=3, numCones=10), workdir=workdir, randomSeed=randomSeed,
+	                           numConditions=2, approachAnglesRange=[0, 1], interruptAt=interruptAt)
+
+def readTree(workdir):
+	'''Returns a dict from the relative paths of all files under workdir to their contents'''
+	return { str(path.relative_to(workdir)): path.read_bytes() for path in sorted(Path(workdir).rglob('*')) if path.is_file() }
+
+with tempfile.TemporaryDirectory() as tmpdir:
+	referenceDir, resumedDir = Path(tmpdir) / 'reference', Path(tmpdir) / 'resumed'
+	referenceDir.mkdir()
+	resumedDir.mkdir()
+
+	print('Uninterrupted run...')
+	makeGenerator(referenceDir).run(numAsteroids)
+	reference = readTree(referenceDir)
+	assert sorted(name.split(os.sep)[0] for name in reference if name.endswith('shape.icq')) == [ f'asteroid{id:05}' for id in range(numAsteroids) ]
+
+	print('Interrupted run...')
+	try:
+		makeGenerator(resumedDir, interruptAt=2).run(numAsteroids)
+		assert False, 'the run must be interrupted'
+	except Interrupted:
+		pass
+	assert (resumedDir / 'asteroid00002' / 'shape.icq').exists() # left partial
+	records = DatasetManifest(resumedDir / 'manifest.jsonl').read()
+	assert [ rec['type'] for rec in records ] == ['header', 'asteroid', 'asteroid']
+
+	print('Manifest truncated mid-line...')
+	manifestBytes = (resumedDir / 'manifest.jsonl').read_bytes()
+	with open(resumedDir / 'manifest.jsonl', 'ab') as manFile:
+		manFile.write(b'{"dir": "asteroid00002", "fr')
+	assert DatasetManifest(resumedDir / 'manifest.jsonl').read() == records
+	assert (resumedDir / 'manifest.jsonl').read_bytes() == manifestBytes # the incomplete line is removed
+
+	print('Resuming with a different seed...')
+	try:
+		makeGenerator(resumedDir, randomSeed=7).resume()
+		assert False, 'a different seed must not resume'
+	except ValueError:
+		pass
+
+	print('Resumed run...')
+	resumedGenerator = makeGenerator(resumedDir)
+	assert resumedGenerator.resume() == 2
+	assert not (resumedDir / 'asteroid00002').exists()
+	completedIDs = []
+	resumedGenerator.run(numAsteroids, onAsteroid=lambda record: completedIDs.append(record['id']))
+	assert completedIDs == [2, 3, 4]
+	resumed = readTree(resumedDir)
+	assert resumed.keys() == reference.keys()
+	for name in reference:
+		assert resumed[name] == reference[name], f'{name} differs from the uninterrupted run'
+	assert [ json.loads(line)['type'] for line in resumed['manifest.jsonl'].splitlines() ] == ['header'] + ['asteroid']*numAsteroids
+
+	print('Resuming a completed run...')
+	makeGenerator(resumedDir).run(numAsteroids)
+	assert readTree(resumedDir) == reference
+
+print('All tests passed')
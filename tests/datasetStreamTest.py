@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import itertools
+import numpy as np
+
+from arendConesAsteroidGenerator import ArendConesAsteroidGenerator
+from datasetGenerator import DatasetGenerator
+from datasetStream import AsteroidStream
+
+class StubRenderGenerator(DatasetGenerator):
+	'''Renders a tiny image that depends on the shape and the spatial state, without POV-Ray'''
+	def renderState(self, astSh, ssDesc, outfile=None, tempfile=None, returnCropBox=False):
+		condID, astRotAxis, apprAngle, dist, phid, ph = ssDesc
+		return np.full((2, 3), astSh.getVertexArray().sum() + dist + ph + apprAngle)
+
+dg = StubRenderGenerator(ArendConesAsteroidGenerator(baseResolution=3, numCones=10), randomSeed=42,
+                         numConditions=2, approachAnglesRange=[0, 1], distances=[50, 100], numPhases=2)
+framesPerAsteroid = 2*2*2
+
+def collect(stream):
+	return [ (shapeArrays['vertices'], ssDesc, image) for shapeArrays, ssDesc, image in stream ]
+
+def assertSameFrames(framesA, framesB):
+	assert len(framesA) == len(framesB)
+	for (verticesA, ssDescA, imageA), (verticesB, ssDescB, imageB) in zip(framesA, framesB):
+		assert np.array_equal(verticesA, verticesB)
+		assert repr(ssDescA) == repr(ssDescB)
+		assert np.array_equal(imageA, imageB)
+
+print('Bounding the stream...')
+serial = collect(AsteroidStream(dg, numAsteroids=4, processes=0))
+assert len(serial) == 4*framesPerAsteroid
+shapes = [ vertices for vertices, _, _ in serial[::framesPerAsteroid] ]
+assert not any(np.array_equal(shapes[a], shapes[b]) for a in range(4) for b in range(a))
+assert all(vertices is serial[0][0] for vertices, _, _ in serial[:framesPerAsteroid]) # shared between the frames of an asteroid
+assert [ ssDesc[0] for _, ssDesc, _ in serial[:framesPerAsteroid] ] == [0]*4 + [1]*4
+shifted = collect(AsteroidStream(dg, numAsteroids=2, firstID=2, processes=0))
+assertSameFrames(shifted, serial[2*framesPerAsteroid:])
+assert collect(AsteroidStream(dg, numAsteroids=0, processes=0)) == []
+
+print('Independence of the number of processes...')
+assertSameFrames(collect(AsteroidStream(dg, numAsteroids=4, processes=3, prefetch=2)), serial)
+assertSameFrames(collect(AsteroidStream(dg, numAsteroids=2, firstID=2, processes=2, prefetch=1)), serial[2*framesPerAsteroid:])
+assertSameFrames(collect(itertools.islice(AsteroidStream(dg, processes=2), 3*framesPerAsteroid)), serial[:3*framesPerAsteroid]) # infinite stream
+
+print('Seeding...')
+reseeded = collect(AsteroidStream(dg, numAsteroids=1, randomSeed=7, processes=0))
+assert not np.array_equal(reseeded[0][0], serial[0][0])
+
+print('All tests passed')
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import icq, sculptor
+
+radius = 10.
+
+ish = icq.ICQShape()
+ish.readICQ('./shapes/cube1.icq')
+scu = sculptor.Sculptor(ish)
+for _ in range(6):
+	scu.upscaleShape()
+scu.rollIntoABall(radius=radius)
+q = ish.q
+
+def fresh(shape):
+	'''A copy of the shape without any cached quantities'''
+	copy = icq.ICQShape()
+	copy.setVertexArray(shape.getVertexArray())
+	return copy
+
+def checkAgainstFresh(shape):
+	reference = fresh(shape)
+	assert shape.getMinAngularFeatureSize() == reference.getMinAngularFeatureSize()
+	assert np.allclose(shape.getVertexNormals(), reference.getVertexNormals(), rtol=0., atol=1e-12)
+	bvh = shape.getBoundingVolumeHierarchy()
+	corners = shape.getVertices()[shape.getTriangleIndexArray()][bvh.triangleIDs]
+	leafNodes = 2**bvh.depth - 1 + np.searchsorted(bvh.leafEnds, np.arange(len(corners)), side='right')
+	assert np.all(bvh.nodeMin[leafNodes] <= corners.min(axis=1)) and np.all(corners.max(axis=1) <= bvh.nodeMax[leafNodes])
+	assert np.all(bvh.nodeMin[0] <= bvh.nodeMin) and np.all(bvh.nodeMax <= bvh.nodeMax[0])
+	np.random.seed(0)
+	origins = np.random.randn(2000, 3)
+	origins *= 3.*radius/np.linalg.norm(origins, axis=-1, keepdims=True)
+	directions = -origins + 0.3*radius*np.random.randn(2000, 3)
+	ranges, _, facetIDs = shape.castRays(origins, directions)
+	referenceRanges, _, referenceFacetIDs = reference.castRays(origins, directions)
+	assert np.all(facetIDs == referenceFacetIDs)
+	assert np.allclose(ranges, referenceRanges, rtol=1e-12)
+	assert np.allclose(bvh.triangleNormals, reference.getBoundingVolumeHierarchy().triangleNormals, atol=1e-12)
+
+print('Caching derived quantities...')
+checkAgainstFresh(ish)
+bvh = ish.getBoundingVolumeHierarchy()
+assert set(ish.dirtyTiles) == {'featureSizes', 'normals', 'bvh'}
+
+print('Single vertex edits...')
+spike = ish.vertices[2, 10, 48]*1.5
+ish.setVertex(2, 10, 48, spike)
+assert ish.getMinAngularFeatureSize() is not None
+assert np.count_nonzero(ish.dirtyTiles['normals']) == 2 # vertex 48 is a corner of cells 47 and 48, which are in different tiles
+checkAgainstFresh(ish)
+assert ish.getBoundingVolumeHierarchy() is bvh # refitted, not rebuilt
+assert not any(mask.any() for mask in ish.dirtyTiles.values())
+
+print('Region edits...')
+patch = ish.vertices[4, 20:30, 5:12]*0.8
+ish.setVertexRegion(4, (20, 5), patch)
+assert np.all(ish.vertices[4, 20:30, 5:12] == patch)
+ish.setVertex(0, 1, 1, ish.vertices[0, 1, 1]*1.2)
+checkAgainstFresh(ish)
+assert ish.getBoundingVolumeHierarchy() is bvh
+
+print('Edits between queries...')
+for step in range(5):
+	ish.setVertex(1, 30+step, 30, ish.vertices[1, 30+step, 30]*1.1)
+	ish.getVertexNormals()
+checkAgainstFresh(ish)
+
+print('Fallbacks...')
+try:
+	ish.setVertexRegion(3, (0, 5), ish.vertices[3, 0:2, 5:7])
+	assert False, 'edge vertices must not be modifiable'
+except NotImplementedError:
+	pass
+ish.invalidateRegion(3, (0, 5), (2, 7)) # regions on the edges of faces drop all caches
+assert ish.dirtyTiles == {} and ish.bvh is None
+checkAgainstFresh(ish)
+bvh = ish.getBoundingVolumeHierarchy()
+for face in (4, 5): # two whole faces are more than a quarter of the tiles
+	ish.setVertexRegion(face, (1, 1), ish.vertices[face, 1:q, 1:q]*1.05)
+checkAgainstFresh(ish)
+assert ish.getBoundingVolumeHierarchy() is not bvh
+ish.setVertexArray(ish.getVertexArray())
+assert ish.dirtyTiles == {}
+
+print('All tests passed')
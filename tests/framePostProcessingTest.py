@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+import os
+import zlib
+import struct
+import tempfile
+import numpy as np
+
+from framePostProcessing import FramePostProcessor, writePNG, areaResamplingMatrix
+
+def readPNG(fileName):
+	'''Decodes the PNGs of writePNG(): a single IDAT chunk and filter type 0 on all rows'''
+	with open(fileName, 'rb') as pngFile:
+		data = pngFile.read()
+	width, height, bitDepth, colorType = struct.unpack('>IIBB', data[16:26])
+	idatLength = struct.unpack('>I', data[33:37])[0]
+	raw = np.frombuffer(zlib.decompress(data[41:41+idatLength]), dtype=np.uint8).reshape(height, -1)
+	assert np.all(raw[:,0] == 0)
+	pixels = raw[:,1:].copy().view('>u2' if bitDepth == 16 else np.uint8)
+	return pixels.reshape(height, width, -1).squeeze(axis=2) if colorType == 0 else pixels.reshape(height, width, 3)
+
+# a grey disc on a black background, as rendered by POV-Ray
+height, width = 120, 160
+rows, columns = np.mgrid[0:height, 0:width]
+disc = (columns - 100.5)**2 + (rows - 40.5)**2 < 20.**2
+frame = np.zeros((height, width, 3), dtype=np.uint8)
+frame[disc] = 128
+
+print('Resampling matrices...')
+weights = areaResamplingMatrix(10, 4)
+assert np.allclose(weights.sum(axis=1), 1.) and np.allclose(weights.sum(axis=0), 0.4)
+
+print('Channel reduction and downsampling...')
+processed, cropBox = FramePostProcessor(channels='gray', downsample=4).process(frame)
+assert processed.shape == (height//4, width//4) and processed.dtype == np.uint8 and cropBox == (0, 0, width, height)
+assert np.isclose(processed.astype(float).sum()*16, frame[:,:,0].astype(float).sum(), rtol=1e-2)
+processed, _ = FramePostProcessor(channels='rgb', bitDepth=16).process(frame)
+assert processed.shape == frame.shape and processed.dtype == np.uint16 and np.all(processed[disc] == 128*257)
+
+print('Cropping...')
+processed, cropBox = FramePostProcessor(crop='margin', cropMargin=(10, 20, 30, 40)).process(frame)
+assert cropBox == (30, 10, width-40, height-20) and processed.shape == (height-30, width-70)
+processed, cropBox = FramePostProcessor(crop='bbox', cropMargin=2).process(frame)
+assert cropBox == (79, 19, 123, 63) and processed.shape == (44, 44)
+processed, cropBox = FramePostProcessor(crop='bbox', cropMargin=30, outputSize=(32, 16)).process(frame)
+assert processed.shape == (16, 32) and (cropBox[2]-cropBox[0]) == 2*(cropBox[3]-cropBox[1]) and cropBox[1] < 0 # padded above the image
+_, cropBox = FramePostProcessor(crop='bbox').process(np.zeros_like(frame))
+assert cropBox == (0, 0, width, height)
+
+print('Transforming labels...')
+postProcessor = FramePostProcessor(crop='bbox', cropMargin=4, outputSize=(24, 24))
+processed, cropBox = postProcessor.process(frame)
+labels = { 'keypoints': np.array([[[100.5, 40.5], [81., 40.5], [0., 0.]]], dtype=np.float32),
+           'visible': np.array([[True, True, True]]),
+           'boundingBoxes': np.array([[80., 20., 121., 61.]]),
+           'masks': disc[np.newaxis] }
+transformed = postProcessor.transformLabels(labels, [cropBox])
+assert np.allclose(transformed['keypoints'][0,0], [12., 12.], atol=0.5) and transformed['keypoints'].dtype == np.float32
+assert np.array_equal(transformed['visible'], [[True, True, False]])
+assert cropBox == (77, 17, 125, 65) and np.allclose(transformed['boundingBoxes'], [[ 1.5, 1.5, 22., 22. ]])
+assert transformed['masks'].shape == (1, 24, 24) and np.array_equal(transformed['masks'][0], processed >= 64)
+assert np.array_equal(transformed['cropBoxes'], [cropBox])
+
+print('Writing PNGs...')
+with tempfile.TemporaryDirectory() as tmpdir:
+	for image in (processed, frame, FramePostProcessor(bitDepth=16).process(frame)[0]):
+		writePNG(os.path.join(tmpdir, 'frame.png'), image)
+		decoded = readPNG(os.path.join(tmpdir, 'frame.png'))
+		assert decoded.shape == image.shape and np.array_equal(decoded, image)
+	assert os.path.getsize(os.path.join(tmpdir, 'frame.png')) < frame.nbytes/10
+
+print('All tests passed')
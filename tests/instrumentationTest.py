@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import numpy as np
+
+import instrumentation
+from arendConesAsteroidGenerator import ArendConesAsteroidGenerator
+
+print('Disabled instrumentation...')
+assert not instrumentation.isEnabled()
+with instrumentation.stage('test.disabled', value=1) as st:
+	st.set(shape=None)
+assert not st
+instrumentation.count('asteroids')
+assert instrumentation.adjustQueue('render', 1) is None
+
+print('Stage records of the Arend cones generator...')
+outfile = io.StringIO()
+instrumentation.enable(outfile, summaryInterval=1e9, printSummary=False)
+np.random.seed(42)
+astGen = ArendConesAsteroidGenerator(baseResolution=3, numCones=10)
+astSh, _ = astGen.sampleAnAsteroid()
+instrumentation.count('asteroids')
+instrumentation.count('frames', 8)
+assert instrumentation.adjustQueue('render', 8) == 8
+assert instrumentation.adjustQueue('render', -1) == 7
+try:
+	with instrumentation.stage('test.failing'):
+		raise KeyError('expected')
+except KeyError:
+	pass
+instrumentation.disable()
+assert not instrumentation.isEnabled()
+
+records = [ json.loads(line) for line in outfile.getvalue().splitlines() ]
+stages = [ rec for rec in records if rec['type'] == 'stage' ]
+names = [ rec['stage'] for rec in stages ]
+assert names == ['sculptor.upscale']*3 + ['arendCones.baseShape', 'arendCones.sampleCones', 'sculptor.arendCones', 'test.failing'], names
+assert [ rec['vertices'] for rec in stages[:3] ] == [ 6*(q+1)**2 for q in (2, 4, 8) ]
+assert stages[3]['vertices'] == stages[5]['vertices'] == len(astSh.getVertices())
+assert stages[5]['cones'] == 10
+assert stages[-1]['error'] == 'KeyError'
+for rec in stages:
+	assert rec['wall'] >= 0. and rec['cpu'] >= 0. and rec['start'] >= 0.
+# nested stages lie within the enclosing one
+assert stages[3]['start'] <= stages[0]['start'] and stages[2]['start'] + stages[2]['wall'] <= stages[3]['start'] + stages[3]['wall']
+
+summary = records[-1]
+assert summary['type'] == 'summary'
+assert summary['counts'] == { 'asteroids': 1, 'frames': 8 }
+assert summary['queues'] == { 'render': 7 }
+assert summary['overallRates']['frames'] == 8*summary['overallRates']['asteroids']
+
+print('All tests passed')
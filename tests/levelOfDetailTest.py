@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import icq, sculptor
+
+ish = icq.ICQShape()
+ish.readICQ('./shapes/cube1.icq')
+scu = sculptor.Sculptor(ish)
+for _ in range(6):
+	scu.upscaleShape()
+np.random.seed(0)
+scu.shapeWithArendCones(*np.random.random((4, 40)), baseRadius=10., coneType='linearWithFillet')
+assert ish.validate()
+
+print('Building the pyramid...')
+assert ish.getLevelOfDetail(0) is ish
+levels = [ ish ]
+while (lod := ish.getLevelOfDetail(len(levels))) is not None:
+	levels.append(lod)
+assert [ lod.q for lod in levels ] == [64, 32, 16, 8, 4, 2]
+assert ish.getLevelOfDetail(1) is levels[1] # cached
+for lod in levels:
+	assert lod.validate(exceptionIfInvalid=False) # shared face edges stay consistent after filtering
+	assert lod.getMaxRedundantVertexDeviation() == 0.
+for finer, coarser in zip(levels, levels[1:]):
+	radii = np.linalg.norm(finer.vertices.astype(np.float64), axis=-1)
+	coarseRadii = np.linalg.norm(coarser.vertices.astype(np.float64), axis=-1)
+	assert radii.min() - 1e-5 <= coarseRadii.min() and coarseRadii.max() <= radii.max() + 1e-5 # the filter averages radii
+	directions = finer.vertices[:, ::2, ::2]/radii[:, ::2, ::2, np.newaxis]
+	assert np.allclose(coarser.vertices/coarseRadii[..., np.newaxis], directions, atol=1e-5) # and keeps directions
+
+print('Choosing levels for camera distances...')
+width = 600
+maxRadius = float(np.max(np.linalg.norm(ish.vertices.astype(np.float64), axis=-1)))
+chosenLevels = set()
+for cameraDistance in [12., 100., 1e3, 3e3, 1e4, 3e4, 1e5]:
+	for maxEdgePixels in [0.5, 1., 4.]:
+		chosen = ish.getLevelOfDetailFor(cameraDistance, width, maxEdgePixels=maxEdgePixels)
+		level = levels.index(chosen)
+		chosenLevels.add(level)
+		pixelsPerUnitLength = ish.getPixelsPerUnitLength(cameraDistance-maxRadius, width)
+		if level > 0:
+			assert chosen.getMaxEdgeLength()*pixelsPerUnitLength <= maxEdgePixels
+		if level+1 < len(levels):
+			assert levels[level+1].getMaxEdgeLength()*pixelsPerUnitLength > maxEdgePixels
+assert {0, 1, len(levels)-1} <= chosenLevels and len(chosenLevels) >= 4, chosenLevels
+assert ish.getLevelOfDetailFor(5., width) is ish # camera inside the bounding sphere
+
+print('Rendering with levels of detail...')
+# the scene is not built and rendered, only the shape that would be rendered is recorded
+originalGetScene, originalGetSceneSpherical, originalRenderScene = icq.ICQShape.getScene, icq.ICQShape.getSceneSpherical, icq.ICQShape.renderScene
+icq.ICQShape.getScene = icq.ICQShape.getSceneSpherical = lambda self, **kwargs: self
+icq.ICQShape.renderScene = lambda self, scene, *args: scene
+try:
+	assert ish.renderSceneSpherical(None, cameraR=1e4, width=width, maxEdgePixels=None) is ish
+	assert ish.renderSceneSpherical(None, cameraR=1e4, width=width) is ish.getLevelOfDetailFor(1e4, width)
+	assert ish.renderSceneSpherical(None, cameraR=1e4, width=width) is not ish
+	assert ish.renderSceneCartesian(None, cameraLocation=(1e4, 0., 0.), width=width, maxEdgePixels=None) is ish
+	assert ish.renderSceneCartesian(None, cameraLocation=(1e4, 0., 0.), width=width) is ish.getLevelOfDetailFor(1e4, width)
+finally:
+	icq.ICQShape.getScene, icq.ICQShape.getSceneSpherical, icq.ICQShape.renderScene = originalGetScene, originalGetSceneSpherical, originalRenderScene
+
+print('Invalidation...')
+ish.setVertex(1, 5, 5, ish.vertices[1, 5, 5]*1.1)
+assert ish.getLevelOfDetail(1) is not levels[1]
+assert not np.array_equal(ish.getLevelOfDetail(1).vertices, levels[1].vertices)
+assert ish.getLevelOfDetail(1).validate()
+reread = icq.ICQShape()
+reread.readICQ('./shapes/cube4.icq')
+assert reread.getLevelOfDetail(1).q == 2
+reread.readICQ('./shapes/cube1.icq')
+assert reread.getLevelOfDetail(1) is None # the pyramid of the previous file is dropped
+
+print('All tests passed')
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import icq, sculptor, spatialState
+from lightcurves import computeLightcurve
+
+ish = icq.ICQShape()
+ish.readICQ('./shapes/cube1.icq')
+scu = sculptor.Sculptor(ish)
+for _ in range(5):
+	scu.upscaleShape()
+scu.rollIntoABall(radius=1.)
+
+print('Comparing with the analytic lightcurves of a sphere...')
+approachAngles = np.array([0., 0.5, 1., 2.]) # equal to the phase angles with the default geometry
+states = spatialState.SpatialStatesIterator([ ((0.,0.,1.), angle) for angle in approachAngles ], numPhases=3)
+fluxes = computeLightcurve(ish, states).reshape(4, 3)
+assert np.allclose(fluxes, fluxes[:,:1], rtol=5e-3) # a sphere looks the same at all rotation phases
+lambertSphere = 2./3.*(np.sin(approachAngles) + (np.pi - approachAngles)*np.cos(approachAngles))
+assert np.allclose(fluxes[:,0], lambertSphere, rtol=1e-2)
+assert np.isclose(computeLightcurve(ish, states, scatteringLaw='lommelSeeliger')[0], np.pi/2., rtol=1e-2)
+assert np.allclose(computeLightcurve(ish, states, selfShadowing=True), fluxes.ravel(), rtol=1e-3) # only grazing rays near the terminator are blocked
+
+print('Self-shadowing of a non-convex shape...')
+np.random.seed(0)
+scu.shapeWithArendCones(np.pi*np.random.random(20), 2.*np.pi*np.random.random(20), 0.4+0.6*np.random.random(20), 0.6*np.random.random(20)-0.3, baseRadius=1.)
+states = spatialState.SpatialStatesIterator(spatialState.sampleConditions(2, approachAngleRange=[0.5, 1.5]), numPhases=4).toArray()
+fluxes = computeLightcurve(ish, states, scatteringLaw='lambertPhong')
+shadowedFluxes = computeLightcurve(ish, states, scatteringLaw='lambertPhong', selfShadowing=True)
+assert np.all(shadowedFluxes <= fluxes) and np.all(shadowedFluxes > 0.9*fluxes)
+assert np.allclose(computeLightcurve(ish, states, scatteringLaw='lambertPhong', blockSize=3), fluxes)
+
+print('All tests passed')
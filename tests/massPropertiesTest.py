@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import icq, sculptor
+
+ish = icq.ICQShape()
+ish.readICQ('./shapes/cube1.icq')
+side = 2.*np.abs(ish.getUniqueVertexArray()).max()
+
+print('Checking the cube...')
+mp = ish.getMassProperties(density=2.)
+assert np.isclose(mp['volume'], side**3)
+assert np.isclose(mp['area'], 6.*side**2)
+assert np.allclose(mp['centroid'], 0.)
+assert np.allclose(mp['inertia'], 2.*side**3*side**2/6.*np.eye(3))
+
+print('Checking a shifted ellipsoid...')
+scu = sculptor.Sculptor(ish)
+for _ in range(5):
+	scu.upscaleShape()
+scu.rollIntoAConcentricEllipsoid(3., 2., 1.)
+ish.setVertexArray(ish.getVertexArray() + [1., 2., 3.])
+mp = ish.getMassProperties()
+volume = 4./3.*np.pi*3.*2.*1.
+assert np.isclose(mp['volume'], volume, rtol=1e-2)
+assert np.allclose(mp['centroid'], [1., 2., 3.])
+assert np.allclose(mp['principalMoments'], volume/5.*np.array([2.**2+1., 3.**2+1., 3.**2+2.**2]), rtol=2e-2)
+assert np.allclose(np.abs(mp['principalAxes']), np.eye(3), atol=1e-6)
+
+print('All tests passed')
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import numpy as np
+
+import icq, sculptor, meshImport
+
+ish = icq.ICQShape()
+ish.readICQ('./shapes/cube1.icq')
+scu = sculptor.Sculptor(ish)
+for _ in range(4):
+	scu.upscaleShape()
+np.random.seed(0)
+scu.shapeWithArendCones(np.pi*np.random.random(20), 2.*np.pi*np.random.random(20), 0.4+0.6*np.random.random(20), 0.6*np.random.random(20)-0.3, baseRadius=15.)
+
+print('Round trip through mesh files...')
+with tempfile.TemporaryDirectory() as tmpdir:
+	for extension, writer in [ ('.obj', ish.writeOBJ), ('.ply', lambda fn: ish.writePLY(fn, dtype=np.float64)), ('.stl', ish.writeSTL) ]:
+		meshFileName = os.path.join(tmpdir, 'shape' + extension)
+		writer(meshFileName)
+		imported, report = meshImport.importMesh(meshFileName, ish.q)
+		assert imported.validate() and report['nonStarShaped'] == 0
+		assert np.allclose(imported.vertices, ish.vertices, atol=1e-5) # STL keeps float32 coordinates
+
+print('Resampling at another resolution...')
+imported, _ = meshImport.importMesh((ish.getUniqueVertexArray(), ish.getTriangleIndexArrayForUniqueVertices()), 24, dtype=np.float32)
+assert imported.q == 24 and imported.vertices.dtype == np.float32 and imported.validate()
+
+print('Detecting shapes that are not star-shaped...')
+ball = icq.ICQShape()
+ball.readICQ('./shapes/cube1.icq')
+ballSculptor = sculptor.Sculptor(ball)
+for _ in range(4):
+	ballSculptor.upscaleShape()
+ballSculptor.rollIntoABall(radius=5.)
+vertices, triangles = ball.getUniqueVertexArray(), ball.getTriangleIndexArrayForUniqueVertices()
+twoBalls = (np.concatenate([ vertices, 0.5*vertices + [12., 0., 0.] ]), np.concatenate([ triangles, triangles + len(vertices) ]))
+imported, report = meshImport.importMesh(twoBalls, 16)
+assert report['nonStarShaped'] > 0 and np.all(report['crossings'][report['crossings'] > 1] == 3)
+assert np.all(report['nonStarShapedDirections'][:,0] > 0.9)
+try:
+	meshImport.importMesh(twoBalls, 16, center=(0., 20., 0.))
+	assert False, 'a center outside of the mesh must be rejected'
+except ValueError:
+	pass
+
+print('All tests passed')
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import icq, sculptor
+
+radius = 10.
+
+ish = icq.ICQShape()
+ish.readICQ('./shapes/cube1.icq')
+scu = sculptor.Sculptor(ish)
+for _ in range(5):
+	scu.upscaleShape()
+scu.rollIntoABall(radius=radius)
+
+print('Checking the topology...')
+adjacency = ish.getAdjacencyMatrix()
+degrees = ish.getDegreeMatrix().diagonal()
+assert (adjacency != adjacency.T).nnz == 0
+assert np.count_nonzero(degrees != 6) == 8 # only the corners of the cube are irregular
+assert np.array_equal(ish.getCornerIncidenceMatrix().sum(axis=1).A1, degrees) # closed mesh: as many triangles as neighbours
+
+print('Checking the operators on a sphere...')
+assert np.allclose(ish.getCotangentLaplacian().sum(axis=1), 0.)
+assert np.isclose(ish.getVertexAreas().sum(), 4.*np.pi*radius**2, rtol=1e-2)
+normals = ish.getVertexNormals()
+assert np.allclose(np.einsum('ij,ij->i', normals, ish.getUniqueVertexArray()/radius), 1., atol=1e-3)
+# estimates are worse near the irregular vertices, so only the bulk of the distribution is checked
+assert np.all(np.abs(np.percentile(ish.getMeanCurvature(), [1, 50, 99])*radius - 1.) < 2e-2)
+assert np.all(np.abs(np.percentile(ish.getGaussianCurvature(), [1, 50, 99])*radius**2 - 1.) < 2e-2)
+
+print('Smoothing a perturbed shape...')
+np.random.seed(0)
+scu.shapeWithArendCones(np.pi*np.random.random(30), 2.*np.pi*np.random.random(30), 0.4+0.6*np.random.random(30), 0.6*np.random.random(30)-0.3, baseRadius=radius)
+roughness = np.abs(ish.getMeanCurvature()).max()
+for weights in ['uniform', 'cotangent']:
+	scu.smoothShape(iterations=3, weights=weights)
+	assert ish.validate()
+assert np.abs(ish.getMeanCurvature()).max() < roughness
+
+print('All tests passed')
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import icq, sculptor
+from polyhedronGravity import PolyhedronGravity
+
+ish = icq.ICQShape()
+ish.readICQ('./shapes/cube1.icq')
+scu = sculptor.Sculptor(ish)
+for _ in range(4):
+	scu.upscaleShape()
+scu.rollIntoABall(radius=1.)
+gravity = PolyhedronGravity(ish, density=1., G=1.)
+mass = ish.getMassProperties()['volume']
+
+print('Comparing with a point mass outside the body...')
+points = np.array([[3.,0.,0.], [0.,-2.,2.], [1.,1.,-4.]])
+distances = np.linalg.norm(points, axis=-1)
+potentials, accelerations, laplacians = gravity.evaluate(points)
+assert np.allclose(potentials, mass/distances, rtol=1e-4)
+assert np.allclose(accelerations, -mass*points/distances[:,np.newaxis]**3, rtol=1e-3, atol=1e-4)
+assert np.allclose(laplacians, 0., atol=1e-10)
+
+print('Checking the field inside the body...')
+inside = np.array([[0.,0.,0.], [0.,0.,0.5], [0.2,-0.3,0.1]])
+assert np.all(gravity.isInside(inside)) and not np.any(gravity.isInside(points))
+assert np.allclose(gravity.getAcceleration(inside), -4./3.*np.pi*inside, rtol=1e-2, atol=1e-2) # uniform ball: g = -4/3 pi G rho r
+
+print('Checking parallel evaluation and surface slopes...')
+queries = 4.*np.random.random((500, 3)) - 2.
+assert np.allclose(gravity.evaluate(queries, processes=2)[1], gravity.evaluate(queries)[1])
+assert np.degrees(gravity.getSurfaceSlopes().max()) < 5.
+
+print('All tests passed')
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import icq, sculptor, spatialState
+from abstractShape import scene_rotation_matrices
+
+radius = 10.
+
+ish = icq.ICQShape()
+ish.readICQ('./shapes/cube1.icq')
+scu = sculptor.Sculptor(ish)
+for _ in range(5):
+	scu.upscaleShape()
+scu.rollIntoABall(radius=radius)
+
+print('Range image of a sphere...')
+ranges, incidenceAngles, facetIDs = ish.getRangeImageSpherical(cameraR=50., cameraTheta=np.pi/2., cameraPhi=0.7, width=64, height=48)
+assert ranges.shape == incidenceAngles.shape == facetIDs.shape == (48, 64)
+assert np.allclose(ranges[23:25, 31:33], 50. - radius, rtol=1e-3)
+assert np.all(incidenceAngles[23:25, 31:33] < 0.1)
+assert np.array_equal(np.isfinite(ranges), facetIDs >= 0) and np.all(np.isinf(ranges[0]))
+
+print('Rotating the rays instead of the shape...')
+ish.setVertexArray(ish.getVertexArray()*[1., 0.5, 0.8])
+rotationAxis, rotationAngle = (0.3, 0.5, 0.8), 1.1
+ranges, _, facetIDs = ish.getRangeImage(cameraLocation=[40., 20., 10.], rotationAxis=rotationAxis, rotationAngle=rotationAngle, width=64, height=48)
+rotated = icq.ICQShape()
+rotated.setVertexArray(ish.getVertexArray() @ scene_rotation_matrices(rotationAxis, rotationAngle).T)
+rotatedRanges, _, rotatedFacetIDs = rotated.getRangeImage(cameraLocation=[40., 20., 10.], width=64, height=48)
+assert np.allclose(ranges[np.isfinite(ranges)], rotatedRanges[np.isfinite(ranges)]) and np.array_equal(facetIDs, rotatedFacetIDs)
+
+print('Altimeter track...')
+states = spatialState.SpatialStatesIterator(spatialState.sampleConditions(2), distances=[50., 100.], numPhases=4).toArray()
+ranges, _, facetIDs = ish.getAltimeterTrack(states['cameraLocation'], states['axis'], states['phase'])
+assert np.all(facetIDs >= 0) and np.all((ranges < states['distance'] - 0.4*radius) & (ranges > states['distance'] - radius))
+
+print('All tests passed')
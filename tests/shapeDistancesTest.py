@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import os
+import shlex
+import tempfile
+import numpy as np
+
+import icq, sculptor
+import shapeDistances
+from datasetContainer import DatasetContainer
+
+def makeShape(seed, q=16):
+	np.random.seed(seed)
+	ish = icq.ICQShape()
+	ish.readICQ('./shapes/cube1.icq')
+	scu = sculptor.Sculptor(ish)
+	while ish.q < q:
+		scu.upscaleShape()
+	scu.shapeWithArendCones(np.pi*np.random.random(10), 2.*np.pi*np.random.random(10), 0.4+0.6*np.random.random(10), 0.6*np.random.random(10)-0.3, baseRadius=15.)
+	return ish
+
+shapes = [ makeShape(seed) for seed in range(6) ]
+nearDuplicate = makeShape(3)
+nearDuplicate.setVertexArray(nearDuplicate.getVertexArray()*1.001)
+shapes.append(nearDuplicate)
+
+print('Checking pairwise metrics...')
+radii = shapeDistances.getRadii(np.stack([ ish.getVertexArray() for ish in shapes ]))
+rms = shapeDistances.pairwiseRMSRadialDifferences(radii)
+maxDeviations = shapeDistances.pairwiseMaxRadialDeviations(radii, maxBlockElements=1000)
+for a in range(len(shapes)):
+	for b in range(len(shapes)):
+		differences = radii[a] - radii[b]
+		assert np.isclose(rms[a,b], np.sqrt(np.mean(differences**2)), atol=1e-9)
+		assert np.isclose(maxDeviations[a,b], np.abs(differences).max())
+assert np.allclose(shapeDistances.shapeDistance(shapes[3], shapes[6]), (rms[3,6], maxDeviations[3,6]))
+
+print('Comparing shapes of different resolutions...')
+fine = makeShape(3, q=32)
+assert np.allclose(shapeDistances.shapeDistance(fine, shapes[3]), 0.)
+assert np.allclose(shapeDistances.shapeDistance(fine, shapes[4]), (rms[3,4], maxDeviations[3,4]))
+
+print('Checking the fingerprint bound...')
+threshold = 0.5*np.sort(rms[np.triu_indices(len(shapes), 1)])[1]
+fingerprints = shapeDistances.getFingerprints(radii, 16)
+radius = shapeDistances.getFingerprintRadius(1., 16)
+distances = np.linalg.norm(fingerprints[:,np.newaxis] - fingerprints[np.newaxis], axis=-1)
+assert np.all(distances <= radius*rms + 1e-9)
+
+print('Finding near-duplicates in ICQ files and in a container...')
+with tempfile.TemporaryDirectory() as tmpdir:
+	libDir = os.path.join(tmpdir, 'shape library') # names with whitespace are quoted in the report
+	os.mkdir(libDir)
+	container = DatasetContainer(os.path.join(libDir, 'dataset.pack'), mode='a')
+	for idx, ish in enumerate(shapes):
+		ish.writeICQ(os.path.join(libDir, f'shape{idx}.icq'))
+		container.append({ 'shape': ish.getVertexArray() })
+	rows = shapeDistances.dedupeReport(libDir, threshold, processes=1)
+	assert [ (os.path.basename(row['shapeA']), os.path.basename(row['shapeB'])) for row in rows ] == [ ('shape3.icq', 'shape6.icq') ]
+	assert np.isclose(rows[0]['rmsRadialDifference'], rms[3,6], atol=1e-5) # ICQ files keep six decimals
+	shapeDistances.saveReport(rows, os.path.join(tmpdir, 'report.ssv'))
+	lines = open(os.path.join(tmpdir, 'report.ssv')).read().splitlines()
+	assert len(lines) == 2 and shlex.split(lines[1])[:2] == [rows[0]['shapeA'], rows[0]['shapeB']]
+	assert len(shlex.split(lines[1])) == len(shapeDistances.reportColumns)
+	rows = shapeDistances.dedupeReport(os.path.join(libDir, 'dataset.pack'), threshold)
+	assert [ (row['shapeA'][-3:], row['shapeB'][-3:]) for row in rows ] == [ ('[3]', '[6]') ]
+	assert np.isclose(rows[0]['maxRadialDeviation'], maxDeviations[3,6])
+	shapeDistances.saveReport(rows, os.path.join(tmpdir, 'report.ssv'))
+	assert len(open(os.path.join(tmpdir, 'report.ssv')).readlines()) == 2
+
+print('All tests passed')
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import numpy as np
+
+import icq, sculptor
+import sphericalHarmonics as sh
+
+degree = 8
+np.random.seed(0)
+degrees, orders = sh.getDegreesAndOrders(degree)
+assert len(degrees) == sh.numCoefficients(degree) and sh.getDegree(len(degrees)) == degree
+coefficients = np.random.normal(size=len(degrees))/(1. + degrees)**2
+coefficients[0] = 15.*np.sqrt(4.*np.pi)
+
+print('Reconstructing and fitting shapes...')
+for q in (16, 32):
+	ish = sh.shapeFromCoefficients(coefficients, q)
+	assert ish.q == q and ish.validate()
+	assert np.allclose(sh.fitShape(ish, degree), coefficients, atol=1e-10)
+	vertices = ish.getUniqueVertexArray()
+	assert np.allclose(np.linalg.norm(vertices, axis=-1), sh.evaluateRadii(coefficients, vertices/np.linalg.norm(vertices, axis=-1, keepdims=True)))
+
+print('Matching the harmonics of Sculptor...')
+ish = icq.ICQShape()
+ish.readICQ('./shapes/cube1.icq')
+scu = sculptor.Sculptor(ish)
+for _ in range(5):
+	scu.upscaleShape()
+scu.rollIntoABall(radius=10.)
+fitted = sh.fitShape(ish, 4)
+assert np.isclose(fitted[0], 10.*np.sqrt(4.*np.pi)) and np.allclose(fitted[1:], 0., atol=1e-10)
+scu.applyArrayShaperFunction(lambda vs: vs*(1. + 2.*sculptor.real_sph_harm(1, 3, np.arctan2(vs[:,1], vs[:,0]), np.arccos(vs[:,2]/np.linalg.norm(vs, axis=1)))/10.)[:,np.newaxis])
+fitted = sh.fitShape(ish, 4)
+expected = np.zeros(sh.numCoefficients(4))
+expected[0], expected[(degrees[:25] == 3) & (orders[:25] == 1)] = 10.*np.sqrt(4.*np.pi), 2.
+assert np.allclose(fitted, expected, atol=1e-10)
+
+print('Fitting batches and shapes off the grid directions...')
+shapes = [ sh.shapeFromCoefficients(coefficients, 16), sh.shapeFromCoefficients(2.*coefficients, 16), sh.shapeFromCoefficients(coefficients, 32) ]
+smoothed = sh.shapeFromCoefficients(coefficients, 16)
+smoothed.smooth(iterations=2)
+shapes.append(smoothed)
+batch = sh.fitShapes(shapes, degree)
+assert np.allclose(batch[:3], [ coefficients, 2.*coefficients, coefficients ], atol=1e-10)
+vertices = smoothed.getUniqueVertexArray()
+directMatrix = sh.getSphericalHarmonicsMatrix(vertices/np.linalg.norm(vertices, axis=-1, keepdims=True), degree)
+assert np.allclose(directMatrix.T @ (directMatrix @ batch[3] - np.linalg.norm(vertices, axis=-1)), 0., atol=1e-8) # least squares optimality
+
+print('Saving and loading coefficients...')
+with tempfile.TemporaryDirectory() as tmpdir:
+	fileName = os.path.join(tmpdir, 'sh_coefficients.ssv')
+	sh.saveCoefficients(fileName, coefficients)
+	assert np.array_equal(sh.loadCoefficients(fileName), coefficients)
+	ish = sh.shapeFromCoefficients(coefficients, 64)
+	ish.writeICQ(os.path.join(tmpdir, 'shape.icq'))
+	assert os.path.getsize(fileName) * 100 < os.path.getsize(os.path.join(tmpdir, 'shape.icq'))
+
+print('All tests passed')
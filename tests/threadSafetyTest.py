@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import pickle
+import numpy as np
+from multiprocessing.dummy import Pool as ThreadPool
+
+import icq, sculptor
+
+ish = icq.ICQShape()
+ish.readICQ('./shapes/cube1.icq')
+scu = sculptor.Sculptor(ish)
+for _ in range(5):
+	scu.upscaleShape()
+np.random.seed(0)
+scu.shapeWithArendCones(*np.random.random((4, 30)), baseRadius=10., coneType='linearWithFillet')
+
+print('Scene mesh...')
+vertices, normales, triangles = ish.getSceneMesh()
+assert ish.getSceneMesh()[1] is normales # cached
+referenceNormales = np.zeros((len(vertices), 3))
+for v0, v1, v2 in triangles.tolist(): # the per-triangle loop getScene() used to run
+	triangleNormale = np.cross(vertices[v1]-vertices[v0], vertices[v2]-vertices[v0])
+	triangleNormale /= np.linalg.norm(triangleNormale)
+	weight = np.dot(vertices[v1]-vertices[v0], vertices[v2]-vertices[v0])/2
+	for v in (v0, v1, v2):
+		referenceNormales[v] += triangleNormale*weight
+referenceNormales /= np.linalg.norm(referenceNormales, axis=1, keepdims=True)
+assert np.allclose(normales, referenceNormales, rtol=0., atol=1e-12)
+ish.setVertex(1, 5, 5, ish.vertices[1, 5, 5]*1.1)
+assert ish.getSceneMesh()[1] is not normales # dropped after a change
+
+print('Concurrent reads...')
+ish.invalidateCaches()
+def derive(k):
+	return ish.getLevelOfDetail(1 + k%3), ish.getBoundingVolumeHierarchy(), ish.getVertexNormals(), ish.getSceneMesh(), ish.getMinAngularFeatureSize()
+with ThreadPool(8) as pool:
+	results = pool.map(derive, range(32))
+assert [ lod.q for lod in ish.lodPyramid ] == [32, 16, 8, 4]
+for k, (lod, bvh, normals, sceneMesh, featureSize) in enumerate(results):
+	assert lod is ish.lodPyramid[1 + k%3]
+	assert np.array_equal(normals, results[0][2])
+	assert featureSize == results[0][4]
+	assert all(np.array_equal(a, b) for a, b in zip(sceneMesh, results[0][3]))
+assert np.allclose(results[0][2], ish.getVertexNormals())
+
+print('Re-reading a file...')
+reread = icq.ICQShape()
+reread.readICQ('./shapes/cube4.icq')
+assert len(reread.getSceneMesh()[0]) == 6*4**2 + 2
+reread.readICQ('./shapes/cube1.icq')
+assert len(reread.getSceneMesh()[0]) == 8 # cached mesh of the previous file dropped
+
+print('Pickling...')
+copy = pickle.loads(pickle.dumps(ish))
+assert np.array_equal(copy.getVertexArray(), ish.getVertexArray())
+assert copy.cacheLock is not ish.cacheLock
+assert copy.getMinAngularFeatureSize() == ish.getMinAngularFeatureSize()
+
+print('All tests passed')